@@ -0,0 +1,98 @@
+"""
+Fused Self-Attention Benchmark
+==============================
+
+This example measures the inference latency of a randomly initialized BERT encoder with the
+standard and the fused multi-head self-attention, and checks that both compute the same
+sequence encodings. The default architecture is the one of BERT BASE.
+"""
+
+# coding: utf-8
+
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+# pylint:disable=redefined-outer-name,logging-format-interpolation
+
+import argparse
+import logging
+import time
+import numpy as np
+import mxnet as mx
+
+from gluonnlp.model.bert import BERTEncoder
+
+parser = argparse.ArgumentParser(description='Benchmark the fused self-attention of the '
+                                             'BERT encoder.')
+parser.add_argument('--units', type=int, default=768, help='Dimension of the encodings.')
+parser.add_argument('--hidden_size', type=int, default=3072,
+                    help='Dimension of the hidden state in position-wise feed-forward networks.')
+parser.add_argument('--num_layers', type=int, default=12, help='Number of layers.')
+parser.add_argument('--num_heads', type=int, default=12,
+                    help='Number of heads in multi-head attention.')
+parser.add_argument('--seq_lengths', type=int, nargs='+', default=[128, 512],
+                    help='Sequence lengths to benchmark.')
+parser.add_argument('--batch_size', type=int, default=8, help='Batch size.')
+parser.add_argument('--num_repeats', type=int, default=10,
+                    help='Number of timed forward passes per sequence length.')
+parser.add_argument('--gpu', type=int, default=None,
+                    help='id of the gpu to use. Set it to empty means to use cpu.')
+parser.add_argument('--seed', type=int, default=100, help='Random seed')
+args = parser.parse_args()
+logging.getLogger().setLevel(logging.INFO)
+logging.info(args)
+
+np.random.seed(args.seed)
+mx.random.seed(args.seed)
+ctx = mx.cpu() if args.gpu is None else mx.gpu(args.gpu)
+
+
+def get_encoder(attention_cell):
+    encoder = BERTEncoder(attention_cell=attention_cell, num_layers=args.num_layers,
+                          units=args.units, hidden_size=args.hidden_size,
+                          max_length=max(args.seq_lengths), num_heads=args.num_heads,
+                          dropout=0.0, prefix='encoder_')
+    encoder.initialize(ctx=ctx)
+    return encoder
+
+
+encoders = {name: get_encoder(name) for name in ['multi_head', 'fused_multi_head']}
+# Both encoders share the parameter names, so the fused encoder loads the standard parameters
+inputs = mx.nd.random.normal(shape=(1, 1, args.units), ctx=ctx)
+for encoder in encoders.values():
+    encoder(inputs, None, mx.nd.ones((1, ), ctx=ctx))
+params = encoders['multi_head'].collect_params()
+for name, param in encoders['fused_multi_head'].collect_params().items():
+    param.set_data(params[name].data(ctx))
+for encoder in encoders.values():
+    encoder.hybridize(static_alloc=True)
+
+for seq_length in args.seq_lengths:
+    inputs = mx.nd.random.normal(shape=(args.batch_size, seq_length, args.units), ctx=ctx)
+    valid_length = mx.nd.array(np.random.randint(seq_length // 2, seq_length + 1,
+                                                 size=args.batch_size), ctx=ctx)
+    outputs = {}
+    for name, encoder in encoders.items():
+        # Warm up to exclude the graph construction
+        outputs[name] = encoder(inputs, None, valid_length)[0].asnumpy()
+        start = time.time()
+        for _ in range(args.num_repeats):
+            encoder(inputs, None, valid_length)[0].wait_to_read()
+        latency = (time.time() - start) / args.num_repeats
+        logging.info('seq_length={}, attention_cell={}: {:.1f}ms per batch'
+                     .format(seq_length, name, latency * 1000))
+    logging.info('seq_length={}: max abs difference of the encodings {:.2e}'.format(
+        seq_length, np.abs(outputs['multi_head'] - outputs['fused_multi_head']).max()))
@@ -0,0 +1,111 @@
+"""
+Translation Serving Benchmark
+=============================
+
+This example sends a synthetic load to the streaming translation server and reports the
+latency and throughput. The model has the architecture of transformer_en_de_512 with random
+weights by default, so the benchmark does not need any dataset or pretrained parameters.
+"""
+
+# coding: utf-8
+
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+# pylint:disable=redefined-outer-name,logging-format-interpolation
+
+import argparse
+import asyncio
+import logging
+import numpy as np
+import mxnet as mx
+import gluonnlp as nlp
+
+from gluonnlp.model.translation import NMTModel
+from gluonnlp.model.transformer import get_transformer_encoder_decoder
+from serving import TranslationServer, generate_load
+from utils import logging_config
+
+parser = argparse.ArgumentParser(description='Benchmark the streaming translation server '
+                                             'with a randomly initialized Transformer.')
+parser.add_argument('--vocab_size', type=int, default=32000, help='Size of the vocabulary')
+parser.add_argument('--num_units', type=int, default=512, help='Dimension of the embedding '
+                                                               'vectors and states.')
+parser.add_argument('--hidden_size', type=int, default=2048,
+                    help='Dimension of the hidden state in position-wise feed-forward networks.')
+parser.add_argument('--num_layers', type=int, default=6,
+                    help='number of layers in the encoder and decoder')
+parser.add_argument('--num_heads', type=int, default=8,
+                    help='number of heads in multi-head attention')
+parser.add_argument('--num_requests', type=int, default=200, help='Number of requests')
+parser.add_argument('--rate', type=float, default=20,
+                    help='Average number of requests per second. The requests arrive as a '
+                         'Poisson process.')
+parser.add_argument('--min_src_length', type=int, default=5,
+                    help='Minimum length of the source sentences')
+parser.add_argument('--max_src_length', type=int, default=50,
+                    help='Maximum length of the source sentences')
+parser.add_argument('--beam_size', type=int, default=4, help='Beam size')
+parser.add_argument('--lp_alpha', type=float, default=0.6,
+                    help='Alpha used in calculating the length penalty')
+parser.add_argument('--lp_k', type=int, default=5, help='K used in calculating the length penalty')
+parser.add_argument('--max_length', type=int, default=50, help='Maximum decoding length')
+parser.add_argument('--max_batch_size', type=int, default=32,
+                    help='Maximum number of requests decoded at the same time')
+parser.add_argument('--num_buckets', type=int, default=10, help='Number of source buckets')
+parser.add_argument('--use_cache', action='store_true',
+                    help='Whether to use the key/value cache of the decoder')
+parser.add_argument('--gpu', type=int, default=None,
+                    help='id of the gpu to use. Set it to empty means to use cpu.')
+parser.add_argument('--seed', type=int, default=100, help='Random seed')
+args = parser.parse_args()
+logging_config(folder='.', name='benchmark_serving')
+logging.info(args)
+
+np.random.seed(args.seed)
+mx.random.seed(args.seed)
+ctx = mx.cpu() if args.gpu is None else mx.gpu(args.gpu)
+
+vocab = nlp.Vocab(nlp.data.Counter(['tok{}'.format(i) for i in range(args.vocab_size)]))
+encoder, decoder = get_transformer_encoder_decoder(units=args.num_units,
+                                                   hidden_size=args.hidden_size, dropout=0.0,
+                                                   num_layers=args.num_layers,
+                                                   num_heads=args.num_heads,
+                                                   max_src_length=530, max_tgt_length=549,
+                                                   scaled=True)
+model = NMTModel(src_vocab=vocab, tgt_vocab=vocab, encoder=encoder, decoder=decoder,
+                 share_embed=True, embed_size=args.num_units, tie_weights=True,
+                 embed_initializer=None, prefix='transformer_')
+model.initialize(mx.init.Xavier(magnitude=3.0), ctx=ctx)
+model.hybridize(static_alloc=True)
+
+server = TranslationServer(model, beam_size=args.beam_size,
+                           scorer=nlp.model.BeamSearchScorer(alpha=args.lp_alpha, K=args.lp_k),
+                           max_length=args.max_length, max_batch_size=args.max_batch_size,
+                           max_src_length=args.max_src_length, num_buckets=args.num_buckets,
+                           use_cache=args.use_cache, ctx=ctx)
+eos_id = vocab[vocab.eos_token]
+sentences = [np.random.randint(len(vocab.reserved_tokens) + 1, len(vocab),
+                               size=np.random.randint(args.min_src_length,
+                                                      args.max_src_length)).tolist() + [eos_id]
+             for _ in range(args.num_requests)]
+
+loop = asyncio.get_event_loop()
+server.start()
+loop.run_until_complete(generate_load(server, sentences, rate=args.rate, seed=args.seed))
+loop.run_until_complete(server.stop())
+for key, value in sorted(server.stats().items()):
+    logging.info('{}={}'.format(key, value))
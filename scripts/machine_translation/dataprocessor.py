@@ -210,7 +210,7 @@ def make_dataloader(data_train, data_val, data_test, args,
                                  btf.Stack())
     target_val_lengths = list(map(lambda x: x[-1], data_val_lengths))
     target_test_lengths = list(map(lambda x: x[-1], data_test_lengths))
-    if args.bucket_scheme == 'constant':
+    if args.bucket_scheme in ('constant', 'token'):
         bucket_scheme = nlp.data.ConstWidthBucket()
     elif args.bucket_scheme == 'linear':
         bucket_scheme = nlp.data.LinearWidthBucket()
@@ -218,14 +218,22 @@ def make_dataloader(data_train, data_val, data_test, args,
         bucket_scheme = nlp.data.ExpWidthBucket(bucket_len_step=1.2)
     else:
         raise NotImplementedError
-    train_batch_sampler = nlp.data.FixedBucketSampler(lengths=data_train_lengths,
-                                                      batch_size=args.batch_size,
-                                                      num_buckets=args.num_buckets,
-                                                      ratio=args.bucket_ratio,
-                                                      shuffle=True,
-                                                      use_average_length=use_average_length,
-                                                      num_shards=num_shards,
-                                                      bucket_scheme=bucket_scheme)
+    if args.bucket_scheme == 'token':
+        # The padded source and target batches of every device hold at most batch_size tokens.
+        train_batch_sampler = nlp.data.TokenBudgetSampler(lengths=data_train_lengths,
+                                                          max_tokens=(args.batch_size,
+                                                                      args.batch_size),
+                                                          shuffle=True,
+                                                          num_shards=num_shards)
+    else:
+        train_batch_sampler = nlp.data.FixedBucketSampler(lengths=data_train_lengths,
+                                                          batch_size=args.batch_size,
+                                                          num_buckets=args.num_buckets,
+                                                          ratio=args.bucket_ratio,
+                                                          shuffle=True,
+                                                          use_average_length=use_average_length,
+                                                          num_shards=num_shards,
+                                                          bucket_scheme=bucket_scheme)
     logging.info('Train Batch Sampler:\n%s', train_batch_sampler.stats())
     train_data_loader = nlp.data.ShardedDataLoader(data_train,
                                                    batch_sampler=train_batch_sampler,
@@ -0,0 +1,460 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Streaming translation server with continuous batching.
+
+This module uses asyncio and requires Python 3.
+"""
+
+__all__ = ['TranslationServer', 'generate_load']
+
+import asyncio
+import bisect
+import collections
+import concurrent.futures
+import time
+
+import numpy as np
+import mxnet as mx
+from mxnet.gluon import HybridBlock
+from gluonnlp._constants import LARGE_NEGATIVE_FLOAT
+from gluonnlp.data import ExpWidthBucket
+from gluonnlp.model import BeamSearchScorer
+from gluonnlp.model.sequence_sampler import _BeamSearchStepUpdate, _expand_to_beam_size, \
+    _choose_states
+
+
+_Request = collections.namedtuple('_Request', ['src_ids', 'future', 'arrival_time'])
+
+
+class _RowStepScorer(HybridBlock):
+    """Same score function as BeamSearchScorer, for batches whose samples are at different steps.
+
+    The step has shape (batch_size, 1) instead of (1,).
+    """
+    def __init__(self, scorer, prefix=None, params=None):
+        super(_RowStepScorer, self).__init__(prefix=prefix, params=params)
+        assert isinstance(scorer, BeamSearchScorer), \
+            'The server requires a BeamSearchScorer. Received scorer={}'.format(scorer)
+        self._alpha = scorer._alpha
+        self._K = scorer._K
+        self._from_logits = scorer._from_logits
+
+    def hybrid_forward(self, F, outputs, scores, step):  # pylint: disable=arguments-differ
+        if not self._from_logits:
+            outputs = outputs.log_softmax()
+        prev_lp = (self._K + step - 1) ** self._alpha / (self._K + 1) ** self._alpha
+        prev_lp = prev_lp * (step != 1) + (step == 1)
+        scores = F.broadcast_mul(scores, prev_lp)
+        lp = (self._K + step) ** self._alpha / (self._K + 1) ** self._alpha
+        candidate_scores = F.broadcast_add(outputs, F.expand_dims(scores, axis=-1))
+        return F.broadcast_div(candidate_scores, F.expand_dims(lp, axis=-1))
+
+
+def _pad_axis(data, length, axis=1):
+    """Pad data with zeros along axis to the given length."""
+    if data.shape[axis] == length:
+        return data
+    shape = list(data.shape)
+    shape[axis] = length - data.shape[axis]
+    return mx.nd.concat(data, mx.nd.zeros(shape, ctx=data.context, dtype=data.dtype), dim=axis)
+
+
+def _concat_states(states, other_states):
+    """Concatenate two nested decoder states along the batch axis."""
+    if isinstance(states, (list, tuple)):
+        return type(states)(_concat_states(ele, other_ele)
+                            for ele, other_ele in zip(states, other_states))
+    return mx.nd.concat(states, other_states, dim=0)
+
+
+class _Cohort(object):
+    """Beam search state of a batch of requests that are decoded together.
+
+    Each request has its own number of decoded steps, so requests that started at different
+    steps can share a cohort if their decoder states can be concatenated, which is the case for
+    the key/value cache of the Transformer decoder. Finished requests are removed from the
+    cohort after each step.
+    """
+    def __init__(self, requests, step_input, states, beam_size, max_length, ctx):
+        batch_size = len(requests)
+        self.requests = requests
+        self.states = _expand_to_beam_size(states, beam_size=beam_size, batch_size=batch_size)
+        self.step_input = _expand_to_beam_size(step_input, beam_size=beam_size,
+                                               batch_size=batch_size).astype(np.int32)
+        self.beam_alive_mask = mx.nd.ones(shape=(batch_size, beam_size), ctx=ctx,
+                                          dtype=np.int32)
+        self.valid_length = mx.nd.ones(shape=(batch_size, beam_size), ctx=ctx, dtype=np.int32)
+        self.scores = mx.nd.zeros(shape=(batch_size, beam_size), ctx=ctx)
+        if beam_size > 1:
+            self.scores[:, 1:beam_size] = LARGE_NEGATIVE_FLOAT
+        self.samples = mx.nd.full(shape=(batch_size, beam_size, max_length + 1), val=-1,
+                                  ctx=ctx, dtype=np.int32)
+        self.samples[:, :, max_length] = self.step_input.reshape((batch_size, beam_size))
+        self.steps = np.zeros((batch_size,), dtype=np.int32)
+        self.src_lengths = np.array([len(request.src_ids) for request in requests])
+
+    def __len__(self):
+        return len(self.requests)
+
+    def merge(self, other):
+        """Append the requests of another cohort to the batch.
+
+        The states must follow the layout of `TransformerDecoder.init_state_from_encoder` with
+        the cache, i.e., [mem_value, mem_masks, cache]. The memory of the shorter source
+        sentences is padded and masked.
+        """
+        mem_length = max(self.states[0].shape[1], other.states[0].shape[1])
+        for states in [self.states, other.states]:
+            states[0] = _pad_axis(states[0], mem_length)
+            states[1] = _pad_axis(states[1], mem_length)
+        self.states = _concat_states(self.states, other.states)
+        self.requests = self.requests + other.requests
+        for name in ['step_input', 'beam_alive_mask', 'valid_length', 'scores', 'samples']:
+            setattr(self, name, mx.nd.concat(getattr(self, name), getattr(other, name), dim=0))
+        self.steps = np.concatenate([self.steps, other.steps])
+        self.src_lengths = np.concatenate([self.src_lengths, other.src_lengths])
+
+    def trim_memory(self):
+        """Drop the padding of the memory that no remaining source sentence needs."""
+        mem_length = int(self.src_lengths.max())
+        if mem_length < self.states[0].shape[1]:
+            self.states[0] = self.states[0].slice_axis(axis=1, begin=0, end=mem_length)
+            self.states[1] = self.states[1].slice_axis(axis=1, begin=0, end=mem_length)
+
+
+class TranslationServer(object):
+    """Translation server that batches the requests at the granularity of decoder steps.
+
+    Requests are grouped by their source length into buckets generated by the same bucket
+    schemes as :class:`gluonnlp.data.FixedBucketSampler`, so that the encoder only sees a few
+    padded shapes. Between two decoder steps, the server removes the requests whose beams have
+    all finished, resolves them, and admits waiting requests into the freed slots, instead of
+    waiting for the longest translation of the batch to finish. The beam search is the same as
+    the one of :class:`gluonnlp.model.BeamSearchSampler`.
+
+    With `use_cache`, the admitted requests are concatenated to the running batch, whose memory
+    is padded to the longest source sentence, so that every step runs the decoder once. Without
+    the cache, the decoder states of requests admitted at different steps have different shapes,
+    so each admission forms a cohort that is decoded by a separate decoder call at every step.
+
+    The model runs in a single worker thread so that the event loop keeps accepting requests
+    while the decoder is running.
+
+    Parameters
+    ----------
+    model : NMTModel
+        The neural machine translation model
+    beam_size : int
+        Size of the beam
+    scorer : BeamSearchScorer
+        Score function used in beamsearch
+    max_length : int
+        The maximum decoding length
+    max_batch_size : int
+        The maximum number of requests that are decoded at the same time.
+    max_src_length : int
+        The maximum length of the source sentences. Longer sentences are rejected.
+    num_buckets : int
+        Number of buckets of the source lengths.
+    bucket_scheme : BucketScheme
+        Scheme used to generate the bucket keys, see :class:`gluonnlp.data.FixedBucketSampler`.
+    use_cache : bool
+        Whether to pass `use_cache=True` to `init_state_from_encoder` of the decoder, i.e.,
+        to use the key/value cache of :class:`gluonnlp.model.transformer.TransformerDecoder`.
+        The admitted requests then join the running decoder batch.
+    ctx : Context
+        The context of the model.
+    """
+    def __init__(self, model, beam_size=4, scorer=BeamSearchScorer(), max_length=100,
+                 max_batch_size=32, max_src_length=100, num_buckets=10,
+                 bucket_scheme=ExpWidthBucket(bucket_len_step=1.2), use_cache=False,
+                 ctx=mx.cpu()):
+        assert max_batch_size > 0, \
+            'max_batch_size must be larger than 0. Received max_batch_size={}'\
+            .format(max_batch_size)
+        self._model = model
+        self._beam_size = beam_size
+        self._max_length = max_length
+        self._max_batch_size = max_batch_size
+        self._use_cache = use_cache
+        self._ctx = ctx
+        self._bos_id = model.tgt_vocab.token_to_idx[model.tgt_vocab.bos_token]
+        self._eos_id = model.tgt_vocab.token_to_idx[model.tgt_vocab.eos_token]
+        self._pad_id = model.src_vocab.token_to_idx[model.src_vocab.padding_token]
+        self._bucket_keys = sorted(set(bucket_scheme(max_src_length, 1, num_buckets)))
+        self._updater = _BeamSearchStepUpdate(beam_size=beam_size, eos_id=self._eos_id,
+                                              scorer=_RowStepScorer(scorer), single_step=True,
+                                              state_info=None)
+        self._updater.hybridize()
+        self._vocab_size = mx.nd.array([len(model.tgt_vocab)], ctx=ctx, dtype=np.int32)
+        self._pending = [collections.deque() for _ in self._bucket_keys]
+        self._cohorts = []
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._wakeup = None
+        self._task = None
+        self._stopping = False
+        self._reset_stats()
+
+    @property
+    def bucket_keys(self):
+        """The padded source lengths fed to the encoder."""
+        return self._bucket_keys
+
+    def _reset_stats(self):
+        self._start_time = time.time()
+        self._num_finished = 0
+        self._num_tokens = 0
+        self._num_steps = 0
+        self._num_stepped_requests = 0
+        self._latencies = []
+
+    def stats(self):
+        """Return the latency and throughput counters since the server started.
+
+        Returns
+        -------
+        stats : dict
+            The number of finished requests and generated tokens, the number of decoder steps,
+            the average number of requests per decoder step, the throughput in requests and
+            tokens per second, and the mean, median and 99th percentile of the latency in
+            seconds.
+        """
+        elapsed = max(time.time() - self._start_time, 1E-12)
+        latencies = np.array(self._latencies) if self._latencies else np.zeros((1,))
+        return {'num_requests': self._num_finished,
+                'num_tokens': self._num_tokens,
+                'num_steps': self._num_steps,
+                'avg_batch_size': self._num_stepped_requests / max(self._num_steps, 1),
+                'requests_per_sec': self._num_finished / elapsed,
+                'tokens_per_sec': self._num_tokens / elapsed,
+                'latency_mean': float(latencies.mean()),
+                'latency_p50': float(np.percentile(latencies, 50)),
+                'latency_p99': float(np.percentile(latencies, 99))}
+
+    def start(self):
+        """Start serving in the running event loop."""
+        assert self._task is None, 'The server is already started.'
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._reset_stats()
+        self._task = asyncio.ensure_future(self._serve())
+
+    async def stop(self):
+        """Stop serving after all the submitted requests are translated."""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+
+    async def translate(self, src_ids):
+        """Translate a source sentence.
+
+        Parameters
+        ----------
+        src_ids : list of int
+            The token ids of the source sentence, as fed to the encoder.
+
+        Returns
+        -------
+        tgt_ids : list of int
+            The token ids of the best translation, without BOS and EOS.
+        score : float
+            The score of the translation given by the scorer.
+        """
+        assert self._task is not None and not self._stopping, 'The server is not running.'
+        bucket_id = bisect.bisect_left(self._bucket_keys, len(src_ids))
+        if len(src_ids) == 0 or bucket_id == len(self._bucket_keys):
+            raise ValueError('The length of the source sentence must be between 1 and '
+                             '{}. Received length={}'.format(self._bucket_keys[-1],
+                                                             len(src_ids)))
+        future = asyncio.get_event_loop().create_future()
+        self._pending[bucket_id].append(_Request(list(src_ids), future, time.time()))
+        self._wakeup.set()
+        return await future
+
+    async def _serve(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            new_batch = self._admit()
+            if not self._cohorts and new_batch is None:
+                if self._stopping:
+                    return
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            try:
+                finished = await loop.run_in_executor(self._executor, self._step, new_batch)
+            except Exception as err:  # pylint: disable=broad-except
+                self._fail_all(err, new_batch[1] if new_batch is not None else [])
+                continue
+            now = time.time()
+            for request, result in finished:
+                self._num_finished += 1
+                self._num_tokens += len(result[0])
+                self._latencies.append(now - request.arrival_time)
+                if not request.future.cancelled():
+                    request.future.set_result(result)
+
+    def _fail_all(self, err, new_requests):
+        requests = [request for cohort in self._cohorts for request in cohort.requests]
+        requests.extend(new_requests)
+        self._cohorts = []
+        for request in requests:
+            if not request.future.done():
+                request.future.set_exception(err)
+
+    def _admit(self):
+        """Take the waiting requests of one bucket that fit in the free slots of the batch.
+
+        The bucket with the earliest request is chosen to avoid starving the rare lengths.
+        """
+        num_free = self._max_batch_size - sum(len(cohort) for cohort in self._cohorts)
+        candidates = [(queue[0].arrival_time, bucket_id)
+                      for bucket_id, queue in enumerate(self._pending) if queue]
+        if num_free <= 0 or not candidates:
+            return None
+        bucket_id = min(candidates)[1]
+        queue = self._pending[bucket_id]
+        requests = [queue.popleft() for _ in range(min(num_free, len(queue)))]
+        return self._bucket_keys[bucket_id], requests
+
+    def _step(self, new_batch):
+        """Encode the admitted requests and run one decoder step for every cohort.
+
+        Runs in the worker thread. Returns the finished requests and their results.
+        """
+        if new_batch is not None:
+            cohort = self._encode(*new_batch)
+            if self._use_cache and self._cohorts:
+                self._cohorts[0].merge(cohort)
+            else:
+                self._cohorts.append(cohort)
+        finished = []
+        for cohort in self._cohorts:
+            self._decode_step(cohort)
+            finished.extend(self._remove_finished(cohort))
+        self._cohorts = [cohort for cohort in self._cohorts if len(cohort) > 0]
+        return finished
+
+    def _encode(self, src_length, requests):
+        src_seq = np.full((len(requests), src_length), self._pad_id, dtype=np.float32)
+        for i, request in enumerate(requests):
+            src_seq[i, :len(request.src_ids)] = request.src_ids
+        src_seq = mx.nd.array(src_seq, ctx=self._ctx)
+        src_valid_length = mx.nd.array([len(request.src_ids) for request in requests],
+                                       ctx=self._ctx)
+        encoder_outputs, _ = self._model.encode(src_seq, valid_length=src_valid_length)
+        if self._use_cache:
+            states = self._model.decoder.init_state_from_encoder(
+                encoder_outputs, src_valid_length, use_cache=True)
+        else:
+            states = self._model.decoder.init_state_from_encoder(encoder_outputs,
+                                                                 src_valid_length)
+        step_input = mx.nd.full(shape=(len(requests),), val=self._bos_id, ctx=self._ctx)
+        return _Cohort(requests, step_input, states, self._beam_size, self._max_length,
+                       self._ctx)
+
+    def _decode_step(self, cohort):
+        out, states, _ = self._model.decode_step(cohort.step_input, cohort.states)
+        cohort.steps += 1
+        step_nd = mx.nd.array(cohort.steps.reshape((-1, 1)), ctx=self._ctx)
+        batch_shift = mx.nd.arange(0, len(cohort) * self._beam_size, self._beam_size,
+                                   ctx=self._ctx, dtype=np.int32)
+        cohort.samples, cohort.valid_length, cohort.scores, chosen_word_ids, \
+            cohort.beam_alive_mask, cohort.states = \
+            self._updater(cohort.samples, cohort.valid_length, mx.nd.log_softmax(out),
+                          cohort.scores, step_nd, cohort.beam_alive_mask, states,
+                          self._vocab_size, batch_shift)
+        cohort.step_input = mx.nd.relu(chosen_word_ids).reshape((-1,))
+        self._num_steps += 1
+        self._num_stepped_requests += len(cohort)
+
+    def _remove_finished(self, cohort):
+        """Resolve the requests without alive beams and compact the batch of the cohort."""
+        beam_size = self._beam_size
+        alive = cohort.beam_alive_mask.asnumpy()
+        done = np.logical_or(alive.sum(axis=1) == 0, cohort.steps == self._max_length)
+        if not done.any():
+            return []
+        done_ids = np.nonzero(done)[0]
+        # The best beam comes first since the scores are sorted in descending order.
+        samples = cohort.samples[:, 0, :].asnumpy()
+        valid_length = cohort.valid_length[:, 0].asnumpy()
+        scores = cohort.scores[:, 0].asnumpy()
+        finished = []
+        for i in done_ids:
+            # The samples of a request after t steps are the last t + 1 columns. Skip BOS. The
+            # samples of the alive beams are cut at max_length without EOS.
+            begin = self._max_length - cohort.steps[i]
+            tgt_ids = samples[i, begin + 1:begin + valid_length[i]].tolist()
+            if tgt_ids and tgt_ids[-1] == self._eos_id:
+                tgt_ids = tgt_ids[:-1]
+            finished.append((cohort.requests[i], (tgt_ids, float(scores[i]))))
+        keep = np.nonzero(np.logical_not(done))[0]
+        cohort.requests = [cohort.requests[i] for i in keep]
+        if len(keep) > 0:
+            keep_ids = mx.nd.array(keep, ctx=self._ctx, dtype=np.int32)
+            keep_beam_ids = mx.nd.array((keep.reshape((-1, 1)) * beam_size
+                                         + np.arange(beam_size)).reshape((-1,)),
+                                        ctx=self._ctx, dtype=np.int32)
+            cohort.samples = cohort.samples.take(keep_ids)
+            cohort.scores = cohort.scores.take(keep_ids)
+            cohort.valid_length = cohort.valid_length.take(keep_ids)
+            cohort.beam_alive_mask = cohort.beam_alive_mask.take(keep_ids)
+            cohort.step_input = cohort.step_input.take(keep_beam_ids)
+            cohort.states = _choose_states(mx.nd, cohort.states, None, keep_beam_ids)
+            cohort.steps = cohort.steps[keep]
+            cohort.src_lengths = cohort.src_lengths[keep]
+            if self._use_cache:
+                cohort.trim_memory()
+        return finished
+
+
+async def generate_load(server, sentences, rate=None, seed=None):
+    """Send the sentences to the server and wait for all the translations.
+
+    Parameters
+    ----------
+    server : TranslationServer
+        A started server.
+    sentences : list of list of int
+        The token ids of the source sentences.
+    rate : float or None
+        The average number of requests per second. The requests arrive as a Poisson process.
+        If None, all the requests are sent at once.
+    seed : int or None
+        Seed of the arrival times.
+
+    Returns
+    -------
+    results : list of tuple
+        The results of :meth:`TranslationServer.translate` in the order of the sentences.
+    """
+    if rate is None:
+        arrival_times = np.zeros((len(sentences),))
+    else:
+        rng = np.random.RandomState(seed)
+        arrival_times = np.cumsum(rng.exponential(1.0 / rate, size=(len(sentences),)))
+
+    async def _request(src_ids, arrival_time):
+        await asyncio.sleep(arrival_time)
+        return await server.translate(src_ids)
+
+    return await asyncio.gather(*[_request(src_ids, arrival_time) for src_ids, arrival_time
+                                  in zip(sentences, arrival_times)])
@@ -89,7 +89,9 @@ parser.add_argument('--bucket_scheme', type=str, default='constant',
                     help='Strategy for generating bucket keys. It supports: '
                          '"constant": all the buckets have the same width; '
                          '"linear": the width of bucket increases linearly; '
-                         '"exp": the width of bucket increases exponentially')
+                         '"exp": the width of bucket increases exponentially; '
+                         '"token": the training batches are packed under a budget of '
+                         'batch_size padded tokens per gpu, see TokenBudgetSampler')
 parser.add_argument('--bucket_ratio', type=float, default=0.0, help='Ratio for increasing the '
                                                                     'throughput of the bucketing')
 parser.add_argument('--src_max_len', type=int, default=-1, help='Maximum length of the source '
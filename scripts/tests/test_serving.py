@@ -0,0 +1,97 @@
+# coding: utf-8
+
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""Test the streaming translation server."""
+import sys
+
+import mxnet as mx
+import numpy as np
+import pytest
+import gluonnlp as nlp
+from ..machine_translation.translation import BeamSearchTranslator
+
+
+def _get_model():
+    vocab = nlp.Vocab(nlp.data.count_tokens(list('abcdefghijklmnopqrstuvwxyz')))
+    encoder, decoder = nlp.model.transformer.get_transformer_encoder_decoder(
+        num_layers=2, num_heads=4, units=16, hidden_size=32, max_src_length=20,
+        max_tgt_length=20)
+    model = nlp.model.translation.NMTModel(src_vocab=vocab, tgt_vocab=vocab, encoder=encoder,
+                                           decoder=decoder, share_embed=True, embed_size=16,
+                                           tie_weights=True)
+    model.initialize(mx.init.Xavier(magnitude=3.0))
+    model.hybridize()
+    return model
+
+
+@pytest.mark.skipif(sys.version_info[0] < 3, reason='The server requires Python 3.')
+@pytest.mark.parametrize('max_batch_size', [1, 3, 16])
+@pytest.mark.parametrize('use_cache', [False, True])
+def test_translation_server(max_batch_size, use_cache):
+    import asyncio
+    from ..machine_translation.serving import TranslationServer, generate_load
+    mx.random.seed(1)
+    model = _get_model()
+    beam_size, max_length = 3, 10
+    scorer = nlp.model.BeamSearchScorer(alpha=1.0, K=5.0)
+    server = TranslationServer(model, beam_size=beam_size, scorer=scorer,
+                               max_length=max_length, max_batch_size=max_batch_size,
+                               max_src_length=15, num_buckets=3, use_cache=use_cache)
+    rng = np.random.RandomState(0)
+    sentences = [rng.randint(4, len(model.src_vocab), size=rng.randint(1, 16)).tolist()
+                 for _ in range(20)]
+
+    if use_cache:
+        # The admitted requests must join the running batch
+        step = server._step
+
+        def _step(new_batch):
+            finished = step(new_batch)
+            assert len(server._cohorts) <= 1
+            return finished
+        server._step = _step
+
+    loop = asyncio.get_event_loop()
+    server.start()
+    results = loop.run_until_complete(generate_load(server, sentences, rate=1000, seed=0))
+    loop.run_until_complete(server.stop())
+    stats = server.stats()
+    assert stats['num_requests'] == len(sentences)
+    assert stats['num_tokens'] == sum(len(tgt_ids) for tgt_ids, _ in results)
+    assert 0 < stats['avg_batch_size'] <= max_batch_size
+    assert stats['latency_p50'] <= stats['latency_p99']
+
+    # Continuous batching must not change the result of the beam search
+    translator = BeamSearchTranslator(model, beam_size=beam_size, scorer=scorer,
+                                      max_length=max_length)
+    eos_id = model.tgt_vocab[model.tgt_vocab.eos_token]
+    for src_ids, (tgt_ids, score) in zip(sentences, results):
+        samples, scores, valid_length = translator.translate(
+            mx.nd.array([src_ids]), mx.nd.array([len(src_ids)]))
+        expected = samples[0, 0, 1:valid_length[0, 0].asscalar()].asnumpy().tolist()
+        if expected[-1] == eos_id:
+            expected = expected[:-1]
+        assert tgt_ids == expected
+        assert abs(score - scores[0, 0].asscalar()) < 1E-4
+
+    server.start()
+    with pytest.raises(ValueError):
+        loop.run_until_complete(
+            server.translate(list(range(4, 4 + server.bucket_keys[-1] + 1))))
+    loop.run_until_complete(server.stop())
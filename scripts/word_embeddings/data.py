@@ -216,12 +216,8 @@ def transform_data_fasttext(data, vocab, idx_to_counts, cbow, ngram_buckets,
             'NGramHashes', ngrams=ngrams, num_subwords=ngram_buckets)
 
         # Store subword indices for all words in vocabulary
-        idx_to_subwordidxs = list(subword_function(vocab.idx_to_token))
-        subwordidxs = np.concatenate(idx_to_subwordidxs)
-        subwordidxsptr = np.cumsum([
-            len(subwordidxs) for subwordidxs in idx_to_subwordidxs])
-        subwordidxsptr = np.concatenate([
-            np.zeros(1, dtype=np.int64), subwordidxsptr])
+        subwordidxs, subwordidxsptr = subword_function.packed_indices(
+            vocab.idx_to_token)
         if cbow:
             subword_lookup = functools.partial(
                 cbow_lookup, subwordidxs=subwordidxs,
@@ -230,7 +226,7 @@ def transform_data_fasttext(data, vocab, idx_to_counts, cbow, ngram_buckets,
             subword_lookup = functools.partial(
                 skipgram_lookup, subwordidxs=subwordidxs,
                 subwordidxsptr=subwordidxsptr, offset=len(vocab))
-        max_subwordidxs_len = max(len(s) for s in idx_to_subwordidxs)
+        max_subwordidxs_len = np.diff(subwordidxsptr).max()
         if max_subwordidxs_len > 500:
             warnings.warn(
                 'The word with largest number of subwords '
@@ -22,7 +22,6 @@
 
 __all__ = ['CorpusBatchify', 'CorpusBPTTBatchify', 'StreamBPTTBatchify']
 
-import itertools
 import math
 
 import numpy as np
@@ -30,7 +29,8 @@ import mxnet as mx
 from mxnet.gluon.data import RandomSampler, SequentialSampler, SimpleDataset
 
 from ..utils import slice_sequence, _slice_pad_length
-from ..stream import DataStream
+from ..dataset import CompiledCorpusDataset
+from ..stream import DataStream, _supports_state_dict
 
 class CorpusBatchify(object):
     """Transform the dataset into N independent sequences, where N is the batch size.
@@ -64,10 +64,11 @@ class CorpusBatchify(object):
             don't align along the batches are discarded.
         """
         sample_len = len(data) // self._batch_size
-        return SimpleDataset(
-            mx.nd.array(
-                self._vocab[data[:sample_len * self._batch_size]]).reshape(
-                    self._batch_size, -1).T)
+        if isinstance(data, CompiledCorpusDataset):
+            coded = data.token_ids[:sample_len * self._batch_size]
+        else:
+            coded = self._vocab.to_index_array(list(data[:sample_len * self._batch_size]))
+        return SimpleDataset(mx.nd.array(coded).reshape(self._batch_size, -1).T)
 
 
 class CorpusBPTTBatchify(object):
@@ -123,7 +124,8 @@ class CorpusBPTTBatchify(object):
         Parameters
         ----------
         corpus : mxnet.gluon.data.Dataset
-            A flat dataset to be batchified.
+            A flat dataset to be batchified. The token ids of a CompiledCorpusDataset are used
+            without looking them up in the vocabulary.
 
         Returns
         -------
@@ -133,17 +135,23 @@ class CorpusBPTTBatchify(object):
             Each element of the Dataset is a tuple of data and label arrays for
             BPTT. They are of shape (seq_len, batch_size) respectively.
         """
+        if isinstance(corpus, CompiledCorpusDataset):
+            token_ids = corpus.token_ids
+        elif self._last_batch == 'keep':
+            token_ids = self._vocab.to_index_array(list(corpus))
+        else:
+            sample_len = len(corpus) // self._batch_size
+            token_ids = self._vocab.to_index_array(list(corpus[:sample_len * self._batch_size]))
         if self._last_batch == 'keep':
-            coded = self._vocab[list(corpus)]
-            sample_len = math.ceil(float(len(coded)) / self._batch_size)
+            sample_len = math.ceil(float(len(token_ids)) / self._batch_size)
             padding_size = _slice_pad_length(sample_len, self._seq_len + 1, 1) * \
-                self._batch_size + sample_len * self._batch_size - len(coded)
-            coded.extend([self._vocab[self._vocab.padding_token]] * int(padding_size))
-            assert len(coded) % self._batch_size == 0
-            assert not _slice_pad_length(len(coded) / self._batch_size, self._seq_len + 1, 1)
+                self._batch_size + sample_len * self._batch_size - len(token_ids)
+            coded = np.full(len(token_ids) + int(padding_size), self._padding_idx,
+                            dtype=np.float32)
+            coded[:len(token_ids)] = token_ids
         else:
-            sample_len = len(corpus) // self._batch_size
-            coded = self._vocab[corpus[:sample_len * self._batch_size]]
+            sample_len = len(token_ids) // self._batch_size
+            coded = token_ids[:sample_len * self._batch_size]
         data = mx.nd.array(coded).reshape((self._batch_size, -1)).T
         batches = slice_sequence(data, self._seq_len + 1, overlap=1)
 
@@ -210,6 +218,8 @@ class StreamBPTTBatchify(object):
 
         - keep: A batch with less samples than previous batches is returned.
         - discard: The last batch is discarded if it's smaller than `(seq_len, batch_size)`.
+    dtype : str or numpy.dtype, default 'float32'
+        The data type of the batches. Use 'int32' to emit the token ids as integers.
     """
 
     def __init__(self,
@@ -217,12 +227,14 @@ class StreamBPTTBatchify(object):
                  seq_len,
                  batch_size,
                  sampler='random',
-                 last_batch='keep'):
+                 last_batch='keep',
+                 dtype='float32'):
         self._vocab = vocab
         self._seq_len = seq_len
         self._batch_size = batch_size
         self._sampler = sampler
         self._last_batch = last_batch
+        self._dtype = dtype
         if not self._vocab.padding_token:
             raise ValueError('Padding token must be specified in vocab for BPTT.')
         self._padding_idx = vocab[vocab.padding_token]
@@ -250,7 +262,8 @@ class StreamBPTTBatchify(object):
         Parameters
         ----------
         corpus : nlp.data.DatasetStream
-            A stream of un-flattened CorpusDataset.
+            A stream of un-flattened CorpusDataset or CompiledCorpusDataset. The token ids of a
+            CompiledCorpusDataset are used without looking them up in the vocabulary.
 
         Returns
         -------
@@ -259,68 +272,156 @@ class StreamBPTTBatchify(object):
             from last batch connects with the current batch for each sample.
             Each element of the Dataset is a tuple of data and label arrays for
             BPTT. They are of shape (seq_len, batch_size) respectively.
+            The stream supports `state_dict` and `load_state_dict` to resume an
+            interrupted iteration.
         """
         return _StreamBPTTBatchify(
             corpus, self._vocab, self._seq_len, self._batch_size,
-            self._get_sampler(self._sampler), self._last_batch)
+            self._get_sampler(self._sampler), self._last_batch, self._dtype)
 
 
 class _StreamBPTTBatchify(DataStream):
     def __init__(self, corpus, vocab, seq_len, batch_size, sampler,
-                 last_batch):
+                 last_batch, dtype):
         self._corpus = corpus
         self._vocab = vocab
         self._seq_len = seq_len
         self._batch_size = batch_size
         self._sampler = sampler
         self._last_batch = last_batch
+        self._dtype = np.dtype(dtype)
         self._padding_idx = vocab[vocab.padding_token]
+        self._progress = None
+        self._resume_state = None
+
+    def state_dict(self):
+        """Return the state of the stream after the latest batch.
+
+        Returns
+        -------
+        state : dict
+            The state of the corpus stream before the dataset that is being read, the numpy
+            random state used to sample its sentences, the number of sentences that were read
+            from it and the tokens that were read but not batchified yet.
+        """
+        if self._progress is None:
+            return None
+        progress = self._progress
+        return {'corpus': progress['corpus'],
+                'num_datasets': progress['num_datasets'],
+                'random_state': progress['random_state'],
+                'sentence_idx': progress['sentence_idx'],
+                'buffers': [buf.tolist() for buf in progress['buffers']],
+                'has_next': progress['has_next'],
+                'has_token_buffered': progress['has_token_buffered']}
+
+    def load_state_dict(self, state):
+        """Restore a state returned by :meth:`state_dict`.
+
+        The next iteration continues after the batch that was latest when the state was saved,
+        without reading the consumed datasets of the corpus again if the corpus stream supports
+        `load_state_dict` as well. The next iteration starts a new epoch if state is None.
+
+        Parameters
+        ----------
+        state : dict or None
+            The state of a stream created with the same arguments.
+        """
+        if state is not None and not (state['has_next'] or state['has_token_buffered']):
+            # The iteration was completed
+            state = None
+        if state is not None and state['corpus'] is not None:
+            self._corpus.load_state_dict(state['corpus'])
+        self._resume_state = state
+
+    def _iter_sentences(self, progress, resume):
+        """Iterate over the sentences of the corpus and record the position in progress."""
+        corpus = iter(self._corpus)
+        if resume is not None and resume['sentence_idx'] is not None:
+            if resume['corpus'] is None:
+                # The corpus cannot be restored: skip the datasets that were already read
+                for _ in range(resume['num_datasets']):
+                    next(corpus)
+            dataset = next(corpus)
+            np.random.set_state(resume['random_state'])
+            sample_ids = list(self._sampler(len(dataset)))
+        else:
+            dataset = None
+        while True:
+            if dataset is None:
+                progress['corpus'] = self._corpus.state_dict() \
+                    if _supports_state_dict(self._corpus) else None
+                try:
+                    dataset = next(corpus)
+                except StopIteration:
+                    return
+                if progress['sentence_idx'] is not None:
+                    progress['num_datasets'] += 1
+                progress['random_state'] = np.random.get_state()
+                progress['sentence_idx'] = 0
+                sample_ids = list(self._sampler(len(dataset)))
+            while progress['sentence_idx'] < len(sample_ids):
+                sentence = dataset[sample_ids[progress['sentence_idx']]]
+                progress['sentence_idx'] += 1
+                yield sentence
+            dataset = None
 
     def __iter__(self):
-        def _init(data, target, value):
-            """Init the data and target with values."""
-            data[:] = value
-            target[:] = value
-
-        def _read(buffers, i, vocab, corpus):
-            """Read a sentence from the corpus into i-th buffer."""
-            if len(buffers[i]) <= 1:
-                buffers[i].extend(vocab[next(corpus)])
-
-        def _write(data, target, buffers, seq_len, i, length):
-            """Write a sentence from i-th buffer to data and target."""
-            num_tokens = len(buffers[i]) - 1
-            num_tokens = min(num_tokens, seq_len - length)
-            # fill in data and target
-            data[i, length:length+num_tokens] = buffers[i][:num_tokens]
-            target[i, length:length+num_tokens] = buffers[i][1:num_tokens+1]
-            # trim sentence in the buffer if too long. Used for the next batch
-            buffers[i] = buffers[i][num_tokens:]
-            return num_tokens
-
-        # stream states
-        buffers = [[] for _ in range(self._batch_size)]
-        has_next = True
-        has_token_buffered = False
-        data = np.empty([self._batch_size, self._seq_len], dtype=np.float32)
-        target = np.empty([self._batch_size, self._seq_len], dtype=np.float32)
-        corpus = itertools.chain.from_iterable(
-            (corpus_dataset[idx] for idx in self._sampler(len(corpus_dataset)))
-            for corpus_dataset in self._corpus)
+        resume = self._resume_state
+        self._resume_state = None
+        # stream states. Each buffer holds the token ids of the i-th row that were read but not
+        # batchified yet. It is trimmed with views, so only reading a sentence copies it.
+        if resume is None:
+            buffers = [np.empty((0,), dtype=np.int32) for _ in range(self._batch_size)]
+            has_next = True
+            has_token_buffered = False
+            progress = {'corpus': None, 'num_datasets': 0, 'random_state': None,
+                        'sentence_idx': None}
+        else:
+            buffers = [np.asarray(buf, dtype=np.int32) for buf in resume['buffers']]
+            has_next = resume['has_next']
+            has_token_buffered = resume['has_token_buffered']
+            progress = {'corpus': resume['corpus'], 'num_datasets': resume['num_datasets'],
+                        'random_state': resume['random_state'],
+                        'sentence_idx': resume['sentence_idx']}
+        progress.update(buffers=buffers, has_next=has_next,
+                        has_token_buffered=has_token_buffered)
+        self._progress = progress
+        # The batches are written in the (seq_len, batch_size) layout of the outputs
+        data = np.empty([self._seq_len, self._batch_size], dtype=self._dtype)
+        target = np.empty([self._seq_len, self._batch_size], dtype=self._dtype)
+        corpus = self._iter_sentences(progress, resume) if has_next else iter(())
 
         while has_next or has_token_buffered:
-            _init(data, target, self._padding_idx)
+            data.fill(self._padding_idx)
+            target.fill(self._padding_idx)
             has_token_buffered = False
             for i in range(self._batch_size):
-                length = 0
-                try:
-                    while length < self._seq_len:
-                        _read(buffers, i, self._vocab, corpus)
-                        num_tokens = _write(data, target, buffers, self._seq_len, i, length)
-                        if len(buffers[i]) > 0:
-                            has_token_buffered = True
-                        length += num_tokens
-                except StopIteration:
-                    has_next = False
+                buf = buffers[i]
+                # Whether the row is written, i.e. it has a token followed by another one
+                has_token_buffered |= len(buf) > 1
+                # Read sentences until the buffer can fill the row, with the target of the
+                # last token
+                sentences = []
+                num_tokens = len(buf)
+                while num_tokens <= self._seq_len and has_next:
+                    try:
+                        sentence = next(corpus)
+                    except StopIteration:
+                        has_next = False
+                        break
+                    if not isinstance(sentence, np.ndarray):
+                        sentence = self._vocab.to_index_array(sentence)
+                    sentences.append(sentence)
+                    num_tokens += len(sentence)
+                    has_token_buffered = True
+                if sentences:
+                    buf = np.concatenate([buf] + sentences)
+                num_tokens = max(min(len(buf) - 1, self._seq_len), 0)
+                data[:num_tokens, i] = buf[:num_tokens]
+                target[:num_tokens, i] = buf[1:num_tokens + 1]
+                buffers[i] = buf[num_tokens:]
+            progress.update(has_next=has_next, has_token_buffered=has_token_buffered)
             if has_token_buffered or self._last_batch == 'keep':
-                yield mx.nd.array(data).T, mx.nd.array(target).T
+                yield (mx.nd.array(data, dtype=self._dtype),
+                       mx.nd.array(target, dtype=self._dtype))
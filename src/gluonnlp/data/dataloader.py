@@ -20,24 +20,31 @@
 __all__ = ['ShardedDataLoader']
 
 import io
+import mmap
 import pickle
+import warnings
+import weakref
+import collections
 import multiprocessing
 from multiprocessing.pool import ThreadPool
-from mxnet import context
+import numpy as np
+from mxnet import context, nd
 from mxnet.gluon.data.dataloader import ForkingPickler, _as_in_context
 from mxnet.gluon.data.dataloader import default_mp_batchify_fn, default_batchify_fn
 from mxnet.gluon.data import sampler as _sampler
 
 _worker_dataset = None
-def _worker_initializer(dataset):
+_worker_slabs = None
+def _worker_initializer(dataset, slabs=None):
     """Initializer for processing pool."""
     # global dataset is per-process based and only available in worker processes
     # this is only necessary to handle MXIndexedRecordIO because otherwise dataset
     # can be passed as argument
-    global _worker_dataset
+    global _worker_dataset, _worker_slabs
     _worker_dataset = dataset
+    _worker_slabs = slabs
 
-def _worker_fn(samples, batchify_fn, dataset=None):
+def _worker_fn(samples, batchify_fn, dataset=None, slab_id=None):
     """Function for processing data in worker process."""
     # pylint: disable=unused-argument
     # it is required that each worker process has to fork a new MXIndexedRecordIO handle
@@ -47,10 +54,90 @@ def _worker_fn(samples, batchify_fn, dataset=None):
         batch = [batchify_fn([_worker_dataset[i] for i in shard]) for shard in samples]
     else:
         batch = batchify_fn([_worker_dataset[i] for i in samples])
+    if slab_id is not None:
+        descriptor = _worker_slabs.write(slab_id, batch)
+        if descriptor is not None:
+            return True, descriptor
     buf = io.BytesIO()
     ForkingPickler(buf, pickle.HIGHEST_PROTOCOL).dump(batch)
+    if slab_id is not None:
+        return False, buf.getvalue()
     return buf.getvalue()
 
+_ArrayDescriptor = collections.namedtuple('_ArrayDescriptor',
+                                          ['offset', 'shape', 'dtype', 'is_ndarray'])
+
+class _SharedMemorySlabs(object):
+    """Reusable shared memory buffers that the worker processes write the batches into.
+
+    The buffers are anonymous shared mappings, which are inherited by the worker processes
+    when they are forked. A worker writes the arrays of a batch into a free buffer and only
+    returns their offsets, shapes and dtypes. The main process reads the arrays as views of the
+    buffer, and the buffer becomes free again once all the arrays of the batch are released.
+    """
+    _ALIGNMENT = 64
+
+    def __init__(self, num_slabs, slab_size):
+        self._slabs = [mmap.mmap(-1, slab_size) for _ in range(num_slabs)]
+        self._free = collections.deque(range(num_slabs))
+        self._refs = {}
+
+    def acquire(self):
+        """Return the id of a free buffer, or None if all the buffers are in use."""
+        return self._free.popleft() if self._free else None
+
+    def release(self, slab_id):
+        self._refs.pop(slab_id, None)
+        self._free.append(slab_id)
+
+    def write(self, slab_id, batch):
+        """Write the arrays of the batch into the buffer. Returns None if they do not fit."""
+        buf = np.frombuffer(self._slabs[slab_id], dtype=np.uint8)
+        try:
+            return _write_arrays(buf, batch, [0])
+        except IndexError:
+            return None
+
+    def read(self, slab_id, descriptor):
+        """Return the batch described by descriptor, backed by the buffer without copying."""
+        buf = np.frombuffer(self._slabs[slab_id], dtype=np.uint8)
+        self._refs[slab_id] = weakref.ref(buf, lambda _: self.release(slab_id))
+        return _read_arrays(buf, descriptor)
+
+def _is_container(data):
+    return isinstance(data, (list, tuple)) and not hasattr(data, '_fields')
+
+def _write_arrays(buf, data, offset):
+    """Copy the arrays in data into buf from offset[0] and return their descriptors."""
+    if _is_container(data):
+        return type(data)(_write_arrays(buf, ele, offset) for ele in data)
+    is_ndarray = isinstance(data, nd.NDArray) and data.stype == 'default'
+    if not is_ndarray and not isinstance(data, np.ndarray):
+        return data
+    arr = data.asnumpy() if is_ndarray else data
+    alignment = _SharedMemorySlabs._ALIGNMENT
+    begin = (offset[0] + alignment - 1) // alignment * alignment
+    if begin + arr.nbytes > buf.size:
+        raise IndexError('The batch does not fit in the shared memory buffer.')
+    np.copyto(buf[begin:begin + arr.nbytes].view(arr.dtype).reshape(arr.shape), arr)
+    offset[0] = begin + arr.nbytes
+    return _ArrayDescriptor(begin, arr.shape, arr.dtype.str, is_ndarray)
+
+def _read_arrays(buf, data):
+    """Views of buf described by the descriptors in data."""
+    if isinstance(data, _ArrayDescriptor):
+        dtype = np.dtype(data.dtype)
+        nbytes = int(np.prod(data.shape)) * dtype.itemsize
+        arr = buf[data.offset:data.offset + nbytes].view(dtype).reshape(data.shape)
+        if not data.is_ndarray:
+            return arr
+        if hasattr(nd, 'from_numpy') and arr.size > 0:
+            return nd.from_numpy(arr, zero_copy=True)
+        return nd.array(arr, dtype=dtype)
+    if _is_container(data):
+        return type(data)(_read_arrays(buf, ele) for ele in data)
+    return data
+
 def _thread_worker_fn(samples, batchify_fn, dataset):
     """Threadpool worker function for processing data."""
     if isinstance(samples[0], (list, tuple)):
@@ -62,8 +149,9 @@ def _thread_worker_fn(samples, batchify_fn, dataset):
 class _MultiWorkerIter(object):
     """Internal multi-worker iterator for DataLoader."""
     def __init__(self, worker_pool, batchify_fn, batch_sampler, pin_memory=False,
-                 worker_fn=_worker_fn, prefetch=0, dataset=None):
+                 worker_fn=_worker_fn, prefetch=0, dataset=None, slabs=None):
         self._worker_pool = worker_pool
+        self._slabs = slabs
         self._batchify_fn = batchify_fn
         self._batch_sampler = batch_sampler
         self._data_buffer = {}
@@ -85,9 +173,15 @@ class _MultiWorkerIter(object):
         r = next(self._iter, None)
         if r is None:
             return
-        async_ret = self._worker_pool.apply_async(
-            self._worker_fn, (r, self._batchify_fn, self._dataset))
-        self._data_buffer[self._sent_idx] = async_ret
+        if self._slabs is not None:
+            slab_id = self._slabs.acquire()
+            async_ret = self._worker_pool.apply_async(
+                self._worker_fn, (r, self._batchify_fn, self._dataset, slab_id))
+        else:
+            slab_id = None
+            async_ret = self._worker_pool.apply_async(
+                self._worker_fn, (r, self._batchify_fn, self._dataset))
+        self._data_buffer[self._sent_idx] = (async_ret, slab_id)
         self._sent_idx += 1
 
     def __next__(self):
@@ -98,8 +192,20 @@ class _MultiWorkerIter(object):
 
         assert self._rcvd_idx < self._sent_idx, 'rcvd_idx must be smaller than sent_idx'
         assert self._rcvd_idx in self._data_buffer, 'fatal error with _push_next, rcvd_idx missing'
-        ret = self._data_buffer.pop(self._rcvd_idx)
-        batch = pickle.loads(ret.get()) if self._dataset is None else ret.get()
+        ret, slab_id = self._data_buffer.pop(self._rcvd_idx)
+        if slab_id is not None:
+            try:
+                in_slab, data = ret.get()
+            except Exception:
+                self._slabs.release(slab_id)
+                raise
+            if in_slab:
+                batch = self._slabs.read(slab_id, data)
+            else:
+                self._slabs.release(slab_id)
+                batch = pickle.loads(data)
+        else:
+            batch = pickle.loads(ret.get()) if self._dataset is None else ret.get()
         if self._pin_memory:
             batch = _as_in_context(batch, context.cpu_pinned())
         self._rcvd_idx += 1
@@ -169,11 +275,21 @@ class ShardedDataLoader(object):
         If ``True``, use threading pool instead of multiprocessing pool. Using threadpool
         can avoid shared memory usage. If `DataLoader` is more IO bounded or GIL is not a killing
         problem, threadpool version may achieve better performance than multiprocessing.
+    shared_mem_slab_size : int or None, default None
+        If set, the worker processes write the arrays of the batches into a pool of
+        `prefetch + 2` reusable shared memory buffers of `shared_mem_slab_size` bytes, instead of
+        pickling them. The batches are returned as views of the buffers without copying: NumPy
+        arrays stay NumPy arrays, and NDArrays are wrapped without copying if MXNet supports
+        `mx.nd.from_numpy`. The NDArrays are read-only. A buffer is reused once all the arrays of
+        its batch have been freed. Batches that do not fit in a buffer, or that are loaded while
+        all the buffers are in use, are pickled as usual. Requires the 'fork' start method of
+        multiprocessing and is ignored when `num_workers` is 0 or `thread_pool` is True.
 
     """
     def __init__(self, dataset, batch_size=None, shuffle=False, sampler=None,
                  last_batch=None, batch_sampler=None, batchify_fn=None,
-                 num_workers=0, pin_memory=False, prefetch=None, thread_pool=False):
+                 num_workers=0, pin_memory=False, prefetch=None, thread_pool=False,
+                 shared_mem_slab_size=None):
         self._dataset = dataset
         self._pin_memory = pin_memory
         self._thread_pool = thread_pool
@@ -200,13 +316,23 @@ class ShardedDataLoader(object):
         self._batch_sampler = batch_sampler
         self._num_workers = num_workers if num_workers >= 0 else 0
         self._worker_pool = None
+        self._slabs = None
         self._prefetch = max(0, int(prefetch) if prefetch is not None else 2 * self._num_workers)
         if self._num_workers > 0:
             if self._thread_pool:
                 self._worker_pool = ThreadPool(self._num_workers)
             else:
+                if shared_mem_slab_size:
+                    if hasattr(multiprocessing, 'get_start_method') and \
+                            multiprocessing.get_start_method() != 'fork':
+                        warnings.warn('shared_mem_slab_size is ignored because it requires the '
+                                      '"fork" start method of multiprocessing.')
+                    else:
+                        self._slabs = _SharedMemorySlabs(self._prefetch + 2,
+                                                         shared_mem_slab_size)
                 self._worker_pool = multiprocessing.Pool(
-                    self._num_workers, initializer=_worker_initializer, initargs=[self._dataset])
+                    self._num_workers, initializer=_worker_initializer,
+                    initargs=[self._dataset, self._slabs])
         if batchify_fn is None:
             if num_workers > 0:
                 self._batchify_fn = default_mp_batchify_fn
@@ -237,7 +363,8 @@ class ShardedDataLoader(object):
                                 pin_memory=self._pin_memory,
                                 worker_fn=_thread_worker_fn if self._thread_pool else _worker_fn,
                                 prefetch=self._prefetch,
-                                dataset=self._dataset if self._thread_pool else None)
+                                dataset=self._dataset if self._thread_pool else None,
+                                slabs=self._slabs)
 
     def __len__(self):
         return len(self._batch_sampler)
@@ -20,8 +20,10 @@
 # pylint: disable=undefined-all-variable
 """NLP Toolkit Dataset API. It allows easy and customizable loading of corpora and dataset files.
 Files can be loaded into formats that are immediately ready for training and evaluation."""
-__all__ = ['TextLineDataset', 'CorpusDataset', 'ConcatDataset', 'TSVDataset', 'NumpyDataset']
+__all__ = ['TextLineDataset', 'CorpusDataset', 'ConcatDataset', 'TSVDataset', 'NumpyDataset',
+           'CompiledCorpusDataset', 'compile_corpus']
 
+import array
 import io
 import os
 import bisect
@@ -255,3 +257,122 @@ class NumpyDataset(ArrayDataset):
     @property
     def keys(self):
         return self._keys
+
+
+_COMPILED_CORPUS_MAGIC = b'GNLPCORP'
+# Magic, number of sentences and number of tokens
+_COMPILED_CORPUS_HEADER_SIZE = len(_COMPILED_CORPUS_MAGIC) + 2 * 8
+_COMPILED_CORPUS_ID_DTYPE = np.dtype('<i4')
+_COMPILED_CORPUS_OFFSET_DTYPE = np.dtype('<i8')
+
+
+def compile_corpus(corpus, vocab, filename):
+    """Write the token ids of a tokenized corpus to a binary file which can be memory-mapped by
+    :class:`CompiledCorpusDataset`.
+
+    The file contains the token ids of all the sentences followed by the offset of each sentence.
+    The sentences are written as they are read, so the corpus can be a generator which does not
+    hold the whole corpus in memory.
+
+    Example::
+
+        corpus = nlp.data.CorpusDataset('train.txt', eos='<eos>')
+        nlp.data.compile_corpus(corpus, vocab, 'train.bin')
+        dataset = nlp.data.CompiledCorpusDataset('train.bin')
+
+    Parameters
+    ----------
+    corpus : iterable of list of str
+        The tokenized sentences, for example an un-flattened CorpusDataset.
+    vocab : gluonnlp.Vocab
+        The vocabulary used to map the tokens to ids. The same vocabulary must be used with the
+        compiled corpus.
+    filename : str
+        Path to the output file.
+
+    Returns
+    -------
+    int
+        The number of tokens written.
+    """
+    offsets = array.array('q', [0])
+    with io.open(os.path.expanduser(filename), 'wb') as fout:
+        fout.write(_COMPILED_CORPUS_MAGIC)
+        fout.write(np.zeros(2, dtype=_COMPILED_CORPUS_OFFSET_DTYPE).tobytes())
+        for sentence in corpus:
+            token_ids = np.asarray(vocab[list(sentence)], dtype=_COMPILED_CORPUS_ID_DTYPE)
+            fout.write(token_ids.tobytes())
+            offsets.append(offsets[-1] + len(token_ids))
+        fout.write(np.frombuffer(offsets, dtype=np.int64).astype(
+            _COMPILED_CORPUS_OFFSET_DTYPE).tobytes())
+        fout.seek(len(_COMPILED_CORPUS_MAGIC))
+        fout.write(np.array([len(offsets) - 1, offsets[-1]],
+                            dtype=_COMPILED_CORPUS_OFFSET_DTYPE).tobytes())
+    return offsets[-1]
+
+
+class CompiledCorpusDataset(Dataset):
+    """Dataset that memory-maps a corpus written by :func:`compile_corpus`.
+
+    The file is not read into memory: each sample is a numpy view of the token ids of a
+    sentence, backed by the page cache. :class:`~gluonnlp.data.batchify.CorpusBPTTBatchify` and
+    :class:`~gluonnlp.data.batchify.StreamBPTTBatchify` use the token ids directly, without
+    looking them up in the vocabulary.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the file written by :func:`compile_corpus`.
+    flatten : bool, default False
+        Whether to return all samples as flattened tokens. If True, each sample is a token id.
+    """
+    def __init__(self, filename, flatten=False):
+        self._filename = os.path.expanduser(filename)
+        self._flatten = flatten
+        self._open()
+
+    def _open(self):
+        with io.open(self._filename, 'rb') as fin:
+            header = fin.read(_COMPILED_CORPUS_HEADER_SIZE)
+        if not header.startswith(_COMPILED_CORPUS_MAGIC):
+            raise ValueError('%s is not a compiled corpus file.'%self._filename)
+        num_sentences, num_tokens = np.frombuffer(header[len(_COMPILED_CORPUS_MAGIC):],
+                                                  dtype=_COMPILED_CORPUS_OFFSET_DTYPE)
+        if num_tokens:
+            self._token_ids = np.memmap(self._filename, dtype=_COMPILED_CORPUS_ID_DTYPE,
+                                        mode='r', offset=_COMPILED_CORPUS_HEADER_SIZE,
+                                        shape=(int(num_tokens),))
+        else:
+            # mmap does not support empty mappings
+            self._token_ids = np.empty((0,), dtype=_COMPILED_CORPUS_ID_DTYPE)
+        self._offsets = np.memmap(self._filename, dtype=_COMPILED_CORPUS_OFFSET_DTYPE, mode='r',
+                                  offset=_COMPILED_CORPUS_HEADER_SIZE +
+                                  int(num_tokens) * _COMPILED_CORPUS_ID_DTYPE.itemsize,
+                                  shape=(int(num_sentences) + 1,))
+
+    def __getstate__(self):
+        # Memory-map the file again instead of pickling the token ids
+        return {'_filename': self._filename, '_flatten': self._flatten}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open()
+
+    @property
+    def token_ids(self):
+        """The token ids of all the sentences as a flat numpy array."""
+        return self._token_ids
+
+    def __getitem__(self, idx):
+        if self._flatten:
+            return self._token_ids[idx]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError('Index %d is out of range.'%idx)
+        return self._token_ids[self._offsets[idx]:self._offsets[idx + 1]]
+
+    def __len__(self):
+        if self._flatten:
+            return len(self._token_ids)
+        return len(self._offsets) - 1
@@ -20,7 +20,8 @@
 (e.g. in the order sorted by length). They can also be used to perform bucketing
 for speeding up the processing of variable-length sequences."""
 __all__ = ['ConstWidthBucket', 'LinearWidthBucket', 'ExpWidthBucket',
-           'SortedSampler', 'FixedBucketSampler', 'SortedBucketSampler', 'SplitSampler']
+           'SortedSampler', 'FixedBucketSampler', 'SortedBucketSampler', 'TokenBudgetSampler',
+           'DistributedFixedBucketSampler', 'SplitSampler']
 
 import math
 import warnings
@@ -384,15 +385,23 @@ class FixedBucketSampler(Sampler):
             self._sampler_size = int(math.ceil(len(self._batch_infos) / float(self._num_shards)))
         else:
             self._sampler_size = len(self._batch_infos)
+        self._position = 0
+        self._resume_position = None
 
     def __iter__(self):
-        if self._shuffle:
-            np.random.shuffle(self._batch_infos)
-            for bucket_id in range(len(self._bucket_keys)):
-                np.random.shuffle(self._bucket_sample_ids[bucket_id])
+        if self._resume_position is None:
+            start = 0
+            if self._shuffle:
+                np.random.shuffle(self._batch_infos)
+                for bucket_id in range(len(self._bucket_keys)):
+                    np.random.shuffle(self._bucket_sample_ids[bucket_id])
+        else:
+            start = self._resume_position
+            self._resume_position = None
+        self._position = start
 
         if self._num_shards > 0:
-            for batch_idx in range(0, len(self._batch_infos), self._num_shards):
+            for batch_idx in range(0, len(self._batch_infos), self._num_shards)[start:]:
                 if batch_idx + self._num_shards > len(self._batch_infos):
                     batch_idx = len(self._batch_infos) - self._num_shards
                 batch = self._batch_infos[batch_idx: batch_idx + self._num_shards]
@@ -403,19 +412,54 @@ class FixedBucketSampler(Sampler):
                               for bucket_id, batch_begin, batch_size in zip(bucket_ids,
                                                                             batch_begins,
                                                                             batch_sizes)]
+                self._position += 1
                 yield [self._bucket_sample_ids[bucket_id][batch_begin:batch_end]
                        for bucket_id, batch_begin, batch_end in zip(bucket_ids,
                                                                     batch_begins,
                                                                     batch_ends)]
         else:
-            for bucket_id, batch_begin in self._batch_infos:
+            for bucket_id, batch_begin in self._batch_infos[start:]:
                 batch_size = self._bucket_batch_sizes[bucket_id]
                 batch_end = min(batch_begin + batch_size, len(self._bucket_sample_ids[bucket_id]))
+                self._position += 1
                 yield self._bucket_sample_ids[bucket_id][batch_begin:batch_end]
 
     def __len__(self):
         return self._sampler_size
 
+    def state_dict(self):
+        """Return the state of the sampler, which can be used to resume an interrupted iteration.
+
+        Returns
+        -------
+        state : dict
+            The batch order of the current iteration and the number of batches that were
+            sampled from it.
+        """
+        return {'batch_infos': list(self._batch_infos),
+                'bucket_sample_ids': [list(sample_ids) for sample_ids in self._bucket_sample_ids],
+                'position': self._position}
+
+    def load_state_dict(self, state):
+        """Restore a state returned by :meth:`state_dict`.
+
+        The next iteration skips the batches that were already sampled when the state was
+        saved. If all the batches were sampled, the next iteration starts a new epoch.
+
+        Parameters
+        ----------
+        state : dict
+            The state of a sampler created with the same arguments.
+        """
+        bucket_sizes = [len(sample_ids) for sample_ids in state['bucket_sample_ids']]
+        if len(state['batch_infos']) != len(self._batch_infos) or \
+                bucket_sizes != [len(sample_ids) for sample_ids in self._bucket_sample_ids]:
+            raise ValueError('The state does not match the buckets of the sampler.')
+        self._batch_infos = [tuple(batch_info) for batch_info in state['batch_infos']]
+        self._bucket_sample_ids = [list(sample_ids) for sample_ids in state['bucket_sample_ids']]
+        self._position = state['position']
+        self._resume_position = state['position'] if state['position'] < len(self) else None
+
     def stats(self):
         """Return a string representing the statistics of the bucketing sampler.
 
@@ -478,13 +522,27 @@ class SortedBucketSampler(Sampler):
         self._total_sample_num = len(self._sort_keys)
         self._reverse = reverse
         self._shuffle = shuffle
+        self._random_state = None
+        self._position = 0
+        self._resume_position = None
 
     def __iter__(self):
+        start = 0
+        if self._resume_position is not None:
+            start = self._resume_position
+            self._resume_position = None
+            if self._shuffle:
+                # Replay the random draws of the interrupted iteration
+                np.random.set_state(self._random_state)
+        elif self._shuffle:
+            self._random_state = np.random.get_state()
+        self._position = start
         if self._shuffle:
             sample_ids = np.random.permutation(self._total_sample_num)
         else:
             sample_ids = list(range(self._total_sample_num))
         bucket_size = int(self._mult * self._batch_size)
+        batch_idx = 0
         for bucket_begin in range(0, self._total_sample_num, bucket_size):
             bucket_end = min(bucket_begin + bucket_size, self._total_sample_num)
             sorted_sample_ids = sorted(sample_ids[bucket_begin:bucket_end],
@@ -493,12 +551,401 @@ class SortedBucketSampler(Sampler):
             if self._shuffle:
                 np.random.shuffle(batch_begins)
             for batch_begin in batch_begins:
+                batch_idx += 1
+                if batch_idx <= start:
+                    continue
                 batch_end = min(batch_begin + self._batch_size, len(sorted_sample_ids))
+                self._position += 1
                 yield sorted_sample_ids[batch_begin:batch_end]
 
     def __len__(self):
         return (len(self._sort_keys) + self._batch_size - 1) // self._batch_size
 
+    def state_dict(self):
+        """Return the state of the sampler, which can be used to resume an interrupted iteration.
+
+        Returns
+        -------
+        state : dict
+            The numpy random state at the beginning of the current iteration and the number of
+            batches that were sampled from it.
+        """
+        return {'random_state': self._random_state, 'position': self._position}
+
+    def load_state_dict(self, state):
+        """Restore a state returned by :meth:`state_dict`.
+
+        The next iteration restores the numpy random state and skips the batches that were
+        already sampled when the state was saved. If all the batches were sampled, the next
+        iteration starts a new epoch.
+
+        Parameters
+        ----------
+        state : dict
+            The state of a sampler created with the same arguments.
+        """
+        if self._shuffle and state['position'] > 0 and state['random_state'] is None:
+            raise ValueError('The state does not contain the random state of the iteration.')
+        self._random_state = state['random_state']
+        self._position = state['position']
+        self._resume_position = state['position'] if 0 < state['position'] < len(self) \
+            else None
+
+class TokenBudgetSampler(Sampler):
+    r"""Pack the samples into batches whose number of tokens, including padding, fits a budget.
+
+    The samples are sorted by length and packed greedily: a batch of :math:`n` samples whose
+    longest sample has length :math:`L` costs :math:`n \times L` tokens. The batch sizes
+    adapt to the lengths, so that the batches of short sequences contain more samples.
+
+    Parameters
+    ----------
+    lengths : list of int or list of tuple/list of int
+        The length of the sequences in the input data sample.
+    max_tokens : int or tuple of int
+        The maximum number of tokens in a batch, including padding. If lengths contains tuples,
+        e.g. the source and target lengths, an int limits the sum of the padded tokens over all
+        the sequences of a sample, and a tuple limits the padded tokens of each sequence
+        separately.
+    max_batch_size : int or None, default None
+        The maximum number of samples in a batch.
+    shuffle : bool, default False
+        Whether to shuffle the batches, and the samples of the same length before packing.
+    num_shards : int, default 0
+        If num_shards > 0, the sampled batch is split into num_shards smaller batches.
+        The output will have structure of list(list(int)).
+        If num_shards = 0, the output will have structure of list(int).
+        This is useful in multi-gpu training. In general, it is set to the number of gpus.
+
+    Examples
+    --------
+    >>> lengths = [np.random.randint(1, 100) for _ in range(1000)]
+    >>> sampler = gluonnlp.data.TokenBudgetSampler(lengths, max_tokens=1000)
+    >>> print(sampler.stats())
+    TokenBudgetSampler:
+    -etc-
+    """
+    def __init__(self, lengths, max_tokens, max_batch_size=None, shuffle=False, num_shards=0):
+        assert len(lengths) > 0, 'TokenBudgetSampler does not support empty lengths.'
+        self._lengths = np.array(lengths, dtype=np.int64)
+        if self._lengths.ndim == 1:
+            self._lengths = self._lengths.reshape((-1, 1))
+        assert self._lengths.ndim == 2, \
+            'Elements in lengths must be either int or tuple/list of int. ' \
+            'Received lengths=%s' % str(lengths)
+        assert self._lengths.min() > 0, 'Sequence lengths must all be larger than 0.'
+        if isinstance(max_tokens, (tuple, list)):
+            assert len(max_tokens) == self._lengths.shape[1], \
+                'max_tokens must have the same number of elements as the lengths. ' \
+                'Received max_tokens=%s' % str(max_tokens)
+            self._max_tokens = np.array(max_tokens, dtype=np.int64)
+        else:
+            self._max_tokens = np.array([max_tokens], dtype=np.int64)
+        assert self._max_tokens.min() > 0, 'max_tokens must be larger than 0.'
+        assert max_batch_size is None or max_batch_size > 0, \
+            'max_batch_size must be larger than 0.'
+        self._max_batch_size = max_batch_size
+        self._shuffle = shuffle
+        self._num_shards = num_shards
+        too_long = np.nonzero((self._sample_costs() > self._max_tokens).any(axis=1))[0]
+        if len(too_long) > 0:
+            raise ValueError('Find elements in lengths that exceed max_tokens on their own, '
+                             'lengths=%s, max_tokens=%s. You must increase max_tokens.'
+                             % (str(self._lengths[too_long].tolist()),
+                                str(self._max_tokens.tolist())))
+        # The packing only depends on the sorted lengths, which do not change with shuffling.
+        self._batch_sizes = self._pack(self._lengths[self._sort_sample_ids(shuffle=False)])
+        if self._num_shards > 0:
+            self._sampler_size = int(math.ceil(len(self._batch_sizes) / float(self._num_shards)))
+        else:
+            self._sampler_size = len(self._batch_sizes)
+
+    def _sample_costs(self):
+        """Number of tokens counted for each sample against each budget."""
+        if len(self._max_tokens) == 1:
+            return self._lengths.sum(axis=1, keepdims=True)
+        return self._lengths
+
+    def _sort_sample_ids(self, shuffle):
+        """Sample ids sorted by length. The samples of the same length are shuffled if shuffle."""
+        sample_ids = np.random.permutation(len(self._lengths)) if shuffle \
+            else np.arange(len(self._lengths))
+        keys = self._lengths[sample_ids]
+        return sample_ids[np.lexsort(keys.T[::-1])]
+
+    def _pack(self, sorted_lengths):
+        """Greedily pack the sorted samples. Returns the number of samples of each batch."""
+        max_tokens = self._max_tokens.tolist()
+        single_budget = len(max_tokens) == 1
+        batch_sizes = []
+        batch_size = 0
+        batch_max = [0] * sorted_lengths.shape[1]
+        for length in sorted_lengths.tolist():
+            new_max = [max(lhs, rhs) for lhs, rhs in zip(batch_max, length)]
+            if single_budget:
+                fits = (batch_size + 1) * sum(new_max) <= max_tokens[0]
+            else:
+                fits = all((batch_size + 1) * ele <= budget
+                           for ele, budget in zip(new_max, max_tokens))
+            if self._max_batch_size is not None and batch_size >= self._max_batch_size:
+                fits = False
+            if fits:
+                batch_size += 1
+                batch_max = new_max
+            else:
+                batch_sizes.append(batch_size)
+                batch_size = 1
+                batch_max = length
+        batch_sizes.append(batch_size)
+        return batch_sizes
+
+    def _batches(self, sample_ids):
+        batch_ends = np.cumsum(self._batch_sizes)
+        return [sample_ids[end - size:end].tolist()
+                for end, size in zip(batch_ends, self._batch_sizes)]
+
+    def __iter__(self):
+        batches = self._batches(self._sort_sample_ids(self._shuffle))
+        if self._shuffle:
+            np.random.shuffle(batches)
+        if self._num_shards > 0:
+            for batch_idx in range(0, len(batches), self._num_shards):
+                if batch_idx + self._num_shards > len(batches):
+                    batch_idx = len(batches) - self._num_shards
+                yield batches[batch_idx: batch_idx + self._num_shards]
+        else:
+            for batch in batches:
+                yield batch
+
+    def __len__(self):
+        return self._sampler_size
+
+    def stats(self):
+        """Return a string representing the statistics of the sampler.
+
+        Returns
+        -------
+        ret : str
+            String representing the statistics of the batches, including the ratio of padding
+            tokens in the batches of each sequence.
+        """
+        batches = self._batches(self._sort_sample_ids(shuffle=False))
+        num_tokens = self._lengths.sum(axis=0)
+        num_padded_tokens = np.sum([len(batch) * self._lengths[batch].max(axis=0)
+                                    for batch in batches], axis=0)
+        padding_ratio = 1 - num_tokens / num_padded_tokens.astype(np.float64)
+        ret = '{name}:\n' \
+            '  sample_num={sample_num}, batch_num={batch_num}\n' \
+            '  max_tokens={max_tokens}, max_batch_size={max_batch_size}\n' \
+            '  batch_size: min={min_batch_size}, mean={mean_batch_size:.1f}, ' \
+            'max={max_batch_size_found}\n' \
+            '  padded_tokens={num_padded_tokens}\n' \
+            '  padding_ratio={padding_ratio}'\
+            .format(name=self.__class__.__name__,
+                    sample_num=len(self._lengths),
+                    batch_num=len(batches),
+                    max_tokens=self._max_tokens.tolist(),
+                    max_batch_size=self._max_batch_size,
+                    min_batch_size=min(self._batch_sizes),
+                    mean_batch_size=np.mean(self._batch_sizes),
+                    max_batch_size_found=max(self._batch_sizes),
+                    num_padded_tokens=num_padded_tokens.tolist(),
+                    padding_ratio=[round(ele, 4) for ele in padding_ratio.tolist()])
+        return ret
+
+
+class DistributedFixedBucketSampler(FixedBucketSampler):
+    r"""Bucketing sampler that hands each of the `num_parts` workers an equal share of the
+    batches of :class:`FixedBucketSampler`.
+
+    All the workers generate the same global batch order from `seed` and the current epoch,
+    without using the global random state. The batches of each bucket are grouped into steps of
+    `num_parts` batches, and worker `part_index` takes the `part_index` th batch of every step.
+    Hence all the workers iterate through the same number of batches and process batches of the
+    same bucket at the same time, which keeps synchronous updates balanced. If the number of
+    batches of a bucket is not divisible by `num_parts`, some batches of that bucket are
+    repeated to fill its last step.
+
+    Every iteration over the sampler advances the epoch by one. :meth:`set_epoch` can be used
+    to resume from a batch in the middle of an epoch, e.g. after a restart.
+
+    Parameters
+    ----------
+    lengths : list of int or list of tuple/list of int
+        The length of the sequences in the input data sample.
+    batch_size : int
+        The batch size of the sampler.
+    num_parts : int, default 1
+        Number of workers which the batches are split into.
+    part_index : int, default 0
+        The index of the worker.
+    seed : int, default 0
+        The random seed. It must be the same on all the workers.
+    num_buckets : int or None, default 10
+        The number of buckets. This will not be used if bucket_keys is set.
+    bucket_keys : None or list of int or list of tuple, default None
+        The keys that will be used to create the buckets. See :class:`FixedBucketSampler`.
+    ratio : float, default 0
+        Ratio to scale up the batch size of smaller buckets. See :class:`FixedBucketSampler`.
+    shuffle : bool, default True
+        Whether to shuffle the batches and the samples in each bucket.
+    use_average_length : bool, default False
+        False: each batch contains batch_size sequences, number of sequence elements varies.
+        True: each batch contains batch_size elements, number of sequences varies. In this case,
+        ratio option is ignored.
+    num_shards : int, default 0
+        If num_shards > 0, the batches of the worker are further split into num_shards
+        smaller batches. The output will have structure of list(list(int)).
+        If num_shards = 0, the output will have structure of list(int).
+    bucket_scheme : BucketScheme, default ConstWidthBucket
+        It is used to generate bucket keys. See :class:`FixedBucketSampler`.
+
+    Examples
+    --------
+    >>> lengths = [np.random.randint(1, 100) for _ in range(1000)]
+    >>> sampler = gluonnlp.data.DistributedFixedBucketSampler(lengths, 8, num_parts=4,
+    ...                                                       part_index=1, seed=2)
+    >>> print(sampler.stats())
+    DistributedFixedBucketSampler:
+    -etc-
+    """
+    def __init__(self, lengths, batch_size, num_parts=1, part_index=0, seed=0, num_buckets=10,
+                 bucket_keys=None, ratio=0, shuffle=True, use_average_length=False, num_shards=0,
+                 bucket_scheme=ConstWidthBucket()):
+        assert num_parts > 0, 'num_parts must be larger than 0. Received num_parts=%d' \
+                              % num_parts
+        assert 0 <= part_index < num_parts, \
+            'part_index must be in [0, num_parts). Received part_index=%d, num_parts=%d' \
+            % (part_index, num_parts)
+        assert seed >= 0, 'seed must be non-negative. Received seed=%d' % seed
+        super(DistributedFixedBucketSampler, self).__init__(
+            lengths, batch_size, num_buckets=num_buckets, bucket_keys=bucket_keys, ratio=ratio,
+            shuffle=shuffle, use_average_length=use_average_length, num_shards=num_shards,
+            bucket_scheme=bucket_scheme)
+        self._num_parts = num_parts
+        self._part_index = part_index
+        self._seed = seed
+        self._epoch = 0
+        self._start_batch = 0
+        self._position_epoch = 0
+        self._num_part_batches = sum(
+            int(math.ceil(math.ceil(len(sample_ids) / float(bucket_batch_size))
+                          / float(num_parts)))
+            for sample_ids, bucket_batch_size in zip(self._bucket_sample_ids,
+                                                     self._bucket_batch_sizes))
+        if self._num_shards > 0:
+            self._sampler_size = int(math.ceil(self._num_part_batches / float(self._num_shards)))
+        else:
+            self._sampler_size = self._num_part_batches
+
+    @property
+    def epoch(self):
+        """The epoch of the next iteration."""
+        return self._epoch
+
+    def set_epoch(self, epoch, start_batch=0):
+        """Set the epoch of the next iteration.
+
+        Parameters
+        ----------
+        epoch : int
+            The epoch, which determines the batch order together with the seed.
+        start_batch : int, default 0
+            The number of batches of the epoch that were already consumed. The next iteration
+            skips them.
+        """
+        assert epoch >= 0, 'epoch must be non-negative. Received epoch=%d' % epoch
+        assert 0 <= start_batch <= len(self), \
+            'start_batch must be in [0, %d]. Received start_batch=%d' % (len(self), start_batch)
+        self._epoch = epoch
+        self._start_batch = start_batch
+
+    def _global_steps(self, epoch):
+        """The batches of all the workers, grouped into steps of num_parts batches."""
+        rng = np.random.RandomState([self._seed, epoch])
+        steps = []
+        # From the longest to the shortest bucket, as in FixedBucketSampler.
+        for bucket_id in range(len(self._bucket_keys) - 1, -1, -1):
+            sample_ids = np.array(self._bucket_sample_ids[bucket_id])
+            if self._shuffle:
+                rng.shuffle(sample_ids)
+            batch_size = self._bucket_batch_sizes[bucket_id]
+            batches = [sample_ids[begin:begin + batch_size].tolist()
+                       for begin in range(0, len(sample_ids), batch_size)]
+            # Fill the last step of the bucket with batches of the same bucket
+            num_missing = -len(batches) % self._num_parts
+            batches.extend(batches[i % len(batches)] for i in range(num_missing))
+            steps.extend(batches[begin:begin + self._num_parts]
+                         for begin in range(0, len(batches), self._num_parts))
+        if self._shuffle:
+            steps = [steps[i] for i in rng.permutation(len(steps))]
+        return steps
+
+    def __iter__(self):
+        part_batches = [step[self._part_index] for step in self._global_steps(self._epoch)]
+        if self._num_shards > 0:
+            outputs = []
+            for batch_idx in range(0, len(part_batches), self._num_shards):
+                if batch_idx + self._num_shards > len(part_batches):
+                    batch_idx = max(len(part_batches) - self._num_shards, 0)
+                outputs.append(part_batches[batch_idx: batch_idx + self._num_shards])
+        else:
+            outputs = part_batches
+        start_batch = self._start_batch
+        self._position_epoch = self._epoch
+        self._position = start_batch
+        self._epoch += 1
+        self._start_batch = 0
+        for output in outputs[start_batch:]:
+            self._position += 1
+            yield output
+
+    def __len__(self):
+        return self._sampler_size
+
+    def state_dict(self):
+        """Return the state of the sampler, which can be used to resume an interrupted iteration.
+
+        Returns
+        -------
+        state : dict
+            The epoch of the current iteration and the number of batches that were sampled
+            from it.
+        """
+        return {'epoch': self._position_epoch, 'position': self._position}
+
+    def load_state_dict(self, state):
+        """Restore a state returned by :meth:`state_dict`.
+
+        This is equivalent to :meth:`set_epoch` with the saved epoch and number of batches,
+        except that a completed epoch resumes at the beginning of the next one.
+
+        Parameters
+        ----------
+        state : dict
+            The state of a sampler created with the same arguments.
+        """
+        if state['position'] >= len(self):
+            self.set_epoch(state['epoch'] + 1)
+        else:
+            self.set_epoch(state['epoch'], start_batch=state['position'])
+
+    def stats(self):
+        """Return a string representing the statistics of the bucketing sampler.
+
+        Returns
+        -------
+        ret : str
+            String representing the statistics of the buckets and of the share of the worker.
+        """
+        ret = super(DistributedFixedBucketSampler, self).stats()
+        ret += '\n  num_parts={num_parts}, part_index={part_index}, seed={seed}, ' \
+               'part_batch_num={part_batch_num}'\
+            .format(num_parts=self._num_parts, part_index=self._part_index, seed=self._seed,
+                    part_batch_num=self._num_part_batches)
+        return ret
+
+
 class SplitSampler(Sampler):
     """Split the dataset into `num_parts` parts and randomly sample from the part
     with index `part_index`.
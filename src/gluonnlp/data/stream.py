@@ -99,12 +99,25 @@ class SimpleDataStream(DataStream):
         return iter(self._stream)
 
 
+def _supports_state_dict(stream):
+    """Whether the position of the stream can be saved with state_dict."""
+    if isinstance(stream, (_LazyTransformDataStream, PrefetchingStream)):
+        return _supports_state_dict(stream._stream)  # pylint: disable=protected-access
+    return hasattr(stream, 'state_dict') and hasattr(stream, 'load_state_dict')
+
+
 class _LazyTransformDataStream(DataStream):
     """Data stream that lazily transforms the data."""
     def __init__(self, stream, fn):
         self._stream = stream
         self._fn = fn
 
+    def state_dict(self):
+        return self._stream.state_dict()
+
+    def load_state_dict(self, state):
+        self._stream.load_state_dict(state)
+
     def __iter__(self):
         stream_iter = iter(self._stream)
 
@@ -188,6 +201,8 @@ class SimpleDatasetStream(DatasetStream):
             raise ValueError('Cannot find any file with path "%s"'%file_pattern)
         self._file_sampler = self._get_sampler(file_sampler)
         self._kwargs = kwargs
+        self._last_iter = None
+        self._resume_state = None
 
     def _get_sampler(self, sampler):
         if isinstance(sampler, Sampler):
@@ -203,9 +218,69 @@ class SimpleDatasetStream(DatasetStream):
 
     def __iter__(self):
         # generate file samples
-        for file_idx in iter(self._file_sampler):
-            filename = self._files[file_idx]
-            yield self._dataset(filename, **self._kwargs)
+        if self._resume_state is None:
+            file_ids = [int(file_idx) for file_idx in self._file_sampler]
+            position = 0
+        else:
+            file_ids = self._resume_state['file_ids']
+            position = self._resume_state['position']
+            self._resume_state = None
+        self._last_iter = _SimpleDatasetStreamIter(self, file_ids, position)
+        return self._last_iter
+
+    def state_dict(self):
+        """Return the state of the stream, which can be used to resume an interrupted iteration.
+
+        Returns
+        -------
+        state : dict
+            The file order of the latest iteration and the number of files that were read.
+        """
+        if self._last_iter is None:
+            return {'file_ids': None, 'position': 0}
+        return {'file_ids': list(self._last_iter.file_ids),
+                'position': self._last_iter.position}
+
+    def load_state_dict(self, state):
+        """Restore a state returned by :meth:`state_dict`.
+
+        The next iteration continues with the files that were not read when the state was
+        saved. If all the files were read, the next iteration starts a new epoch.
+
+        Parameters
+        ----------
+        state : dict
+            The state of a stream created with the same arguments.
+        """
+        if state['file_ids'] is None or state['position'] >= len(state['file_ids']):
+            self._resume_state = None
+        else:
+            if max(state['file_ids']) >= len(self._files):
+                raise ValueError('The state does not match the files of the stream.')
+            self._resume_state = {'file_ids': list(state['file_ids']),
+                                  'position': state['position']}
+
+
+class _SimpleDatasetStreamIter(object):
+    """Iterator of SimpleDatasetStream which keeps track of its position."""
+    def __init__(self, stream, file_ids, position):
+        self._stream = stream
+        self.file_ids = file_ids
+        self.position = position
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.position >= len(self.file_ids):
+            raise StopIteration
+        filename = self._stream._files[self.file_ids[self.position]]  # pylint: disable=protected-access
+        dataset = self._stream._dataset(filename, **self._stream._kwargs)  # pylint: disable=protected-access
+        self.position += 1
+        return dataset
+
+    def next(self):
+        return self.__next__()
 
 
 class _Prefetcher(object):
@@ -216,7 +291,7 @@ class _Prefetcher(object):
 
     _checked_start = False  # True once startup has been checkd by _check_start
 
-    def __init__(self, stream, num_prefetch, seed, np_seed, mx_seed):
+    def __init__(self, stream, num_prefetch, seed, np_seed, mx_seed, track_state=False):
         super(_Prefetcher, self).__init__()
         self.stream = stream
         assert num_prefetch > 0, 'Unbounded Prefetcher is unsupported.'
@@ -224,6 +299,10 @@ class _Prefetcher(object):
         self.seed = seed
         self.np_seed = np_seed
         self.mx_seed = mx_seed
+        self.track_state = track_state
+        # State of the stream after the element that was last returned by __next__, or at the
+        # beginning of the iteration
+        self.state = None
 
     def run(self):
         """Method representing the process’s activity."""
@@ -238,7 +317,9 @@ class _Prefetcher(object):
         # Startup - Master waits for this
         try:
             stream_iter = iter(self.stream)
+            state = self.stream.state_dict() if self.track_state else None
             self._errorq.put(None)
+            self._dataq.put((None, state))
         except Exception as e:  # pylint: disable=broad-except
             tb = traceback.format_exc()
             self._errorq.put((e, tb))
@@ -256,10 +337,13 @@ class _Prefetcher(object):
             except RuntimeError as e:
                 tb = traceback.format_exc()
                 self._errorq.put((e, tb))
-                self._dataq.put(None)
+                self._dataq.put((None, None))
 
+            state = None
             try:
                 data = next(stream_iter)
+                if self.track_state:
+                    state = self.stream.state_dict()
                 error = None
             except Exception as e:  # pylint: disable=broad-except
                 tb = traceback.format_exc()
@@ -267,13 +351,14 @@ class _Prefetcher(object):
                 data = None
             finally:
                 self._errorq.put(error)
-                self._dataq.put(data)
+                self._dataq.put((data, state))
 
     def __next__(self):
-        next_item = self._dataq.get()
+        next_item, next_state = self._dataq.get()
         next_error = self._errorq.get()
 
         if next_error is None:
+            self.state = next_state
             return next_item
         else:
             self._controlq.put(None)
@@ -293,6 +378,7 @@ class _Prefetcher(object):
         next_error = self._errorq.get(block=True)
         if next_error is not None:
             self._reraise(*next_error)
+        _, self.state = self._dataq.get(block=True)
 
     def next(self):
         return self.__next__()
@@ -346,6 +432,10 @@ class PrefetchingStream(DataStream):
     worker_type : 'thread' or 'process', default 'thread'
         Use a separate Python Thread or Process to prefetch.
 
+    If the source stream supports `state_dict` and `load_state_dict`, so does the
+    PrefetchingStream. Its state is the state of the source stream after the element that was
+    last returned, not after the prefetched elements.
+
     """
 
     def __init__(self, stream, num_prefetch=1, worker_type='thread'):
@@ -355,16 +445,45 @@ class PrefetchingStream(DataStream):
             raise ValueError('num_prefetch must be greater 0.')
         assert worker_type.lower() in ['thread', 'process']
         self._multiprocessing = worker_type.lower() == 'process'
+        self._prefetcher = None
 
     def __iter__(self):
         seed = random.getrandbits(32)
         np_seed = np.random.randint(0, 2**32)
         mx_seed = int(mx.nd.random.uniform(0, 2**32).asscalar())
+        track_state = _supports_state_dict(self._stream)
         if self._multiprocessing:
-            return _ProcessPrefetcher(self._stream, self._num_prefetch,
-                                      seed=seed, np_seed=np_seed,
-                                      mx_seed=mx_seed)
+            self._prefetcher = _ProcessPrefetcher(self._stream, self._num_prefetch,
+                                                  seed=seed, np_seed=np_seed,
+                                                  mx_seed=mx_seed, track_state=track_state)
         else:
-            return _ThreadPrefetcher(self._stream, self._num_prefetch,
-                                     seed=seed, np_seed=np_seed,
-                                     mx_seed=mx_seed)
+            self._prefetcher = _ThreadPrefetcher(self._stream, self._num_prefetch,
+                                                 seed=seed, np_seed=np_seed,
+                                                 mx_seed=mx_seed, track_state=track_state)
+        return self._prefetcher
+
+    def state_dict(self):
+        """Return the state of the source stream after the element that was last returned.
+
+        Returns
+        -------
+        state : dict
+            The state returned by `state_dict` of the source stream.
+        """
+        if not _supports_state_dict(self._stream):
+            raise NotImplementedError('The source stream does not support state_dict.')
+        if self._prefetcher is None:
+            return self._stream.state_dict()
+        return self._prefetcher.state
+
+    def load_state_dict(self, state):
+        """Restore a state returned by :meth:`state_dict` in the source stream.
+
+        Parameters
+        ----------
+        state : dict
+            The state of a stream created with the same arguments.
+        """
+        if not _supports_state_dict(self._stream):
+            raise NotImplementedError('The source stream does not support state_dict.')
+        self._stream.load_state_dict(state)
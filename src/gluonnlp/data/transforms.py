@@ -32,6 +32,10 @@ __all__ = ['ClipSequence', 'PadSequence', 'SacreMosesTokenizer', 'NLTKMosesToken
            'BERTSentenceTransform']
 
 import os
+import sys
+import collections
+import itertools
+import multiprocessing
 import warnings
 import unicodedata
 
@@ -40,6 +44,15 @@ import mxnet as mx
 from mxnet.gluon.utils import download, check_sha1
 from .utils import _get_home_dir, _extract_archive
 
+try:
+    _unichr = unichr  # pylint: disable=invalid-name
+except NameError:
+    _unichr = chr  # pylint: disable=invalid-name
+
+# The characters out of the BMP are surrogate pairs on narrow unicode builds of Python 2, and
+# BERTBasicTokenizer falls back to classifying the surrogates one by one.
+_WIDE_UNICODE = sys.maxunicode == 0x10ffff
+
 
 class ClipSequence(object):
     """Clip the sequence to have length no more than `length`.
@@ -142,7 +155,92 @@ class PadSequence(object):
                                           'mxnet.NDArray, received type=%s' % str(type(sample)))
 
 
-class NLTKMosesTokenizer(object):
+_worker_tokenizer = None
+
+
+def _tokenizer_worker_initializer(tokenizer):
+    """Initializer of the processes of `batch`. The tokenizer is set up once per process."""
+    global _worker_tokenizer  # pylint: disable=global-statement
+    _worker_tokenizer = tokenizer
+
+
+def _tokenizer_worker_fn(samples):
+    """Tokenize a chunk of samples in a worker process."""
+    return [_worker_tokenizer(sample) for sample in samples]
+
+
+class _BatchTokenizer(object):
+    """Batch interface of the tokenizers.
+
+    The tokenizer is sent to each worker process once, when the process starts. Tokenizers
+    whose state cannot be pickled implement `__reduce__` to be created again in the worker.
+    """
+
+    def batch(self, samples, num_workers=0, chunk_size=1024):
+        """Tokenize a batch of samples.
+
+        Parameters
+        ----------
+        samples : iterable of str
+            The samples to tokenize.
+        num_workers : int, default 0
+            The number of worker processes. If 0, the samples are tokenized in the current
+            process.
+        chunk_size : int, default 1024
+            The number of samples sent to a worker process at once.
+
+        Returns
+        -------
+        ret : list of list of strs
+            List of tokens of each sample, in the same order as the samples.
+        """
+        return list(self.iter_batch(samples, num_workers=num_workers, chunk_size=chunk_size))
+
+    def iter_batch(self, samples, num_workers=0, chunk_size=1024):
+        """Tokenize a stream of samples lazily, e.g. the lines of a large corpus.
+
+        At most `2 * num_workers` chunks are read ahead of the returned results.
+
+        Parameters
+        ----------
+        samples : iterable of str
+            The samples to tokenize.
+        num_workers : int, default 0
+            The number of worker processes. If 0, the samples are tokenized in the current
+            process.
+        chunk_size : int, default 1024
+            The number of samples sent to a worker process at once.
+
+        Returns
+        -------
+        ret : generator of list of strs
+            List of tokens of each sample, in the same order as the samples.
+        """
+        assert chunk_size > 0, 'chunk_size must be larger than 0. Received chunk_size={}'\
+            .format(chunk_size)
+        if num_workers <= 0:
+            for sample in samples:
+                yield self(sample)
+            return
+        samples = iter(samples)
+        chunks = iter(lambda: list(itertools.islice(samples, chunk_size)), [])
+        pool = multiprocessing.Pool(num_workers, initializer=_tokenizer_worker_initializer,
+                                    initargs=[self])
+        try:
+            pending = collections.deque()
+            for chunk in chunks:
+                pending.append(pool.apply_async(_tokenizer_worker_fn, (chunk,)))
+                if len(pending) >= 2 * num_workers:
+                    for tokens in pending.popleft().get():
+                        yield tokens
+            while pending:
+                for tokens in pending.popleft().get():
+                    yield tokens
+        finally:
+            pool.terminate()
+
+
+class NLTKMosesTokenizer(_BatchTokenizer):
     """Apply the Moses Tokenizer implemented in NLTK.
 
     Users of this class are required to install `NLTK <https://www.nltk.org/install.html>`_
@@ -182,6 +280,9 @@ class NLTKMosesTokenizer(object):
             raise ValueError('The instantiation of MosesTokenizer in sacremoses is'
                              ' currently only supported in python3.')
 
+    def __reduce__(self):
+        return NLTKMosesTokenizer, ()
+
     def __call__(self, sample, return_str=False):
         """
 
@@ -201,7 +302,7 @@ class NLTKMosesTokenizer(object):
         return self._tokenizer.tokenize(sample, return_str=return_str)
 
 
-class SacreMosesTokenizer(object):
+class SacreMosesTokenizer(_BatchTokenizer):
     """Apply the Moses Tokenizer implemented in sacremoses.
 
     Users of this class are required to install
@@ -244,6 +345,9 @@ class SacreMosesTokenizer(object):
                                   'NLTKMosesTokenizer. You can refer to the official '
                                   'installation guide in https://www.nltk.org/install.html .')
 
+    def __reduce__(self):
+        return SacreMosesTokenizer, ()
+
     def __call__(self, sample, return_str=False):
         """
 
@@ -263,7 +367,7 @@ class SacreMosesTokenizer(object):
         return self._tokenizer.tokenize(sample, return_str=return_str)
 
 
-class SpacyTokenizer(object):
+class SpacyTokenizer(_BatchTokenizer):
     """Apply the Spacy Tokenizer.
 
     Users of this class are required to install `spaCy <https://spacy.io/usage/>`_
@@ -290,6 +394,7 @@ class SpacyTokenizer(object):
     """
 
     def __init__(self, lang='en'):
+        self._lang = lang
         try:
             import spacy
             from pkg_resources import parse_version
@@ -307,6 +412,9 @@ class SpacyTokenizer(object):
                           'https://spacy.io/usage/models. Usually, the installation command '
                           'should be `python -m spacy download {lang}`.'.format(lang=lang))
 
+    def __reduce__(self):
+        return SpacyTokenizer, (self._lang,)
+
     def __call__(self, sample):
         """
 
@@ -449,7 +557,7 @@ class SacreMosesDetokenizer(object):
         return self._detokenizer.detokenize(sample, return_str=return_str)
 
 
-class JiebaTokenizer(object):
+class JiebaTokenizer(_BatchTokenizer):
     r"""Apply the jieba Tokenizer.
 
     Users of this class are required to `install jieba <https://github.com/fxsjy/jieba>`_
@@ -478,6 +586,9 @@ class JiebaTokenizer(object):
                               'in https://github.com/fxsjy/jieba')
         self._tokenizer = jieba
 
+    def __reduce__(self):
+        return JiebaTokenizer, ()
+
     def __call__(self, sample):
         """
 
@@ -496,7 +607,7 @@ class JiebaTokenizer(object):
         return [tok for tok in self._tokenizer.cut(sample) if tok != ' ' and tok != '']
 
 
-class NLTKStanfordSegmenter(object):
+class NLTKStanfordSegmenter(_BatchTokenizer):
     r"""Apply the Stanford Chinese Word Segmenter implemented in NLTK.
 
     Users of this class are required to install Java, NLTK and download Stanford Word Segmenter
@@ -600,9 +711,13 @@ class _SentencepieceProcessor(object):
                               'in order to use the Sentencepiece tokenizer and detokenizer. '
                               'You can refer to the official installation guide '
                               'in https://github.com/google/sentencepiece#installation')
+        self._path = path
         self._processor = sentencepiece.SentencePieceProcessor()
         self._processor.Load(path)
 
+    def __reduce__(self):
+        return type(self), (self._path,)
+
     def __len__(self):
         return len(self._processor)
 
@@ -611,7 +726,7 @@ class _SentencepieceProcessor(object):
         return [self._processor.id_to_piece(i) for i in range(len(self))]
 
 
-class SentencepieceTokenizer(_SentencepieceProcessor):
+class SentencepieceTokenizer(_SentencepieceProcessor, _BatchTokenizer):
     r"""Apply the Sentencepiece Tokenizer, which supports subword tokenization such as BPE.
 
     Users of this class are required to `install sentencepiece
@@ -652,6 +767,9 @@ class SentencepieceTokenizer(_SentencepieceProcessor):
         self._nbest = num_best
         self._alpha = alpha
 
+    def __reduce__(self):
+        return SentencepieceTokenizer, (self._path, self._nbest, self._alpha)
+
     def __call__(self, sample):
         """
 
@@ -712,6 +830,102 @@ class SentencepieceDetokenizer(_SentencepieceProcessor):
         return self._processor.DecodePieces(sample)
 
 
+# Bit flags of the code point classification table of BERTBasicTokenizer
+_BERT_CHAR_REMOVED = 1
+_BERT_CHAR_WHITESPACE = 2
+_BERT_CHAR_CHINESE = 4
+_BERT_CHAR_PUNCTUATION = 8
+_BERT_CHAR_NONSPACING_MARK = 16
+_BERT_CHINESE_RANGES = [(0x4E00, 0x9FFF), (0x3400, 0x4DBF), (0x20000, 0x2A6DF),
+                        (0x2A700, 0x2B73F), (0x2B740, 0x2B81F), (0x2B820, 0x2CEAF),
+                        (0xF900, 0xFAFF), (0x2F800, 0x2FA1F)]
+_bert_char_table = None
+
+
+def _get_bert_char_table():
+    """Classification of all the Unicode code points used by BERTBasicTokenizer.
+
+    The table is an uint8 array indexed by the code point, holding the `_BERT_CHAR_*` flags.
+    It is built once on first use and shared by all the instances.
+    """
+    global _bert_char_table  # pylint: disable=global-statement
+    if _bert_char_table is None:
+        num_code_points = sys.maxunicode + 1
+        category_names = ['Cc', 'Cf', 'Cn', 'Co', 'Cs', 'Ll', 'Lm', 'Lo', 'Lt', 'Lu', 'Mc',
+                          'Me', 'Mn', 'Nd', 'Nl', 'No', 'Pc', 'Pd', 'Pe', 'Pf', 'Pi', 'Po',
+                          'Ps', 'Sc', 'Sk', 'Sm', 'So', 'Zl', 'Zp', 'Zs']
+        category_ids = {name: i for i, name in enumerate(category_names)}
+        categories = np.fromiter((category_ids[unicodedata.category(_unichr(cp))]
+                                  for cp in range(num_code_points)),
+                                 dtype=np.uint8, count=num_code_points)
+        category_names = np.array(category_names)
+        is_control = np.char.startswith(category_names, 'C')[categories]
+        is_control[[ord('\t'), ord('\n'), ord('\r')]] = False
+        is_control[[0, 0xfffd]] = True
+        is_whitespace = (category_names == 'Zs')[categories]
+        is_whitespace[[ord(' '), ord('\t'), ord('\n'), ord('\r')]] = True
+        is_chinese = np.zeros((num_code_points,), dtype=np.bool_)
+        for begin, end in _BERT_CHINESE_RANGES:
+            is_chinese[begin:end + 1] = True
+        is_punctuation = np.char.startswith(category_names, 'P')[categories]
+        for begin, end in [(33, 47), (58, 64), (91, 96), (123, 126)]:
+            is_punctuation[begin:end + 1] = True
+        is_mark = (category_names == 'Mn')[categories]
+        table = np.zeros((num_code_points,), dtype=np.uint8)
+        for flag, mask in [(_BERT_CHAR_REMOVED, is_control),
+                           (_BERT_CHAR_WHITESPACE, is_whitespace),
+                           (_BERT_CHAR_CHINESE, is_chinese),
+                           (_BERT_CHAR_PUNCTUATION, is_punctuation),
+                           (_BERT_CHAR_NONSPACING_MARK, is_mark)]:
+            table[mask] |= flag
+        _bert_char_table = table
+    return _bert_char_table
+
+
+class _BERTCharMap(dict):
+    """Translation table for `str.translate`, filled from `_get_bert_char_table` on demand.
+
+    Parameters
+    ----------
+    removed : int
+        Flags of the characters to remove.
+    padded : int
+        Flags of the characters to surround with whitespace.
+    whitespace : bool
+        Whether to replace the whitespace characters by a space.
+    """
+    def __init__(self, removed, padded, whitespace):
+        super(_BERTCharMap, self).__init__()
+        self._removed = removed
+        self._padded = padded
+        self._whitespace = whitespace
+
+    def __missing__(self, code_point):
+        flags = _get_bert_char_table()[code_point]
+        if flags & self._removed:
+            value = None
+        elif self._whitespace and flags & _BERT_CHAR_WHITESPACE:
+            value = u' '
+        elif flags & self._padded:
+            value = u' ' + _unichr(code_point) + u' '
+        else:
+            value = code_point
+        self[code_point] = value
+        return value
+
+
+# Cleaning and CJK spacing, before lower casing and stripping accents
+_BERT_CLEAN_MAP = _BERTCharMap(removed=_BERT_CHAR_REMOVED, padded=_BERT_CHAR_CHINESE,
+                               whitespace=True)
+# Cleaning, CJK spacing and punctuation splitting, without lower casing
+_BERT_CLEAN_SPLIT_MAP = _BERTCharMap(removed=_BERT_CHAR_REMOVED,
+                                     padded=_BERT_CHAR_CHINESE | _BERT_CHAR_PUNCTUATION,
+                                     whitespace=True)
+# Accent stripping and punctuation splitting, after lower casing
+_BERT_STRIP_SPLIT_MAP = _BERTCharMap(removed=_BERT_CHAR_NONSPACING_MARK,
+                                     padded=_BERT_CHAR_PUNCTUATION, whitespace=False)
+
+
 class BERTBasicTokenizer():
     r"""Runs basic tokenization
 
@@ -755,7 +969,24 @@ class BERTBasicTokenizer():
         return self._tokenize(sample)
 
     def _tokenize(self, text):
-        """Tokenizes a piece of text."""
+        """Tokenizes a piece of text.
+
+        Each stage maps the whole text with `str.translate`, using translation tables filled
+        from a code point classification table shared by all the instances. The result is the
+        same as the one of `_tokenize_by_char`, which is used on narrow unicode builds.
+        """
+        if not _WIDE_UNICODE:
+            return self._tokenize_by_char(text)
+        if not self.lower:
+            return text.translate(_BERT_CLEAN_SPLIT_MAP).split()
+        text = text.translate(_BERT_CLEAN_MAP)
+        # Tokens are separated by whitespace, so the case and the accents can be processed on
+        # the whole text.
+        text = unicodedata.normalize('NFD', text.lower())
+        return text.translate(_BERT_STRIP_SPLIT_MAP).split()
+
+    def _tokenize_by_char(self, text):
+        """Tokenizes a piece of text by checking the characters one by one."""
         text = self._clean_text(text)
 
         # This was added on November 1st, 2018 for the multilingual and Chinese
@@ -902,9 +1133,36 @@ class BERTBasicTokenizer():
         return tokens
 
 
-class BERTTokenizer(object):
+_TRIE_END = ''
+
+
+def _build_wordpiece_tries(tokens):
+    """Build the prefix tries of the word-initial and of the continuation ('##') word pieces.
+
+    Each node is a dict from a character to the child node. A node contains the key `_TRIE_END`
+    if the path to it spells a word piece.
+    """
+    initial_trie = {}
+    continuation_trie = {}
+    for token in tokens:
+        pieces = [(initial_trie, token)]
+        if token.startswith('##'):
+            pieces.append((continuation_trie, token[2:]))
+        for node, piece in pieces:
+            if not piece:
+                continue
+            for char in piece:
+                node = node.setdefault(char, {})
+            node[_TRIE_END] = True
+    return initial_trie, continuation_trie
+
+
+class BERTTokenizer(_BatchTokenizer):
     r"""End-to-end tokenization for BERT models.
 
+    The word pieces are matched with a prefix trie built over the vocabulary on first use, and
+    the word pieces of the most recently seen words are memoized.
+
     Parameters
     ----------
     vocab : gluonnlp.Vocab or None, default None
@@ -915,6 +1173,9 @@ class BERTTokenizer(object):
         lower is set to Flase when using the cased model,
         otherwise it is set to True.
     max_input_chars_per_word : int, default 200
+    cache_size : int, default 65536
+        Maximum number of words whose word pieces are memoized in a least recently used cache.
+        Set it to 0 to disable the cache.
 
     Examples
     --------
@@ -925,10 +1186,14 @@ class BERTTokenizer(object):
 
     """
 
-    def __init__(self, vocab, lower=True, max_input_chars_per_word=200):
+    def __init__(self, vocab, lower=True, max_input_chars_per_word=200, cache_size=65536):
         self.vocab = vocab
         self.max_input_chars_per_word = max_input_chars_per_word
         self.basic_tokenizer = BERTBasicTokenizer(lower=lower)
+        self._cache_size = cache_size
+        self._cache = collections.OrderedDict()
+        # Tries of the word-initial pieces and of the continuation pieces without '##'.
+        self._tries = None
 
     def __call__(self, sample):
         """
@@ -949,8 +1214,7 @@ class BERTTokenizer(object):
     def _tokenizer(self, text):
         split_tokens = []
         for token in self.basic_tokenizer(text):
-            for sub_token in self._tokenize_wordpiece(token):
-                split_tokens.append(sub_token)
+            split_tokens.extend(self._tokenize_word(token))
 
         return split_tokens
 
@@ -974,35 +1238,51 @@ class BERTTokenizer(object):
 
         output_tokens = []
         for token in self.basic_tokenizer._whitespace_tokenize(text):
-            chars = list(token)
-            if len(chars) > self.max_input_chars_per_word:
-                output_tokens.append(self.vocab.unknown_token)
-                continue
-            is_bad = False
-            start = 0
-            sub_tokens = []
-            while start < len(chars):
-                end = len(chars)
-                cur_substr = None
-                while start < end:
-                    substr = ''.join(chars[start:end])
-                    if start > 0:
-                        substr = '##' + substr
-                    if substr in self.vocab:
-                        cur_substr = substr
-                        break
-                    end -= 1
-                if cur_substr is None:
-                    is_bad = True
-                    break
-                sub_tokens.append(cur_substr)
-                start = end
-            if is_bad:
-                output_tokens.append(self.vocab.unknown_token)
-            else:
-                output_tokens.extend(sub_tokens)
+            output_tokens.extend(self._tokenize_word(token))
         return output_tokens
 
+    def _tokenize_word(self, token):
+        """Word pieces of a single token, looked up in the cache first."""
+        if self._cache_size <= 0:
+            return self._match_wordpiece(token)
+        sub_tokens = self._cache.pop(token, None)
+        if sub_tokens is None:
+            sub_tokens = self._match_wordpiece(token)
+            if len(self._cache) >= self._cache_size:
+                self._cache.popitem(last=False)
+        self._cache[token] = sub_tokens
+        return sub_tokens
+
+    def _match_wordpiece(self, token):
+        """Greedy longest-match-first search of the word pieces of a single token."""
+        if len(token) > self.max_input_chars_per_word:
+            return [self.vocab.unknown_token]
+        if self._tries is None:
+            self._tries = _build_wordpiece_tries(self.vocab.idx_to_token)
+        initial_trie, continuation_trie = self._tries
+        sub_tokens = []
+        start = 0
+        while start < len(token):
+            node = initial_trie if start == 0 else continuation_trie
+            end = -1
+            for i in range(start, len(token)):
+                node = node.get(token[i])
+                if node is None:
+                    break
+                if _TRIE_END in node:
+                    end = i + 1
+            if end < 0:
+                return [self.vocab.unknown_token]
+            sub_tokens.append(token[start:end] if start == 0 else '##' + token[start:end])
+            start = end
+        return sub_tokens
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_cache'] = collections.OrderedDict()
+        state['_tries'] = None
+        return state
+
     def convert_tokens_to_ids(self, tokens):
         """Converts a sequence of tokens into ids using the vocab."""
         return self.vocab.to_indices(tokens)
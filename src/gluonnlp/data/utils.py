@@ -22,12 +22,15 @@ from __future__ import absolute_import
 from __future__ import print_function
 
 __all__ = [
-    'Counter', 'count_tokens', 'concat_sequence', 'slice_sequence', 'train_valid_split',
-    'line_splitter', 'whitespace_splitter', 'Splitter'
+    'Counter', 'count_tokens', 'count_tokens_parallel', 'concat_sequence', 'slice_sequence',
+    'train_valid_split', 'line_splitter', 'whitespace_splitter', 'Splitter'
 ]
 
 import os
 import collections
+import hashlib
+import heapq
+import multiprocessing
 import zipfile
 import tarfile
 import numpy as np
@@ -36,6 +39,7 @@ from mxnet.gluon.data import SimpleDataset
 from mxnet.gluon.utils import _get_repo_url, download, check_sha1
 
 from .. import _constants as C
+from ..base import _str_types
 
 
 class Counter(collections.Counter):  # pylint: disable=abstract-method
@@ -132,6 +136,160 @@ def count_tokens(tokens, to_lower=False, counter=None):
         return counter
 
 
+def _count_shard(shard, dataset_fn, to_lower):
+    """Count the tokens of a shard, which contains tokens or sequences of tokens."""
+    if dataset_fn is not None:
+        shard = dataset_fn(shard)
+    counter = Counter()
+    for sample in shard:
+        if isinstance(sample, _str_types):
+            sample = [sample]
+        if to_lower:
+            sample = [t.lower() for t in sample]
+        counter.update(sample)
+    return counter
+
+
+def _sketch_indices(tokens, width, depth):
+    """Columns of the tokens in each row of a count-min sketch. The hash of Python strings
+    is salted per process, so the columns are computed from a digest of the tokens."""
+    digests = b''.join(hashlib.sha256(token.encode('utf-8')).digest()[:4 * depth]
+                       for token in tokens)
+    return np.frombuffer(digests, dtype=np.uint32).reshape(-1, depth) % width
+
+
+# Arguments of `count_tokens_parallel`, set in each worker process by the pool initializer
+_worker_count_args = None
+
+
+def _count_worker_initializer(dataset_fn, to_lower, sketch, min_freq):
+    """Initializer of the processes of `count_tokens_parallel`."""
+    global _worker_count_args  # pylint: disable=global-statement
+    _worker_count_args = (dataset_fn, to_lower, sketch, min_freq)
+
+
+def _sketch_worker_fn(shard):
+    """Count the tokens of a shard in a count-min sketch."""
+    dataset_fn, to_lower, sketch, _ = _worker_count_args
+    depth, width = sketch
+    counter = _count_shard(shard, dataset_fn, to_lower)
+    shard_sketch = np.zeros((depth, width), dtype=np.int64)
+    if counter:
+        indices = _sketch_indices(counter.keys(), width, depth)
+        counts = np.fromiter(counter.values(), dtype=np.int64, count=len(counter))
+        for row in range(depth):
+            np.add.at(shard_sketch[row], indices[:, row], counts)
+    return shard_sketch
+
+
+def _count_worker_fn(shard):
+    """Count the tokens of a shard, without the tokens which are estimated to be less frequent
+    than min_freq in the whole corpus."""
+    dataset_fn, to_lower, sketch, min_freq = _worker_count_args
+    counter = _count_shard(shard, dataset_fn, to_lower)
+    if sketch is not None and counter:
+        tokens = list(counter.keys())
+        indices = _sketch_indices(tokens, sketch.shape[1], sketch.shape[0])
+        estimates = sketch[np.arange(sketch.shape[0]), indices].min(axis=1)
+        for token, estimate in zip(tokens, estimates):
+            if estimate < min_freq:
+                del counter[token]
+    return counter
+
+
+def count_tokens_parallel(shards, num_workers=4, dataset_fn=None, to_lower=False, min_freq=1,
+                          max_size=None, sketch_width=0, sketch_depth=4):
+    r"""Counts the tokens of the shards of a corpus with a pool of worker processes.
+
+    Each worker counts whole shards. The partial counters are merged in the current process as
+    they arrive, so that each counter is only sent once between processes. The result can be
+    used to create a :class:`~gluonnlp.Vocab` with the same `min_freq`.
+
+    If `sketch_width` is positive, the shards are read twice. The first pass counts the tokens
+    in a count-min sketch, which over-estimates the frequency of each token in the whole corpus.
+    In the second pass, the workers discard the tokens whose estimate is less than `min_freq`
+    before sending their counters, which removes most of the long tail of a large corpus early.
+
+    `max_size` is applied after all the shards are counted. The count-min sketch only gives
+    upper bounds of the frequencies, so no token can be excluded from the `max_size` most
+    frequent tokens before all its occurrences are counted, and pruning the shards to their own
+    most frequent tokens could drop tokens that are frequent in the whole corpus.
+
+    Examples
+    --------
+    >>> files = glob.glob('wiki/*.txt')  # doctest: +SKIP
+    >>> counter = gluonnlp.data.count_tokens_parallel(
+    ...     files, dataset_fn=gluonnlp.data.CorpusDataset, min_freq=5,
+    ...     sketch_width=2**22)  # doctest: +SKIP
+    >>> vocab = gluonnlp.Vocab(counter, min_freq=5)  # doctest: +SKIP
+
+    Parameters
+    ----------
+    shards : iterable
+        The shards of the corpus, e.g. a DatasetStream of CorpusDataset. Each shard is a
+        sequence of tokens or of sequences of tokens. If `dataset_fn` is specified, the shards
+        are the arguments of `dataset_fn`, e.g. file names, and are loaded in the workers.
+    num_workers : int, default 4
+        The number of worker processes. If 0, the shards are counted in the current process.
+    dataset_fn : callable or None, default None
+        The function used to load each shard in the worker processes. It must be picklable.
+    to_lower : bool, default False
+        Whether to convert the tokens to the lower case.
+    min_freq : int, default 1
+        The tokens less frequent than `min_freq` in the whole corpus are not counted.
+    max_size : int or None, default None
+        If not None, only the `max_size` most frequent tokens are kept, ties being broken in the
+        alphabetical order like in :class:`~gluonnlp.Vocab`. Note that the special tokens of
+        the Vocab which occur in the corpus, e.g. EOS, are counted in `max_size` here but not
+        in the `max_size` of the Vocab.
+    sketch_width : int, default 0
+        The number of columns of the count-min sketch. If 0, no sketch is used. The tokens are
+        only discarded early if `min_freq` is larger than 1.
+    sketch_depth : int, default 4
+        The number of rows of the count-min sketch, at most 8.
+
+    Returns
+    -------
+    The Counter instance of the counts of the tokens in all the shards.
+    """
+    assert 0 < sketch_depth <= 8, 'sketch_depth must be between 1 and 8. Received ' \
+        'sketch_depth={}'.format(sketch_depth)
+    use_sketch = sketch_width > 0 and min_freq > 1
+    if use_sketch:
+        # The shards are iterated twice
+        shards = list(shards)
+    if num_workers <= 0:
+        counter = Counter()
+        for shard in shards:
+            counter.update(_count_shard(shard, dataset_fn, to_lower))
+    else:
+        sketch = None
+        if use_sketch:
+            pool = multiprocessing.Pool(num_workers, initializer=_count_worker_initializer,
+                                        initargs=[dataset_fn, to_lower,
+                                                  (sketch_depth, sketch_width), min_freq])
+            try:
+                sketch = np.zeros((sketch_depth, sketch_width), dtype=np.int64)
+                for shard_sketch in pool.imap_unordered(_sketch_worker_fn, shards):
+                    sketch += shard_sketch
+            finally:
+                pool.terminate()
+        pool = multiprocessing.Pool(num_workers, initializer=_count_worker_initializer,
+                                    initargs=[dataset_fn, to_lower, sketch, min_freq])
+        try:
+            counter = Counter()
+            for shard_counter in pool.imap_unordered(_count_worker_fn, shards):
+                counter.update(shard_counter)
+        finally:
+            pool.terminate()
+    token_freqs = [(token, count) for token, count in counter.items() if count >= min_freq]
+    if max_size is not None and max_size < len(token_freqs):
+        token_freqs = heapq.nsmallest(max_size, token_freqs, key=lambda x: (-x[1], x[0]))
+    if len(token_freqs) < len(counter):
+        counter = Counter(dict(token_freqs))
+    return counter
+
+
 def concat_sequence(sequences):
     """Concatenate sequences of tokens into a single flattened list of tokens.
 
@@ -312,13 +470,43 @@ def _load_pretrained_vocab(name, root=os.path.join('~', '.mxnet', 'models'), cls
         raise ValueError('Downloaded file has different hash. Please try again.')
 
 
+# Vocabularies loaded by _load_vocab_file, shared by the models created in the process
+_vocab_cache = {}
+
+
 def _load_vocab_file(file_path, cls):
-    with open(file_path, 'r') as f:
-        if cls is None:
-            from ..vocab import Vocab
-            cls = Vocab
+    """Load a json vocabulary file whose content was verified.
 
-        return cls.from_json(f.read())
+    The first time it is loaded, the vocabulary is also saved to a binary file next to it, which
+    is loaded lazily afterwards. The vocabulary instances are cached.
+    """
+    if cls is None:
+        from ..vocab import Vocab
+        cls = Vocab
+    file_path = os.path.abspath(file_path)
+    key = (file_path, cls)
+    if key in _vocab_cache:
+        return _vocab_cache[key]
+    binary_path = file_path + '.bin'
+    vocab = None
+    if os.path.exists(binary_path):
+        try:
+            vocab = cls.load_binary(binary_path)
+        except ValueError:
+            vocab = None
+    if vocab is None:
+        with open(file_path, 'r') as f:
+            vocab = cls.from_json(f.read())
+        tmp_path = '{}.{}.tmp'.format(binary_path, os.getpid())
+        try:
+            vocab.save_binary(tmp_path)
+            os.rename(tmp_path, binary_path)
+        except (OSError, ValueError):
+            # E.g. the directory is read-only, or the tokens are not str
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    _vocab_cache[key] = vocab
+    return vocab
 
 
 def _get_home_dir():
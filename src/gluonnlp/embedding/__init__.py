@@ -21,7 +21,8 @@
 """Word embeddings."""
 
 from .token_embedding import *
+from .index import *
 
 from . import evaluation
 
-__all__ = (token_embedding.__all__ + ['evaluation'])
+__all__ = (token_embedding.__all__ + index.__all__ + ['evaluation'])
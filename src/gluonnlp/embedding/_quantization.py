@@ -0,0 +1,165 @@
+# coding: utf-8
+
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Quantized storage of embedding matrices."""
+
+import numpy as np
+
+_BLOCK_ROWS = 65536
+
+
+class _QuantizedVectors(object):
+    """Base class of quantized embedding matrices.
+
+    Rows are dequantized on indexing, and the whole matrix by numpy.asarray.
+    """
+    method = None
+    _array_names = ()
+
+    def __init__(self, **arrays):
+        for name in self._array_names:
+            setattr(self, '_' + name, arrays[name])
+
+    @property
+    def shape(self):
+        raise NotImplementedError
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, '_' + name).nbytes for name in self._array_names)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, indices):
+        raise NotImplementedError
+
+    def __array__(self, dtype=None):
+        vecs = np.empty(self.shape, dtype=np.float32)
+        for start in range(0, len(self), _BLOCK_ROWS):
+            vecs[start:start + _BLOCK_ROWS] = self[start:start + _BLOCK_ROWS]
+        return vecs if dtype is None else vecs.astype(dtype, copy=False)
+
+    def arrays(self):
+        """The arrays holding the quantized matrix."""
+        return {name: getattr(self, '_' + name) for name in self._array_names}
+
+
+class _Int8Vectors(_QuantizedVectors):
+    """Rows scalar quantized to int8 with a float32 scale per row."""
+    method = 'int8'
+    _array_names = ('codes', 'scales')
+
+    @classmethod
+    def quantize(cls, vecs):
+        codes = np.empty(vecs.shape, dtype=np.int8)
+        scales = np.empty((len(vecs), ), dtype=np.float32)
+        for start in range(0, len(vecs), _BLOCK_ROWS):
+            block = np.asarray(vecs[start:start + _BLOCK_ROWS], dtype=np.float32)
+            block_scales = np.abs(block).max(axis=1) / 127
+            codes[start:start + len(block)] = np.rint(
+                block / np.where(block_scales > 0, block_scales, 1)[:, None])
+            scales[start:start + len(block)] = block_scales
+        return cls(codes=codes, scales=scales)
+
+    @property
+    def shape(self):
+        return self._codes.shape
+
+    def __getitem__(self, indices):
+        return self._codes[indices].astype(np.float32) * self._scales[indices][..., None]
+
+
+class _ProductQuantizedVectors(_QuantizedVectors):
+    """Rows split into subvectors that are each replaced by the closest of num_centroids
+    centroids learned with k-means."""
+    method = 'pq'
+    _array_names = ('codes', 'codebooks')
+
+    @classmethod
+    def quantize(cls, vecs, num_subvectors, num_centroids=256, num_iters=10, seed=0):
+        vec_len = vecs.shape[1]
+        if vec_len % num_subvectors:
+            raise ValueError('The embedding dimension {} is not divisible by num_subvectors {}.'
+                             .format(vec_len, num_subvectors))
+        if not 0 < num_centroids <= 256:
+            raise ValueError('num_centroids must be between 1 and 256, got {}.'
+                             .format(num_centroids))
+        num_centroids = min(num_centroids, len(vecs))
+        rng = np.random.RandomState(seed)
+        num_samples = min(len(vecs), 64 * num_centroids)
+        sample = np.asarray(vecs[np.sort(rng.choice(len(vecs), num_samples, replace=False))],
+                            dtype=np.float32).reshape((num_samples, num_subvectors, -1))
+
+        codebooks = np.empty((num_subvectors, num_centroids, sample.shape[2]), dtype=np.float32)
+        for i in range(num_subvectors):
+            subvecs = sample[:, i]
+            centroids = subvecs[rng.choice(len(subvecs), num_centroids, replace=False)]
+            for _ in range(num_iters):
+                assignment = cls._encode_subvectors(subvecs, centroids)
+                counts = np.bincount(assignment, minlength=num_centroids)
+                sums = np.stack([np.bincount(assignment, weights=subvecs[:, j],
+                                             minlength=num_centroids)
+                                 for j in range(subvecs.shape[1])], axis=1)
+                # Keep the previous centroid of empty clusters
+                nonempty = counts > 0
+                centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+            codebooks[i] = centroids
+
+        codes = np.empty((len(vecs), num_subvectors), dtype=np.uint8)
+        for start in range(0, len(vecs), _BLOCK_ROWS):
+            block = np.asarray(vecs[start:start + _BLOCK_ROWS], dtype=np.float32)
+            block = block.reshape((len(block), num_subvectors, -1))
+            for i in range(num_subvectors):
+                codes[start:start + len(block), i] = cls._encode_subvectors(block[:, i],
+                                                                            codebooks[i])
+        return cls(codes=codes, codebooks=codebooks)
+
+    @staticmethod
+    def _encode_subvectors(subvecs, centroids):
+        distances = (centroids * centroids).sum(axis=1) - 2 * subvecs.dot(centroids.T)
+        return np.argmin(distances, axis=1)
+
+    @property
+    def shape(self):
+        return (self._codes.shape[0], self._codebooks.shape[0] * self._codebooks.shape[2])
+
+    def __getitem__(self, indices):
+        codes = self._codes[indices]
+        vecs = self._codebooks[np.arange(self._codebooks.shape[0]), codes.astype(np.int64)]
+        return vecs.reshape(codes.shape[:-1] + (-1, ))
+
+
+_QUANTIZATION_METHODS = {cls.method: cls for cls in [_Int8Vectors, _ProductQuantizedVectors]}
+
+
+def _rankdata(values):
+    """Ranks of values, averaged over ties."""
+    values = np.asarray(values, dtype=np.float64)
+    sorter = np.argsort(values, kind='mergesort')
+    inverse = np.empty_like(sorter)
+    inverse[sorter] = np.arange(len(values))
+    sorted_values = values[sorter]
+    is_first = np.concatenate(([True], sorted_values[1:] != sorted_values[:-1]))
+    group = np.cumsum(is_first)[inverse]
+    group_bounds = np.concatenate((np.flatnonzero(is_first), [len(values)]))
+    return 0.5 * (group_bounds[group] + group_bounds[group - 1] + 1)
+
+
+def _spearman_correlation(x, y):
+    return float(np.corrcoef(_rankdata(x), _rankdata(y))[0, 1])
@@ -0,0 +1,215 @@
+# coding: utf-8
+
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Nearest neighbour index for embedding vectors."""
+
+__all__ = ['EmbeddingIndex']
+
+import numpy as np
+from mxnet import nd
+
+
+def _normalize(vecs, eps):
+    vecs = np.asarray(vecs, dtype=np.float32)
+    norms = np.sqrt((vecs * vecs).sum(axis=-1, keepdims=True))
+    return vecs / (norms + eps)
+
+
+def _merge_topk(best_scores, best_ids, scores, ids, k):
+    """Merge candidate scores of shape (n, m) and their row ids into the running top-k."""
+    all_scores = np.concatenate((best_scores, scores), axis=1)
+    all_ids = np.concatenate((best_ids, np.broadcast_to(ids, scores.shape)), axis=1)
+    if all_scores.shape[1] > k:
+        top = np.argpartition(-all_scores, k - 1, axis=1)[:, :k]
+        all_scores = np.take_along_axis(all_scores, top, axis=1)
+        all_ids = np.take_along_axis(all_ids, top, axis=1)
+    return all_scores, all_ids
+
+
+def _flatten_exclude(exclude):
+    """Flatten per query lists of excluded rows to arrays of query and row indices."""
+    queries = np.repeat(np.arange(len(exclude)), [len(rows) for rows in exclude])
+    rows = np.concatenate([np.asarray(rows, dtype=np.int64) for rows in exclude] +
+                          [np.zeros(0, dtype=np.int64)])
+    return queries, rows
+
+
+class EmbeddingIndex(object):
+    """Cosine similarity nearest neighbour index over the rows of an embedding matrix.
+
+    By default the index is exact: queries are scored against blocks of the normalized
+    embedding matrix and the top-k rows are kept across blocks. If `num_lists` is set, an
+    approximate inverted file index is built instead. The rows are clustered into `num_lists`
+    lists with spherical k-means and a query is only scored against the rows of the `num_probes`
+    lists with the most similar centroids. Larger `num_probes` trade speed for recall.
+
+    The index holds a normalized copy of the embedding matrix. It does not reflect later updates
+    of the embedding matrix.
+
+    Parameters
+    ----------
+    idx_to_vec : mxnet.ndarray.NDArray or numpy.ndarray
+        Embedding matrix of shape (num_tokens, vec_len).
+    num_lists : int or None, default None
+        Number of lists of the approximate index. If None, the index is exact.
+    num_probes : int, default 8
+        Number of lists searched per query by the approximate index.
+    num_iters : int, default 10
+        Number of k-means iterations used to build the approximate index.
+    seed : int, default 0
+        Random seed for the k-means initialization.
+    block_size : int, default 16777216
+        Maximum number of similarity scores computed at once by the exact index.
+    eps : float, default 1e-10
+        A small constant for numerical stability.
+    """
+
+    def __init__(self, idx_to_vec, num_lists=None, num_probes=8, num_iters=10, seed=0,
+                 block_size=16777216, eps=1e-10):
+        if isinstance(idx_to_vec, nd.NDArray):
+            idx_to_vec = idx_to_vec.asnumpy()
+        if idx_to_vec.ndim != 2:
+            raise ValueError('idx_to_vec must be 2-dimensional, got shape {}.'
+                             .format(idx_to_vec.shape))
+        self._num_probes = num_probes
+        self._block_size = block_size
+        self._eps = eps
+        self._vecs = _normalize(idx_to_vec, eps)
+        self._centroids = None
+        self._list_offsets = None
+        self._ids = None
+        self._positions = None
+        if num_lists:
+            self._build_lists(min(num_lists, len(self._vecs)), num_iters, seed)
+
+    def __len__(self):
+        return len(self._vecs)
+
+    @property
+    def approximate(self):
+        """Whether the index is approximate."""
+        return self._centroids is not None
+
+    def _nearest_centroids(self, vecs):
+        block_rows = self._block_rows(len(self._centroids))
+        return np.concatenate([
+            np.argmax(vecs[start:start + block_rows].dot(self._centroids.T), axis=1)
+            for start in range(0, len(vecs), block_rows)])
+
+    def _build_lists(self, num_lists, num_iters, seed):
+        rng = np.random.RandomState(seed)
+        num_samples = min(len(self._vecs), 64 * num_lists)
+        sample = self._vecs[np.sort(rng.choice(len(self._vecs), num_samples, replace=False))]
+        self._centroids = sample[rng.choice(num_samples, num_lists, replace=False)]
+        for _ in range(num_iters):
+            assignment = self._nearest_centroids(sample)
+            sums = np.stack([np.bincount(assignment, weights=sample[:, j], minlength=num_lists)
+                             for j in range(sample.shape[1])], axis=1)
+            # Keep the previous centroid of empty lists
+            nonempty = np.bincount(assignment, minlength=num_lists) > 0
+            self._centroids[nonempty] = _normalize(sums[nonempty], self._eps)
+
+        assignment = self._nearest_centroids(self._vecs)
+        # Store the rows of every list contiguously
+        self._ids = np.argsort(assignment, kind='mergesort')
+        self._positions = np.empty_like(self._ids)
+        self._positions[self._ids] = np.arange(len(self._ids))
+        self._vecs = self._vecs[self._ids]
+        self._list_offsets = np.concatenate(
+            ([0], np.cumsum(np.bincount(assignment, minlength=num_lists))))
+
+    def _block_rows(self, num_queries):
+        return max(1, self._block_size // max(num_queries, 1))
+
+    def search(self, vecs, k=10, exclude=None):
+        """Find the rows most similar to query vectors.
+
+        Parameters
+        ----------
+        vecs : mxnet.ndarray.NDArray or numpy.ndarray
+            Query vectors of shape (num_queries, vec_len).
+        k : int, default 10
+            Number of neighbours per query.
+        exclude : list of list of int, optional
+            Row indices that are excluded from the neighbours of each query.
+
+        Returns
+        -------
+        numpy.ndarray
+            Cosine similarities of the neighbours, of shape (num_queries, k) in descending order.
+            Scores are -inf if fewer than k rows can be returned.
+        numpy.ndarray
+            Row indices of the neighbours, of shape (num_queries, k). Indices are -1 if fewer
+            than k rows can be returned.
+        """
+        if isinstance(vecs, nd.NDArray):
+            vecs = vecs.asnumpy()
+        queries = _normalize(vecs, self._eps).reshape((-1, self._vecs.shape[1]))
+        if exclude is None:
+            exclude = [()] * len(queries)
+        if len(exclude) != len(queries):
+            raise ValueError('exclude must have one entry per query vector.')
+
+        best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        best_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        exclude_queries, exclude_rows = _flatten_exclude(exclude)
+        if self.approximate:
+            self._search_lists(queries, k, exclude_queries, exclude_rows, best_scores, best_ids)
+        else:
+            block_rows = self._block_rows(len(queries))
+            for start in range(0, len(self._vecs), block_rows):
+                block = self._vecs[start:start + block_rows]
+                scores = queries.dot(block.T)
+                excluded = (exclude_rows >= start) & (exclude_rows < start + len(block))
+                scores[exclude_queries[excluded], exclude_rows[excluded] - start] = -np.inf
+                best_scores, best_ids = _merge_topk(
+                    best_scores, best_ids, scores, np.arange(start, start + len(block)), k)
+
+        order = np.argsort(-best_scores, axis=1, kind='mergesort')
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_ids = np.take_along_axis(best_ids, order, axis=1)
+        best_ids[best_scores == -np.inf] = -1
+        return best_scores, best_ids
+
+    def _search_lists(self, queries, k, exclude_queries, exclude_rows, best_scores, best_ids):
+        num_probes = min(self._num_probes, len(self._centroids))
+        probes = np.argpartition(-queries.dot(self._centroids.T), num_probes - 1,
+                                 axis=1)[:, :num_probes].ravel()
+        probe_queries = np.repeat(np.arange(len(queries)), num_probes)
+        order = np.argsort(probes, kind='mergesort')
+        probes, probe_queries = probes[order], probe_queries[order]
+        bounds = np.flatnonzero(np.diff(probes)) + 1
+
+        # Positions of excluded rows in the list-ordered matrix
+        exclude_positions = self._positions[exclude_rows]
+
+        # Score the queries that probe a list against all its rows at once
+        for queries_idx, probe in zip(np.split(probe_queries, bounds),
+                                      probes[np.concatenate(([0], bounds))]):
+            start, end = self._list_offsets[probe], self._list_offsets[probe + 1]
+            if start == end:
+                continue
+            scores = queries[queries_idx].dot(self._vecs[start:end].T)
+            excluded = (exclude_positions >= start) & (exclude_positions < end)
+            if excluded.any():
+                rows = np.searchsorted(queries_idx, exclude_queries[excluded])
+                rows = np.minimum(rows, len(queries_idx) - 1)
+                matched = queries_idx[rows] == exclude_queries[excluded]
+                scores[rows[matched], exclude_positions[excluded][matched] - start] = -np.inf
+            best_scores[queries_idx], best_ids[queries_idx] = _merge_topk(
+                best_scores[queries_idx], best_ids[queries_idx], scores, self._ids[start:end], k)
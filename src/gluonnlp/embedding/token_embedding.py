@@ -28,15 +28,23 @@ __all__ = [
     'FastText', 'Word2Vec'
 ]
 
+import hashlib
 import io
 import logging
+import multiprocessing
 import os
+import struct
 import warnings
+import zipfile
 
 import numpy as np
 from mxnet import nd, registry, cpu
 from mxnet.gluon.utils import download, check_sha1, _get_repo_file_url
 
+from ._quantization import (_QUANTIZATION_METHODS, _BLOCK_ROWS, _Int8Vectors,
+                            _ProductQuantizedVectors, _QuantizedVectors, _spearman_correlation)
+from .evaluation import WordEmbeddingSimilarity
+from .index import EmbeddingIndex
 from .. import _constants as C
 from ..data.utils import DefaultLookupDict, _get_home_dir
 from ..model.train import FasttextEmbeddingModel
@@ -138,6 +146,181 @@ def list_sources(embedding_name=None):
                 for embedding_name, embedding_cls in registry.get_registry(TokenEmbedding).items()}
 
 
+def _mmap_npz_array(file_path, name):
+    """Memory-map an array stored without compression in a .npz file."""
+    with zipfile.ZipFile(file_path) as zf:
+        info = zf.getinfo(name + '.npy')
+    if info.compress_type != zipfile.ZIP_STORED:
+        raise ValueError('Array {} of {} is compressed and cannot be memory-mapped. Use '
+                         'serialize(file_path, compress=False).'.format(name, file_path))
+    with io.open(file_path, 'rb') as f:
+        f.seek(info.header_offset)
+        local_header = f.read(30)
+        # The local header may have a different extra field than the central directory
+        name_len, extra_len = struct.unpack('<HH', local_header[26:30])
+        f.seek(info.header_offset + 30 + name_len + extra_len)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    return np.memmap(file_path, dtype=dtype, mode='r', offset=offset, shape=shape,
+                     order='F' if fortran_order else 'C')
+
+
+_MIN_TXT_CHUNK_SIZE = 8 * 1024 * 1024
+_TXT_CACHE_SUFFIX = '.cache.npz'
+
+
+def _txt_chunk_ranges(file_path, num_chunks):
+    """Split a file into at most num_chunks byte ranges aligned on line boundaries."""
+    size = os.path.getsize(file_path)
+    bounds = [0]
+    with io.open(file_path, 'rb') as f:
+        for i in range(1, num_chunks):
+            pos = size * i // num_chunks
+            if pos <= bounds[-1]:
+                continue
+            f.seek(pos - 1)
+            f.readline()
+            if f.tell() >= size:
+                break
+            bounds.append(f.tell())
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _count_lines(file_path, end):
+    """Count the lines of a text file before the byte offset end."""
+    num_lines = 0
+    with io.open(file_path, 'rb') as f:
+        while f.tell() < end:
+            num_lines += f.read(min(1048576, end - f.tell())).count(b'\n')
+    return num_lines
+
+
+def _parse_embedding_txt_chunk(args):
+    """Parse the lines in a byte range of a pre-trained token embedding text file.
+
+    Returns the number of lines, and for every decodable line its token, line number and
+    number of vector elements, together with the flattened vector elements and the line numbers
+    that failed to decode. Line numbers are relative to the beginning of the range. Raises
+    ValueError with the line number in the file if a vector element is not a float.
+    """
+    file_path, start, end, elem_delim, encoding = args
+    with io.open(file_path, 'rb') as f:
+        f.seek(start)
+        lines = f.read(end - start).split(b'\n')
+    if not lines[-1]:
+        lines.pop()
+
+    tokens, line_nums, lens, elems, elem_line_nums, failed_line_nums = [], [], [], [], [], []
+    for line_num, line in enumerate(lines):
+        try:
+            line = line.decode(encoding)
+        except ValueError:
+            failed_line_nums.append(line_num)
+            continue
+        token, delim, line = line.rstrip().partition(elem_delim)
+        tokens.append(token)
+        line_nums.append(line_num)
+        if delim:
+            lens.append(line.count(elem_delim) + 1)
+            elems.append(line)
+            elem_line_nums.append(line_num)
+        else:
+            lens.append(0)
+
+    lens = np.array(lens, dtype=np.int64)
+    if elems:
+        with warnings.catch_warnings():
+            # Malformed input is reported through the element count below
+            warnings.simplefilter('ignore', DeprecationWarning)
+            vecs = np.fromstring(elem_delim.join(elems), dtype=np.float64, sep=elem_delim)
+        if vecs.size != lens.sum():
+            # np.fromstring stops at the first malformed element. Parse the lines one by one to
+            # report the line of the malformed element.
+            vecs = []
+            for line_num, line in zip(elem_line_nums, elems):
+                try:
+                    vecs.extend(float(elem) for elem in line.split(elem_delim))
+                except ValueError as e:
+                    raise ValueError('line {} in {}: {}'.format(
+                        _count_lines(file_path, start) + line_num, file_path, e))
+            vecs = np.array(vecs, dtype=np.float64)
+    else:
+        vecs = np.zeros((0, ), dtype=np.float64)
+    return (len(lines), tokens, line_nums, lens, vecs.astype(np.float32), failed_line_nums)
+
+
+def _parse_embedding_txt(file_path, elem_delim, encoding, num_workers):
+    """Parse a pre-trained token embedding text file in parallel chunks."""
+    num_chunks = min(4 * num_workers, os.path.getsize(file_path) // _MIN_TXT_CHUNK_SIZE)
+    tasks = [(file_path, start, end, elem_delim, encoding)
+             for start, end in _txt_chunk_ranges(file_path, max(num_chunks, 1))]
+    if num_workers > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(num_workers)
+        try:
+            results = pool.map(_parse_embedding_txt_chunk, tasks)
+        finally:
+            pool.terminate()
+    else:
+        results = [_parse_embedding_txt_chunk(task) for task in tasks]
+
+    tokens, line_nums, failed_line_nums = [], [], []
+    line_offset = 0
+    for num_lines, chunk_tokens, chunk_line_nums, _, _, chunk_failed_line_nums in results:
+        tokens.extend(chunk_tokens)
+        line_nums.extend(line_offset + line_num for line_num in chunk_line_nums)
+        failed_line_nums.extend(line_offset + line_num for line_num in chunk_failed_line_nums)
+        line_offset += num_lines
+    lens = np.concatenate([result[3] for result in results])
+    vecs = np.concatenate([result[4] for result in results])
+    return tokens, line_nums, lens, vecs, failed_line_nums
+
+
+def _file_sha1(file_path):
+    sha1 = hashlib.sha1()
+    with io.open(file_path, 'rb') as f:
+        for data in iter(lambda: f.read(1048576), b''):
+            sha1.update(data)
+    return sha1.hexdigest()
+
+
+def _load_embedding_txt_cache(cache_path, cache_key):
+    """Load a parsed embedding text file cached by _save_embedding_txt_cache."""
+    try:
+        with np.load(cache_path) as npz_dict:
+            if str(npz_dict['cache_key']) != cache_key:
+                return None
+            line_nums = npz_dict['line_nums'].tolist()
+            tokens = npz_dict['tokens'].tobytes().decode('utf8').split('\n') if line_nums \
+                else []
+            return (tokens, line_nums, npz_dict['lens'], npz_dict['vecs'],
+                    npz_dict['failed_line_nums'].tolist())
+    except (IOError, OSError, KeyError, ValueError):
+        return None
+
+
+def _save_embedding_txt_cache(cache_path, cache_key, parsed):
+    """Cache a parsed embedding text file. Tokens are stored newline-joined as utf8 bytes, as
+    tokens parsed from lines cannot contain newlines."""
+    tokens, line_nums, lens, vecs, failed_line_nums = parsed
+    tmp_path = '{}.{}.tmp'.format(cache_path, os.getpid())
+    try:
+        with io.open(tmp_path, 'wb') as f:
+            np.savez(f, cache_key=np.array(cache_key),
+                     tokens=np.frombuffer('\n'.join(tokens).encode('utf8'), dtype=np.uint8),
+                     line_nums=np.array(line_nums, dtype=np.int64), lens=lens, vecs=vecs,
+                     failed_line_nums=np.array(failed_line_nums, dtype=np.int64))
+        os.rename(tmp_path, cache_path)
+    except (IOError, OSError) as e:
+        warnings.warn('Failed to cache parsed embedding file at {}: {}'.format(cache_path, e))
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
 class TokenEmbedding(object):
     """Token embedding base class.
 
@@ -192,6 +375,9 @@ class TokenEmbedding(object):
             self._token_to_idx = {}
         self._token_to_idx.update((token, idx) for idx, token in enumerate(self._idx_to_token))
         self._idx_to_vec = None
+        # Memory-mapped or quantized vectors that are read by row until idx_to_vec is accessed
+        self._idx_to_vec_lazy = None
+        self._index = None
 
     @staticmethod
     def _get_file_url(cls_name, source_file_hash, source):
@@ -218,11 +404,11 @@ class TokenEmbedding(object):
         return pretrained_file_path
 
     def _load_embedding(self, pretrained_file_path, elem_delim,
-                        encoding='utf8'):
+                        encoding='utf8', num_workers=0, cache=False):
         """Load embedding vectors from a pre-trained token embedding file.
 
         Both text files and TokenEmbedding serialization files are supported.
-        elem_delim and encoding are ignored for non-text files.
+        elem_delim, encoding, num_workers and cache are ignored for non-text files.
 
         For every unknown token, if its representation `self.unknown_token` is encountered in the
         pre-trained token embedding file, index 0 of `self.idx_to_vec` maps to the pre-trained token
@@ -249,9 +435,11 @@ class TokenEmbedding(object):
         else:
             self._load_embedding_txt(
                 pretrained_file_path=pretrained_file_path,
-                elem_delim=elem_delim, encoding=encoding)
+                elem_delim=elem_delim, encoding=encoding, num_workers=num_workers,
+                cache=cache)
 
-    def _load_embedding_txt(self, pretrained_file_path, elem_delim, encoding='utf8'):
+    def _load_embedding_txt(self, pretrained_file_path, elem_delim, encoding='utf8',
+                            num_workers=0, cache=False):
         """Load embedding vectors from a pre-trained token embedding file.
 
         For every unknown token, if its representation `self.unknown_token` is encountered in the
@@ -261,57 +449,80 @@ class TokenEmbedding(object):
 
         If a token is encountered multiple times in the pre-trained text embedding file, only the
         first-encountered token embedding vector will be loaded and the rest will be skipped.
+
+        If `num_workers` is larger than 1, large files are split into chunks of lines that are
+        parsed by `num_workers` processes. If `cache` is True, the parsed file is cached next to
+        it and reused as long as the sha1 hash of the file, `elem_delim` and `encoding` are
+        unchanged.
         """
 
+        parsed = None
+        if cache:
+            cache_path = pretrained_file_path + _TXT_CACHE_SUFFIX
+            cache_key = '{} {!r} {}'.format(_file_sha1(pretrained_file_path), elem_delim,
+                                            encoding)
+            if os.path.isfile(cache_path):
+                parsed = _load_embedding_txt_cache(cache_path, cache_key)
+        if parsed is None:
+            parsed = _parse_embedding_txt(pretrained_file_path, elem_delim, encoding,
+                                          num_workers)
+            if cache:
+                _save_embedding_txt_cache(cache_path, cache_key, parsed)
+        tokens, line_nums, lens, all_elems, failed_line_nums = parsed
+
+        for line_num in failed_line_nums:
+            warnings.warn('line {} in {}: failed to decode. Skipping.'
+                          .format(line_num, pretrained_file_path))
+
+        offsets = np.concatenate(([0], np.cumsum(lens)))
         vec_len = None
-        all_elems = []
-        tokens = set()
+        loaded_tokens = []
+        loaded_rows = []
         loaded_unknown_vec = None
-        with io.open(pretrained_file_path, 'rb') as f:
-            for line_num, line in enumerate(f):
-                try:
-                    line = line.decode(encoding)
-                except ValueError:
-                    warnings.warn('line {} in {}: failed to decode. Skipping.'
-                                  .format(line_num, pretrained_file_path))
-                    continue
-
-                elems = line.rstrip().split(elem_delim)
-
-                assert len(elems) > 1, 'line {} in {}: unexpected data format.'.format(
-                    line_num, pretrained_file_path)
-
-                token, elems = elems[0], [float(i) for i in elems[1:]]
-
-                if token == self.unknown_token and loaded_unknown_vec is None:
-                    loaded_unknown_vec = elems
-                    tokens.add(self.unknown_token)
-                elif token in tokens:
-                    warnings.warn('line {} in {}: duplicate embedding found for '
-                                  'token "{}". Skipped.'.format(line_num, pretrained_file_path,
-                                                                token))
-                elif len(elems) == 1 and line_num == 0:
-                    warnings.warn('line {} in {}: skipped likely header line.'
-                                  .format(line_num, pretrained_file_path))
+        seen_tokens = set()
+        for row, (token, line_num, num_elems) in enumerate(zip(tokens, line_nums,
+                                                               lens.tolist())):
+            assert num_elems > 0, 'line {} in {}: unexpected data format.'.format(
+                line_num, pretrained_file_path)
+
+            if token == self.unknown_token and loaded_unknown_vec is None:
+                loaded_unknown_vec = all_elems[offsets[row]:offsets[row + 1]]
+                seen_tokens.add(self.unknown_token)
+            elif token in seen_tokens:
+                warnings.warn('line {} in {}: duplicate embedding found for '
+                              'token "{}". Skipped.'.format(line_num, pretrained_file_path,
+                                                            token))
+            elif num_elems == 1 and line_num == 0:
+                warnings.warn('line {} in {}: skipped likely header line.'
+                              .format(line_num, pretrained_file_path))
+            else:
+                if not vec_len:
+                    vec_len = num_elems
                 else:
-                    if not vec_len:
-                        vec_len = len(elems)
-                        if self.unknown_token:
-                            # Reserve a vector slot for the unknown token at the very beggining
-                            # because the unknown token index is 0.
-                            all_elems.extend([0] * vec_len)
-                    else:
-                        assert len(elems) == vec_len, \
-                            'line {} in {}: found vector of inconsistent dimension for token ' \
-                            '"{}". expected dim: {}, found: {}'.format(line_num,
-                                                                       pretrained_file_path,
-                                                                       token, vec_len, len(elems))
-                    all_elems.extend(elems)
-                    self._idx_to_token.append(token)
-                    self._token_to_idx[token] = len(self._idx_to_token) - 1
-                    tokens.add(token)
-
-        self._idx_to_vec = nd.array(all_elems).reshape((-1, vec_len))
+                    assert num_elems == vec_len, \
+                        'line {} in {}: found vector of inconsistent dimension for token ' \
+                        '"{}". expected dim: {}, found: {}'.format(line_num,
+                                                                   pretrained_file_path,
+                                                                   token, vec_len, num_elems)
+                loaded_tokens.append(token)
+                loaded_rows.append(row)
+                seen_tokens.add(token)
+
+        self._token_to_idx.update(
+            (token, idx) for idx, token in enumerate(loaded_tokens, len(self._idx_to_token)))
+        self._idx_to_token.extend(loaded_tokens)
+
+        # All loaded vectors have vec_len elements, so they are rows of a sliding window view
+        windows = np.lib.stride_tricks.as_strided(
+            all_elems, shape=(all_elems.size - vec_len + 1, vec_len),
+            strides=(all_elems.itemsize, all_elems.itemsize), writeable=False)
+        idx_to_vec = windows[offsets[loaded_rows]]
+        if self.unknown_token:
+            # Reserve a vector slot for the unknown token at the very beggining
+            # because the unknown token index is 0.
+            idx_to_vec = np.concatenate((np.zeros((1, vec_len), dtype=idx_to_vec.dtype),
+                                         idx_to_vec))
+        self._idx_to_vec = nd.array(idx_to_vec)
 
         if self.unknown_token:
             if loaded_unknown_vec is None:
@@ -411,11 +622,24 @@ class TokenEmbedding(object):
         -------
         mxnet.ndarray.NDArray:
             For all the indexed tokens in this embedding, this NDArray maps
-            each token's index to an embedding vector.
+            each token's index to an embedding vector. If the vectors are
+            memory-mapped or quantized, they are loaded or dequantized into the
+            NDArray when it is first accessed.
 
         """
+        if self._idx_to_vec is None and self._idx_to_vec_lazy is not None:
+            self._idx_to_vec = nd.array(self._idx_to_vec_lazy)
+            self._idx_to_vec_lazy = None
         return self._idx_to_vec
 
+    def _lookup_indices(self, indices):
+        """Look up the vectors of token indices as a 2-D NDArray. Only the requested rows of
+        memory-mapped or quantized vectors are read."""
+        if self._idx_to_vec is None and self._idx_to_vec_lazy is not None:
+            return nd.array(self._idx_to_vec_lazy[np.asarray(indices, dtype=np.int64)])
+        return nd.Embedding(nd.array(indices), self.idx_to_vec, self.idx_to_vec.shape[0],
+                            self.idx_to_vec.shape[1])
+
     @property
     def unknown_token(self):
         """Unknown token representation.
@@ -530,29 +754,34 @@ class TokenEmbedding(object):
             tokens = [tokens]
 
         if self.unknown_lookup is not None:
-            if self.idx_to_vec is None:
+            if self._idx_to_vec is None and self._idx_to_vec_lazy is None:
                 # May raise KeyError, but we cannot fallback to idx_to_vec's
                 # unknown vector, as idx_to_vec has not been initialized yet.
                 # Cannot initialize it, as we don't know the dimension.
                 vecs = self.unknown_lookup[tokens]
             else:
-                vecs = [
-                    self.idx_to_vec[self.token_to_idx[token]] if
-                    (token in self.token_to_idx
-                     or token not in self.unknown_lookup) else
-                    self.unknown_lookup[token] for token in tokens]
-                vecs = nd.stack(*vecs, axis=0)
+                # Look up all tokens that are not indexed but known to unknown_lookup in one
+                # batch, and overwrite their rows of the indexed vectors.
+                indices, lookup_rows, lookup_tokens = [], [], []
+                for row, token in enumerate(tokens):
+                    if token not in self._token_to_idx and token in self.unknown_lookup:
+                        indices.append(C.UNK_IDX)
+                        lookup_rows.append(row)
+                        lookup_tokens.append(token)
+                    else:
+                        indices.append(self._token_to_idx[token])
+                vecs = self._lookup_indices(indices)
+                if lookup_tokens:
+                    vecs[nd.array(lookup_rows)] = self.unknown_lookup[lookup_tokens]
         else:
             indices = [self._token_to_idx[token] for token in tokens]
-            vecs = nd.Embedding(
-                nd.array(indices), self.idx_to_vec, self.idx_to_vec.shape[0],
-                self.idx_to_vec.shape[1])
+            vecs = self._lookup_indices(indices)
 
         return vecs[0] if to_reduce else vecs
 
     def _check_vector_update(self, tokens, new_embedding):
         """Check that tokens and embedding are in the format for __setitem__."""
-        assert self._idx_to_vec is not None, '`idx_to_vec` has not been initialized.'
+        assert self.idx_to_vec is not None, '`idx_to_vec` has not been initialized.'
 
         if not isinstance(tokens, (list, tuple)) or len(tokens) == 1:
             assert isinstance(new_embedding, nd.NDArray) and len(new_embedding.shape) in [1, 2], \
@@ -593,7 +822,7 @@ class TokenEmbedding(object):
         if not isinstance(tokens, (list, tuple)):
             tokens = [tokens]
         if ((self.allow_extend or all(t in self.token_to_idx for t in tokens))
-                and self._idx_to_vec is None):
+                and self.idx_to_vec is None):
             # Initialize self._idx_to_vec
             assert C.UNK_IDX == 0
             self._idx_to_vec = self._init_unknown_vec(
@@ -638,6 +867,216 @@ class TokenEmbedding(object):
                                     'specified.').format(token))
 
         self._idx_to_vec[nd.array(indices)] = new_embedding
+        self._index = None
+
+    def build_index(self, num_lists=None, num_probes=8, **kwargs):
+        """Builds the nearest neighbour index used by `most_similar` and `analogy`.
+
+        If no index is built, `most_similar` and `analogy` build an exact index on first use. The
+        index is discarded when embedding vectors are updated via `__setitem__`, but it does not
+        reflect in-place modifications of `idx_to_vec`.
+
+        Parameters
+        ----------
+        num_lists : int or None, default None
+            Number of lists of an approximate inverted file index. If None, the index is exact.
+        num_probes : int, default 8
+            Number of lists searched per query by the approximate index.
+        kwargs : dict
+            All other keyword arguments are passed to the EmbeddingIndex initializer.
+
+        Returns
+        -------
+        instance of :class:`gluonnlp.embedding.EmbeddingIndex`
+            The nearest neighbour index.
+        """
+        if self._idx_to_vec is None and self._idx_to_vec_lazy is not None:
+            idx_to_vec = np.asarray(self._idx_to_vec_lazy)
+        else:
+            idx_to_vec = self.idx_to_vec
+        self._index = EmbeddingIndex(idx_to_vec, num_lists=num_lists, num_probes=num_probes,
+                                     **kwargs)
+        return self._index
+
+    def quantize(self, method='int8', num_subvectors=None, num_centroids=256, num_iters=10,
+                 seed=0, similarity_datasets=None):
+        """Compresses the embedding vectors by quantization.
+
+        The 'int8' method scalar quantizes every vector to int8 values with a float32 scale per
+        vector, which reduces memory about 4x. The 'pq' method product quantizes the vectors: each
+        vector is split into `num_subvectors` subvectors that are replaced by the 1 byte index of
+        the closest of `num_centroids` centroids learned with k-means. With the default of 4
+        dimensions per subvector, memory is reduced about 16x.
+
+        Looking up tokens only dequantizes their vectors, and quantized embeddings are kept
+        quantized by `serialize` and `deserialize`. Accessing `idx_to_vec` or updating vectors
+        via `__setitem__` dequantizes all vectors back into a dense NDArray.
+
+        Parameters
+        ----------
+        method : str, default 'int8'
+            The quantization method, 'int8' or 'pq'.
+        num_subvectors : int or None, default None
+            Number of subvectors of the 'pq' method. It must divide the embedding dimension.
+            By default, subvectors have 4 dimensions if possible.
+        num_centroids : int, default 256
+            Number of centroids per subvector of the 'pq' method, at most 256.
+        num_iters : int, default 10
+            Number of k-means iterations of the 'pq' method.
+        seed : int, default 0
+            Random seed for sampling the k-means training vectors of the 'pq' method.
+        similarity_datasets : dict of str to Dataset, optional
+            Word similarity datasets such as :class:`gluonnlp.data.WordSim353` with samples
+            (word1, word2, score). For each dataset, the Spearman rank correlation of the scores
+            and the similarities predicted by
+            :class:`gluonnlp.embedding.evaluation.WordEmbeddingSimilarity` is reported before and
+            after quantization. Pairs with unknown words are skipped.
+
+        Returns
+        -------
+        dict
+            The quantization report. 'compression_ratio' is the memory of the dense float32
+            vectors over the memory of the quantized vectors, 'mse' the mean squared error of the
+            dequantized vector elements and 'mean_cosine_similarity' the mean cosine similarity
+            of the non-zero vectors and their dequantized vectors. If `similarity_datasets` are
+            specified, 'similarity' maps every dataset name to a dict of the number of
+            evaluated pairs 'num_pairs' and the 'dense' and 'quantized' correlations and their
+            'delta'.
+        """
+        if self._idx_to_vec is not None:
+            vecs = self._idx_to_vec.asnumpy()
+        elif self._idx_to_vec_lazy is not None:
+            vecs = self._idx_to_vec_lazy
+        else:
+            raise ValueError('`idx_to_vec` has not been initialized.')
+
+        if method == 'int8':
+            quantized = _Int8Vectors.quantize(vecs)
+        elif method == 'pq':
+            if num_subvectors is None:
+                num_subvectors = vecs.shape[1] // 4 if vecs.shape[1] % 4 == 0 else vecs.shape[1]
+            quantized = _ProductQuantizedVectors.quantize(
+                vecs, num_subvectors, num_centroids=num_centroids, num_iters=num_iters,
+                seed=seed)
+        else:
+            raise ValueError('Unknown quantization method {}. Valid methods: {}'.format(
+                method, ', '.join(sorted(_QUANTIZATION_METHODS.keys()))))
+
+        report = {'method': method,
+                  'compression_ratio': 4. * vecs.shape[0] * vecs.shape[1] / quantized.nbytes}
+        squared_error, cosine_sum, num_nonzero = 0., 0., 0
+        for start in range(0, len(vecs), _BLOCK_ROWS):
+            dense = np.asarray(vecs[start:start + _BLOCK_ROWS], dtype=np.float32)
+            dequantized = quantized[start:start + _BLOCK_ROWS]
+            squared_error += float(np.square(dense - dequantized).sum())
+            norms = np.linalg.norm(dense, axis=1) * np.linalg.norm(dequantized, axis=1)
+            nonzero = norms > 0
+            cosine_sum += float(((dense * dequantized).sum(axis=1)[nonzero] /
+                                 norms[nonzero]).sum())
+            num_nonzero += int(nonzero.sum())
+        report['mse'] = squared_error / (vecs.shape[0] * vecs.shape[1])
+        report['mean_cosine_similarity'] = cosine_sum / max(num_nonzero, 1)
+
+        if similarity_datasets is not None:
+            report['similarity'] = {
+                name: self._quantization_similarity_delta(vecs, quantized, dataset)
+                for name, dataset in similarity_datasets.items()}
+
+        self._idx_to_vec = None
+        self._idx_to_vec_lazy = quantized
+        self._index = None
+        return report
+
+    def _quantization_similarity_delta(self, vecs, quantized, dataset):
+        """Evaluate dense and quantized vectors on a word similarity dataset."""
+        pairs = [(self._token_to_idx[sample[0]], self._token_to_idx[sample[1]], sample[2])
+                 for sample in dataset
+                 if sample[0] in self._token_to_idx and sample[1] in self._token_to_idx]
+        result = {'num_pairs': len(pairs)}
+        if not pairs:
+            return result
+        words1, words2, scores = zip(*pairs)
+        # Only evaluate the rows of the words in the dataset
+        rows = np.unique(words1 + words2)
+        words1 = nd.array(np.searchsorted(rows, words1))
+        words2 = nd.array(np.searchsorted(rows, words2))
+        for key, idx_to_vec in [('dense', np.asarray(vecs[rows])), ('quantized', quantized[rows])]:
+            evaluator = WordEmbeddingSimilarity(idx_to_vec=nd.array(idx_to_vec))
+            evaluator.initialize()
+            result[key] = _spearman_correlation(evaluator(words1, words2).asnumpy(), scores)
+        result['delta'] = result['quantized'] - result['dense']
+        return result
+
+    def _search(self, vecs, k, exclude_tokens):
+        """Find the tokens most similar to vecs, excluding exclude_tokens and the unknown
+        token."""
+        if self._index is None:
+            self.build_index()
+        exclude = [[self._token_to_idx[token] for token in tokens if token in self._token_to_idx]
+                   for tokens in exclude_tokens]
+        if self.unknown_token:
+            exclude = [indices + [C.UNK_IDX] for indices in exclude]
+        scores, indices = self._index.search(vecs, k=k, exclude=exclude)
+        return [[(self._idx_to_token[idx], float(score))
+                 for score, idx in zip(row_scores, row_indices) if idx >= 0]
+                for row_scores, row_indices in zip(scores.tolist(), indices.tolist())]
+
+    def most_similar(self, tokens, k=10):
+        """Finds the tokens with the most similar embedding vectors by cosine similarity.
+
+        The query tokens themselves and the unknown token are never returned. Query tokens that
+        are not indexed are looked up like in `__getitem__`.
+
+        Parameters
+        ----------
+        tokens : str or list of strs
+            A token or a list of tokens to find neighbours for.
+        k : int, default 10
+            Number of neighbours per token.
+
+        Returns
+        -------
+        list of (str, float) or list of list of (str, float)
+            The neighbouring tokens and their cosine similarities in descending order. If `tokens`
+            is a list of tokens, a list of neighbours for every token is returned.
+        """
+        to_reduce = not isinstance(tokens, (list, tuple))
+        if to_reduce:
+            tokens = [tokens]
+        neighbors = self._search(self[tokens], k, [[token] for token in tokens])
+        return neighbors[0] if to_reduce else neighbors
+
+    def analogy(self, a, b, c, k=1):
+        """Answers analogy questions "`a` is to `b` as `c` is to ?" with the 3CosAdd method.
+
+        The answers are the tokens whose embedding vectors are most similar to
+        `b - a + c` after normalizing the vectors of `a`, `b` and `c`, as in
+        :class:`gluonnlp.embedding.evaluation.ThreeCosAdd`. The question tokens and the unknown
+        token are never returned.
+
+        Parameters
+        ----------
+        a, b, c : str or list of strs
+            The question tokens. Lists must be of the same length.
+        k : int, default 1
+            Number of answers per question.
+
+        Returns
+        -------
+        list of (str, float) or list of list of (str, float)
+            The answer tokens and their cosine similarities in descending order. If the question
+            tokens are lists, a list of answers for every question is returned.
+        """
+        to_reduce = not isinstance(a, (list, tuple))
+        if to_reduce:
+            a, b, c = [a], [b], [c]
+        if not len(a) == len(b) == len(c):
+            raise ValueError('a, b and c must have the same length, got {}, {} and {}.'
+                             .format(len(a), len(b), len(c)))
+        vecs = nd.L2Normalization(self[list(b)]) - nd.L2Normalization(self[list(a)]) + \
+            nd.L2Normalization(self[list(c)])
+        answers = self._search(vecs, k, list(zip(a, b, c)))
+        return answers[0] if to_reduce else answers
 
     @classmethod
     def _check_source(cls, source_file_hash, source):
@@ -657,7 +1096,8 @@ class TokenEmbedding(object):
                                ', '.join(source_file_hash.keys())))
 
     @staticmethod
-    def from_file(file_path, elem_delim=' ', encoding='utf8', **kwargs):
+    def from_file(file_path, elem_delim=' ', encoding='utf8', num_workers=0, cache=False,
+                  **kwargs):
         """Creates a user-defined token embedding from a pre-trained embedding file.
 
 
@@ -680,6 +1120,15 @@ class TokenEmbedding(object):
             line of the custom pre-trained token embedding file.
         encoding : str, default 'utf8'
             The encoding scheme for reading the custom pre-trained token embedding file.
+        num_workers : int, default 0
+            The number of worker processes used to parse large text files in chunks of lines.
+            If 0 or 1, the file is parsed in the current process. Worker processes are started
+            with multiprocessing, so scripts using them must guard their entry point with
+            `if __name__ == '__main__'` on platforms that spawn processes.
+        cache : bool, default False
+            Whether to cache the parsed text file in a binary file next to it, named
+            `file_path` + '.cache.npz'. The cache is reused by later calls as long as the sha1
+            hash of the file, `elem_delim` and `encoding` are unchanged.
         kwargs : dict
             All other keyword arguments are passed to the TokenEmbedding initializer.
 
@@ -690,7 +1139,8 @@ class TokenEmbedding(object):
             The user-defined token embedding instance.
         """
         embedding = TokenEmbedding(**kwargs)
-        embedding._load_embedding(file_path, elem_delim=elem_delim, encoding=encoding)
+        embedding._load_embedding(file_path, elem_delim=elem_delim, encoding=encoding,
+                                  num_workers=num_workers, cache=cache)
         return embedding
 
     def serialize(self, file_path, compress=True):
@@ -721,7 +1171,15 @@ class TokenEmbedding(object):
 
         unknown_token = np.array(self.unknown_token)
         idx_to_token = np.array(self.idx_to_token, dtype='O')
-        idx_to_vec = self.idx_to_vec.asnumpy()
+        arrays = {}
+        if isinstance(self._idx_to_vec_lazy, _QuantizedVectors):
+            arrays['quantization'] = np.array(self._idx_to_vec_lazy.method)
+            arrays.update(('idx_to_vec_' + name, array)
+                          for name, array in self._idx_to_vec_lazy.arrays().items())
+        elif self._idx_to_vec is None and self._idx_to_vec_lazy is not None:
+            arrays['idx_to_vec'] = self._idx_to_vec_lazy
+        else:
+            arrays['idx_to_vec'] = self.idx_to_vec.asnumpy()
 
         if not unknown_token:  # Store empty string instead of None
             unknown_token = ''
@@ -730,14 +1188,13 @@ class TokenEmbedding(object):
 
         if not compress:
             np.savez(file=file_path, unknown_token=unknown_token,
-                     idx_to_token=idx_to_token, idx_to_vec=idx_to_vec)
+                     idx_to_token=idx_to_token, **arrays)
         else:
             np.savez_compressed(file=file_path, unknown_token=unknown_token,
-                                idx_to_token=idx_to_token,
-                                idx_to_vec=idx_to_vec)
+                                idx_to_token=idx_to_token, **arrays)
 
     @classmethod
-    def deserialize(cls, file_path, **kwargs):
+    def deserialize(cls, file_path, mmap=False, **kwargs):
         """Create a new TokenEmbedding from a serialized one.
 
         TokenEmbedding is serialized by converting the list of tokens, the
@@ -751,6 +1208,12 @@ class TokenEmbedding(object):
         ----------
         file_path : str or file
             The path to a file that holds the serialized TokenEmbedding.
+        mmap : bool, default False
+            Memory-map the embedding vectors instead of loading them. Looking up
+            tokens only reads their vectors from the file, and `idx_to_vec` is
+            loaded when it is first accessed. The file must be a path to a file
+            serialized with `compress=False`. Quantized embeddings stay quantized
+            whether or not they are memory-mapped.
         kwargs : dict
             Keyword arguments are passed to the TokenEmbedding initializer.
             Useful for attaching unknown_lookup.
@@ -768,7 +1231,17 @@ class TokenEmbedding(object):
                 else:
                     unknown_token = str(unknown_token)
         idx_to_token = npz_dict['idx_to_token'].tolist()
-        idx_to_vec = nd.array(npz_dict['idx_to_vec'])
+        idx_to_vec = idx_to_vec_lazy = None
+        if 'quantization' in npz_dict.files:
+            quantized_cls = _QUANTIZATION_METHODS[str(npz_dict['quantization'])]
+            idx_to_vec_lazy = quantized_cls(**{
+                name: _mmap_npz_array(file_path, 'idx_to_vec_' + name) if mmap
+                      else npz_dict['idx_to_vec_' + name]
+                for name in quantized_cls._array_names})
+        elif mmap:
+            idx_to_vec_lazy = _mmap_npz_array(file_path, 'idx_to_vec')
+        else:
+            idx_to_vec = nd.array(npz_dict['idx_to_vec'])
 
         embedding = cls(unknown_token=unknown_token, **kwargs)
         if unknown_token:
@@ -779,6 +1252,7 @@ class TokenEmbedding(object):
 
         embedding._idx_to_token = idx_to_token
         embedding._idx_to_vec = idx_to_vec
+        embedding._idx_to_vec_lazy = idx_to_vec_lazy
         embedding._token_to_idx.update((token, idx) for idx, token in enumerate(idx_to_token))
 
         return embedding
@@ -26,8 +26,16 @@ import math
 import mxnet as mx
 from mxnet.gluon.block import HybridBlock
 from mxnet.gluon import nn
+from mxnet.gluon.parameter import DeferredInitializationError
 from .block import L2Normalization
 
+# The interleaved multi-head attention operators are available since MXNet 1.6
+_INTERLEAVED_MATMUL = hasattr(mx.nd.contrib, 'interleaved_matmul_selfatt_qk')
+
+# Additive bias of masked attention scores. It is representable in float16, and the softmax
+# weights of the masked scores underflow to zero in float32.
+_MASK_BIAS = -30000.0
+
 # TODO(sxjscience) Add mask flag to softmax operator. Think about how to accelerate the kernel
 def _masked_softmax(F, att_score, mask):
     """Ignore the masked elements when calculating the softmax
@@ -177,13 +185,24 @@ class MultiHeadAttentionCell(AttentionCell):
         Initializer of the weights.
     bias_initializer : str or `Initializer`, default 'zeros'
         Initializer of the bias.
+    fused : bool, default False
+        Whether to compute self-attention, i.e. calls where the query, key and value are the
+        same, with a fused implementation. The query, key and value are projected by a
+        single matrix multiplication with the packed weights of `proj_query`, `proj_key` and
+        `proj_value`, the attention uses the interleaved matmul operators of MXNet and the mask
+        is applied as an additive bias of the scores. The parameters and results are the same
+        as the unfused implementation, except that the attention weights of queries without
+        any valid memory slot are uniform instead of zero. Requires a scaled
+        `DotProductAttentionCell` without units as `base_cell` and equal query, key and value
+        units. It has no effect if the interleaved matmul operators are unavailable.
     prefix : str or None, default None
         See document of `Block`.
     params : str or None, default None
         See document of `Block`.
     """
     def __init__(self, base_cell, query_units, key_units, value_units, num_heads, use_bias=True,
-                 weight_initializer=None, bias_initializer='zeros', prefix=None, params=None):
+                 weight_initializer=None, bias_initializer='zeros', fused=False,
+                 prefix=None, params=None):
         super(MultiHeadAttentionCell, self).__init__(prefix=prefix, params=params)
         self._base_cell = base_cell
         self._query_units = query_units
@@ -206,6 +225,18 @@ class MultiHeadAttentionCell(AttentionCell):
                              ' by the number of heads. Received value_units={}, num_heads={}'
                              .format(value_units, num_heads))
 
+        if fused and not (isinstance(base_cell, DotProductAttentionCell)
+                          and base_cell._units is None and base_cell._scaled
+                          and not base_cell._normalized):
+            raise ValueError('The fused MultiHeadAttention requires a scaled '
+                             'DotProductAttentionCell without units and normalization as '
+                             'base_cell. Received base_cell={}'.format(base_cell))
+        if fused and not query_units == key_units == value_units:
+            raise ValueError('The fused MultiHeadAttention requires equal query_units, key_units '
+                             'and value_units. Received query_units={}, key_units={}, '
+                             'value_units={}'.format(query_units, key_units, value_units))
+        self._fused = fused and _INTERLEAVED_MATMUL
+
         with self.name_scope():
             self.proj_query = nn.Dense(units=self._query_units, use_bias=self._use_bias,
                                        flatten=False, weight_initializer=weight_initializer,
@@ -244,15 +275,84 @@ class MultiHeadAttentionCell(AttentionCell):
         """
         return super(MultiHeadAttentionCell, self).__call__(query, key, value, mask)
 
+    def forward(self, query, key, value=None, mask=None):  # pylint: disable=arguments-differ
+        if self._fused and key is query and (value is None or value is query):
+            # Self-attention is computed from the query alone, see _fused_self_attention
+            return super(AttentionCell, self).forward(query, None, None, mask)
+        return super(MultiHeadAttentionCell, self).forward(query, key, value, mask)
+
+    def hybrid_forward(self, F, query, key, value, mask=None):  # pylint: disable=arguments-differ
+        if key is None:
+            return self._fused_self_attention(F, query, mask)
+        return super(MultiHeadAttentionCell, self).hybrid_forward(F, query, key, value, mask)
+
+    def _packed_projection(self, F, ctx=None):
+        """Weight and bias projecting the inputs to the interleaved queries, keys and values.
+
+        The projected units of every head are laid out as its query, key and value units.
+        """
+        projs = [self.proj_query, self.proj_key, self.proj_value]
+        params = [proj.weight for proj in projs]
+        if self._use_bias:
+            params += [proj.bias for proj in projs]
+        if F is mx.nd:
+            params = [param.data(ctx) for param in params]
+        else:
+            params = [param.var() for param in params]
+        # Shape (num_heads, 3 * ele_units, in_units) -> (3 * units, in_units)
+        weight = F.concat(*[w.reshape(shape=(-4, self._num_heads, -1, -2)) for w in params[:3]],
+                          dim=1).reshape(shape=(-3, -2))
+        bias = None
+        if self._use_bias:
+            bias = F.concat(*[b.reshape(shape=(self._num_heads, -1)) for b in params[3:]],
+                            dim=1).reshape(shape=(-1, ))
+        return weight, bias
+
+    def _fused_self_attention(self, F, query, mask=None):
+        """Self-attention with the fused implementation, see the `fused` argument."""
+        try:
+            weight, bias = self._packed_projection(
+                F, ctx=query.context if F is mx.nd else None)
+        except DeferredInitializationError:
+            # The projections infer the shapes of their parameters in the first call
+            return super(MultiHeadAttentionCell, self).hybrid_forward(F, query, query, query, mask)
+        # Shape (query_length, batch_size, 3 * units)
+        qkv = F.FullyConnected(F.transpose(query, axes=(1, 0, 2)), weight, bias,
+                               num_hidden=3 * self._query_units, no_bias=not self._use_bias,
+                               flatten=False)
+        # Shape (batch_size * num_heads, query_length, query_length), scaled by sqrt(ele_units)
+        att_score = F.contrib.interleaved_matmul_selfatt_qk(qkv, heads=self._num_heads)
+        att_score = att_score.reshape(shape=(-1, self._num_heads, 0, 0), reverse=True)
+        if mask is not None:
+            att_score = F.broadcast_add(att_score, F.expand_dims((1 - mask) * _MASK_BIAS, axis=1))
+        att_weights = self._base_cell._dropout_layer(F.softmax(att_score, axis=-1))
+        context_vec = F.contrib.interleaved_matmul_selfatt_valatt(
+            qkv, att_weights.reshape(shape=(-1, 0, 0), reverse=True), heads=self._num_heads)
+        context_vec = F.transpose(context_vec, axes=(1, 0, 2))
+        if mask is not None:
+            # Queries without any valid memory slot read zeros
+            context_vec = F.broadcast_mul(context_vec, F.max(mask, axis=-1, keepdims=True))
+        return context_vec, att_weights
+
+    def _split_heads(self, F, data):
+        """Split the projected units into heads.
+
+        Shape (batch_size, length, units) -> (batch_size * num_heads, length, ele_units)
+        """
+        return F.transpose(data.reshape(shape=(0, 0, self._num_heads, -1)),
+                           axes=(0, 2, 1, 3)).reshape(shape=(-1, 0, 0), reverse=True)
+
     def _compute_weight(self, F, query, key, mask=None):
         query = self.proj_query(query)  # Shape (batch_size, query_length, query_units)
-        # Shape (batch_size * num_heads, query_length, ele_units)
-        query = F.transpose(query.reshape(shape=(0, 0, self._num_heads, -1)),
-                            axes=(0, 2, 1, 3))\
-                 .reshape(shape=(-1, 0, 0), reverse=True)
         key = self.proj_key(key)
-        key = F.transpose(key.reshape(shape=(0, 0, self._num_heads, -1)),
-                          axes=(0, 2, 1, 3)).reshape(shape=(-1, 0, 0), reverse=True)
+        return self._compute_weight_projected(F, query, key, mask)
+
+    def _compute_weight_projected(self, F, query, key, mask=None):
+        """Same as `_compute_weight` but with the query and key already projected by
+        `proj_query` and `proj_key`."""
+        # Shape (batch_size * num_heads, query_length, ele_units)
+        query = self._split_heads(F, query)
+        key = self._split_heads(F, key)
         if mask is not None:
             mask = F.broadcast_axis(F.expand_dims(mask, axis=1),
                                     axis=1, size=self._num_heads)\
@@ -261,10 +361,13 @@ class MultiHeadAttentionCell(AttentionCell):
         return att_weights.reshape(shape=(-1, self._num_heads, 0, 0), reverse=True)
 
     def _read_by_weight(self, F, att_weights, value):
-        att_weights = att_weights.reshape(shape=(-1, 0, 0), reverse=True)
         value = self.proj_value(value)
-        value = F.transpose(value.reshape(shape=(0, 0, self._num_heads, -1)),
-                            axes=(0, 2, 1, 3)).reshape(shape=(-1, 0, 0), reverse=True)
+        return self._read_by_weight_projected(F, att_weights, value)
+
+    def _read_by_weight_projected(self, F, att_weights, value):
+        """Same as `_read_by_weight` but with the value already projected by `proj_value`."""
+        att_weights = att_weights.reshape(shape=(-1, 0, 0), reverse=True)
+        value = self._split_heads(F, value)
         context_vec = self._base_cell._read_by_weight(F, att_weights, value)
         context_vec = F.transpose(context_vec.reshape(shape=(-1, self._num_heads, 0, 0),
                                                       reverse=True),
@@ -21,6 +21,7 @@
 __all__ = ['BERTModel', 'BERTEncoder', 'BERTEncoderCell', 'BERTPositionwiseFFN',
            'BERTLayerNorm', 'bert_12_768_12', 'bert_24_1024_16', 'get_bert_model']
 
+import bisect
 import os
 from mxnet.gluon import Block
 from mxnet.gluon import nn
@@ -109,7 +110,8 @@ class BERTEncoder(BaseTransformerEncoder):
     ----------
     attention_cell : AttentionCell or str, default 'multi_head'
         Arguments of the attention cell.
-        Can be 'multi_head', 'scaled_luong', 'scaled_dot', 'dot', 'cosine', 'normed_mlp', 'mlp'
+        Can be 'multi_head', 'fused_multi_head', 'scaled_luong', 'scaled_dot', 'dot', 'cosine',
+        'normed_mlp', 'mlp'
     num_layers : int
         Number of attention layers.
     units : int
@@ -185,7 +187,8 @@ class BERTEncoderCell(BaseTransformerEncoderCell):
     ----------
     attention_cell : AttentionCell or str, default 'multi_head'
         Arguments of the attention cell.
-        Can be 'multi_head', 'scaled_luong', 'scaled_dot', 'dot', 'cosine', 'normed_mlp', 'mlp'
+        Can be 'multi_head', 'fused_multi_head', 'scaled_luong', 'scaled_dot', 'dot', 'cosine',
+        'normed_mlp', 'mlp'
     units : int
         Number of units for the output
     hidden_size : int
@@ -295,7 +298,8 @@ class BERTModel(Block):
 
     Outputs:
         - **sequence_outputs**: output tensor of sequence encodings.
-            Shape (batch_size, seq_length, units).
+            Shape (batch_size, seq_length, units). The sequence length is shorter if the
+            batch is trimmed, see `set_length_trimming`.
         - **pooled_output**: output tensor of pooled representation of the first tokens.
             Returned only if use_pooler is True. Shape (batch_size, units)
         - **next_sentence_classifier_output**: output tensor of next sentence classification.
@@ -313,6 +317,9 @@ class BERTModel(Block):
         self._use_decoder = use_decoder
         self._use_classifier = use_classifier
         self._use_pooler = use_pooler
+        self._trim_length = False
+        self._length_buckets = None
+        self._pad_outputs = False
         self.encoder = encoder
         # Construct word embedding
         self.word_embed = self._get_embed(word_embed, vocab_size, embed_size,
@@ -378,14 +385,63 @@ class BERTModel(Block):
                               prefix=prefix)
         return pooler
 
+    def set_length_trimming(self, active=True, length_buckets=None, pad_outputs=False):
+        """Activates or deactivates trimming the batches to their longest valid length.
+
+        If active, the padding after the longest valid length of a batch is removed from the
+        inputs before the sequences are encoded. The outputs are the same as without trimming,
+        as padded positions are masked by the encoder. This speeds up inference on batches
+        padded to a fixed length, e.g. by `BERTSentenceTransform`, that are mostly shorter.
+        Batches are only trimmed if `valid_length` is given.
+
+        Parameters
+        ----------
+        active : bool, default True
+            Whether to trim the batches.
+        length_buckets : list of int or None, default None
+            If given, batches are trimmed to the smallest bucket length that is at least their
+            longest valid length, instead of to the longest valid length. This limits the number
+            of sequence lengths seen by a hybridized encoder, which would otherwise rebuild its
+            graph for every new length.
+        pad_outputs : bool, default False
+            Whether to pad the sequence encodings with zeros back to the length of the inputs.
+            Otherwise the sequence encodings have the trimmed length.
+        """
+        self._trim_length = active
+        self._length_buckets = sorted(length_buckets) if length_buckets else None
+        self._pad_outputs = pad_outputs
+
+    def _trimmed_length(self, seq_length, valid_length):
+        """Length of the inputs after trimming."""
+        if not self._trim_length or valid_length is None:
+            return seq_length
+        max_length = max(int(valid_length.max().asscalar()), 1)
+        if self._length_buckets:
+            idx = bisect.bisect_left(self._length_buckets, max_length)
+            if idx == len(self._length_buckets):
+                return seq_length
+            max_length = self._length_buckets[idx]
+        return min(max_length, seq_length)
+
     def forward(self, inputs, token_types, valid_length=None, masked_positions=None):  # pylint: disable=arguments-differ
         """Generate the representation given the inputs.
 
         This is used in training or fine-tuning a BERT model.
         """
         outputs = []
+        seq_length = inputs.shape[1]
+        length = self._trimmed_length(seq_length, valid_length)
+        if length < seq_length:
+            inputs = inputs[:, :length]
+            token_types = token_types[:, :length]
         seq_out, _ = self._encode_sequence(inputs, token_types, valid_length)
-        outputs.append(seq_out)
+        padded_seq_out = seq_out
+        if length < seq_length and (self._pad_outputs or self._use_decoder):
+            # The encodings of padded positions are zeros
+            padding = mx.nd.zeros((seq_out.shape[0], seq_length - length, seq_out.shape[2]),
+                                  ctx=seq_out.context, dtype=seq_out.dtype)
+            padded_seq_out = mx.nd.concat(seq_out, padding, dim=1)
+        outputs.append(padded_seq_out if self._pad_outputs else seq_out)
         if self._use_pooler:
             pooled_out = self._apply_pooling(seq_out)
             outputs.append(pooled_out)
@@ -395,7 +451,7 @@ class BERTModel(Block):
         if self._use_decoder:
             assert masked_positions is not None, \
                 'masked_positions tensor is required for decoding masked language model'
-            decoder_out = self._decode(seq_out, masked_positions)
+            decoder_out = self._decode(padded_seq_out, masked_positions)
             outputs.append(decoder_out)
         return tuple(outputs) if len(outputs) > 1 else outputs[0]
 
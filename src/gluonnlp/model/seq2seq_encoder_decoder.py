@@ -85,10 +85,11 @@ def _get_attention_cell(attention_cell, units=None,
             return MLPAttentionCell(units=units, normalized=False)
         elif attention_cell == 'normed_mlp':
             return MLPAttentionCell(units=units, normalized=True)
-        elif attention_cell == 'multi_head':
+        elif attention_cell in ('multi_head', 'fused_multi_head'):
             base_cell = DotProductAttentionCell(scaled=scaled, dropout=dropout)
             return MultiHeadAttentionCell(base_cell=base_cell, query_units=units, use_bias=use_bias,
-                                          key_units=units, value_units=units, num_heads=num_heads)
+                                          key_units=units, value_units=units, num_heads=num_heads,
+                                          fused=attention_cell == 'fused_multi_head')
         else:
             raise NotImplementedError
     else:
@@ -466,9 +466,23 @@ class BeamSearchSampler(object):
         The score function used in beam search.
     max_length : int, default 100
         The maximum search length.
+    check_interval : int, default 1
+        Number of steps between two checks of whether all the beams have finished. Each check
+        blocks until the device has finished the computation of the step. A larger value saves
+        the synchronizations at the cost of running the decoder for at most
+        `check_interval - 1` steps after all the beams have finished. The samples are the same.
+    shrink_batch : bool, default False
+        Whether to remove the batch elements whose beams have all finished from the batch fed
+        to the decoder. The check is done every `check_interval` steps. The samples are the same,
+        but the decoder is not run for the finished batch elements.
+    early_finish : bool, default False
+        Whether to also finish a batch element once none of its alive beams can reach the score
+        of its best finished sample under the length penalty of the scorer. The alive beams are
+        then finished as if max_length was reached. Only the best sample of each batch element is
+        guaranteed to be the same. Requires shrink_batch and a `BeamSearchScorer` with alpha >= 0.
     """
     def __init__(self, beam_size, decoder, eos_id, scorer=BeamSearchScorer(alpha=1.0, K=5),
-                 max_length=100):
+                 max_length=100, check_interval=1, shrink_batch=False, early_finish=False):
         self._beam_size = beam_size
         assert beam_size > 0,\
             'beam_size must be larger than 0. Received beam_size={}'.format(beam_size)
@@ -477,12 +491,22 @@ class BeamSearchSampler(object):
         assert eos_id >= 0, 'eos_id cannot be negative! Received eos_id={}'.format(eos_id)
         self._max_length = max_length
         self._scorer = scorer
+        self._check_interval = check_interval
+        assert check_interval > 0,\
+            'check_interval must be larger than 0. Received check_interval={}'\
+            .format(check_interval)
+        self._shrink_batch = shrink_batch
+        self._early_finish = early_finish
+        if early_finish:
+            assert shrink_batch, 'early_finish requires shrink_batch to be turned on.'
+            assert isinstance(scorer, BeamSearchScorer) and scorer._alpha >= 0, \
+                'early_finish requires a BeamSearchScorer with alpha >= 0.'
         if hasattr(decoder, 'state_info'):
             state_info = decoder.state_info()
         else:
             state_info = None
         self._updater = _BeamSearchStepUpdate(beam_size=beam_size, eos_id=eos_id, scorer=scorer,
-                                              state_info=state_info)
+                                              single_step=True, state_info=state_info)
         self._updater.hybridize()
 
     def __call__(self, inputs, states):
@@ -525,26 +549,128 @@ class BeamSearchSampler(object):
         scores = mx.nd.zeros(shape=(batch_size, beam_size), ctx=ctx)
         if beam_size > 1:
             scores[:, 1:beam_size] = LARGE_NEGATIVE_FLOAT
-        samples = step_input.reshape((batch_size, beam_size, 1))
+        # The samples are kept in a buffer of fixed length. At each step, the updater drops the
+        # first column and appends the chosen words, so the last i + 1 columns hold the samples
+        # after i steps.
+        samples = mx.nd.full(shape=(batch_size, beam_size, self._max_length + 1), val=-1,
+                             ctx=ctx, dtype=np.int32)
+        samples[:, :, self._max_length] = step_input.reshape((batch_size, beam_size))
+        vocab_size_nd = None
+        batch_shift_nd = mx.nd.arange(0, batch_size * beam_size, beam_size, ctx=ctx,
+                                      dtype=np.int32)
+        step_nd = mx.nd.zeros(shape=(1,), ctx=ctx)
+        # Number of steps in which at least one beam is alive
+        num_steps = mx.nd.zeros(shape=(1,), ctx=ctx, dtype=np.int32)
+        # Original batch indices of the elements in the current batch
+        batch_indices = np.arange(batch_size)
+        # Results of the batch elements removed by shrink_batch
+        finished = []
         for i in range(self._max_length):
             log_probs, new_states = self._decoder(step_input, states)
-            vocab_size_nd = mx.nd.array([log_probs.shape[1]], ctx=ctx, dtype=np.int32)
-            batch_shift_nd = mx.nd.arange(0, batch_size * beam_size, beam_size, ctx=ctx,
-                                          dtype=np.int32)
-            step_nd = mx.nd.array([i + 1], ctx=ctx)
+            if vocab_size_nd is None:
+                vocab_size_nd = mx.nd.array([log_probs.shape[1]], ctx=ctx, dtype=np.int32)
+            step_nd += 1
+            num_steps += mx.nd.max(beam_alive_mask)
             samples, valid_length, scores, chosen_word_ids, beam_alive_mask, states = \
                 self._updater(samples, valid_length, log_probs, scores, step_nd, beam_alive_mask,
                               new_states, vocab_size_nd, batch_shift_nd)
             step_input = mx.nd.relu(chosen_word_ids).reshape((-1,))
-            if mx.nd.sum(beam_alive_mask).asscalar() == 0:
-                return samples, scores, valid_length
+            if (i + 1) % self._check_interval != 0 and i + 1 != self._max_length:
+                continue
+            if not self._shrink_batch:
+                # Fetch the number of alive beams and of steps in a single synchronization
+                num_alive, length = mx.nd.concat(mx.nd.sum(beam_alive_mask).reshape((1,)),
+                                                 num_steps, dim=0).asnumpy()
+                if num_alive == 0:
+                    # The samples start i + 1 columns before the end of the buffer. The steps
+                    # run after all the beams have finished only appended padding.
+                    begin = self._max_length - i - 1
+                    samples = samples.slice_axis(axis=2, begin=begin, end=begin + int(length) + 1)
+                    return samples, scores, valid_length
+                continue
+            alive = beam_alive_mask.asnumpy()
+            done = alive.sum(axis=1) == 0
+            if self._early_finish:
+                done = np.logical_or(done, self._cannot_improve(scores.asnumpy(), alive, i + 1))
+            if done.all():
+                samples = samples.slice_axis(axis=2, begin=self._max_length - i - 1, end=None)
+                finished.append(self._finish(batch_indices, samples, scores, valid_length,
+                                             beam_alive_mask))
+                return self._gather_finished(finished, num_steps)
+            if done.any():
+                done_ids = mx.nd.array(np.nonzero(done)[0], ctx=ctx, dtype=np.int32)
+                finished.append(self._finish(
+                    batch_indices[done],
+                    samples.take(done_ids).slice_axis(axis=2, begin=self._max_length - i - 1,
+                                                      end=None),
+                    scores.take(done_ids), valid_length.take(done_ids),
+                    beam_alive_mask.take(done_ids)))
+                keep = np.nonzero(np.logical_not(done))[0]
+                keep_ids = mx.nd.array(keep, ctx=ctx, dtype=np.int32)
+                keep_beam_ids = mx.nd.array((keep.reshape((-1, 1)) * beam_size
+                                             + np.arange(beam_size)).reshape((-1,)),
+                                            ctx=ctx, dtype=np.int32)
+                batch_indices = batch_indices[keep]
+                samples = samples.take(keep_ids)
+                scores = scores.take(keep_ids)
+                valid_length = valid_length.take(keep_ids)
+                beam_alive_mask = beam_alive_mask.take(keep_ids)
+                step_input = step_input.take(keep_beam_ids)
+                states = _choose_states(mx.nd, states, state_info, keep_beam_ids)
+                batch_shift_nd = mx.nd.arange(0, len(keep) * beam_size, beam_size, ctx=ctx,
+                                              dtype=np.int32)
+        samples, scores, valid_length = self._finish(batch_indices, samples, scores,
+                                                     valid_length, beam_alive_mask)[1:]
+        if self._shrink_batch:
+            finished.append((batch_indices, samples, scores, valid_length))
+            return self._gather_finished(finished, num_steps)
+        return samples, scores, valid_length
+
+    def _finish(self, batch_indices, samples, scores, valid_length, beam_alive_mask):
+        """Append EOS to the alive beams, as it is done when max_length is reached."""
+        if self._shrink_batch and mx.nd.sum(beam_alive_mask).asscalar() == 0:
+            return batch_indices, samples, scores, valid_length
         final_word = mx.nd.where(beam_alive_mask,
-                                 mx.nd.full(shape=(batch_size, beam_size),
-                                            val=self._eos_id, ctx=ctx, dtype=np.int32),
-                                 mx.nd.full(shape=(batch_size, beam_size),
-                                            val=-1, ctx=ctx, dtype=np.int32))
+                                 mx.nd.full(shape=beam_alive_mask.shape, val=self._eos_id,
+                                            ctx=samples.context, dtype=np.int32),
+                                 mx.nd.full(shape=beam_alive_mask.shape, val=-1,
+                                            ctx=samples.context, dtype=np.int32))
         samples = mx.nd.concat(samples, final_word.reshape((0, 0, 1)), dim=2)
-        valid_length += beam_alive_mask
+        valid_length = valid_length + beam_alive_mask
+        return batch_indices, samples, scores, valid_length
+
+    def _cannot_improve(self, scores, alive, step):
+        """Whether no alive beam of a batch element can reach its best finished score.
+
+        The length-penalized score of an alive beam can at most grow to
+        log_probs / length_penalty(max_length) if alpha >= 0, since log_probs can only decrease.
+        """
+        alpha, K = self._scorer._alpha, self._scorer._K
+        best_possible = scores * ((K + step) / (K + self._max_length)) ** alpha
+        best_alive = np.where(alive, best_possible, -np.inf).max(axis=1)
+        best_finished = np.where(alive, -np.inf, scores).max(axis=1)
+        return best_alive <= best_finished
+
+    def _gather_finished(self, finished, num_steps):
+        """Merge the results of the batch elements removed by shrink_batch."""
+        length = max([int(num_steps.asscalar()) + 1] +
+                     [int(ele[3].max().asscalar()) for ele in finished])
+        batch_indices = np.concatenate([ele[0] for ele in finished])
+        ctx = finished[0][1].context
+        samples = []
+        for _, ele_samples, _, _ in finished:
+            if ele_samples.shape[2] >= length:
+                ele_samples = ele_samples.slice_axis(axis=2, begin=0, end=length)
+            else:
+                padding = mx.nd.full(shape=ele_samples.shape[:2] +
+                                     (length - ele_samples.shape[2],),
+                                     val=-1, ctx=ctx, dtype=np.int32)
+                ele_samples = mx.nd.concat(ele_samples, padding, dim=2)
+            samples.append(ele_samples)
+        order = mx.nd.array(np.argsort(batch_indices), ctx=ctx, dtype=np.int32)
+        samples = mx.nd.concat(*samples, dim=0).take(order)
+        scores = mx.nd.concat(*[ele[2] for ele in finished], dim=0).take(order)
+        valid_length = mx.nd.concat(*[ele[3] for ele in finished], dim=0).take(order)
         return samples, scores, valid_length
 
 
@@ -658,10 +784,12 @@ class HybridBeamSearchSampler(HybridBlock):
                               _extract_and_flatten_nested_structure(new_states)[-1],
                               vocab_size, batch_shift)
             new_step_input = F.relu(chosen_word_ids).reshape((-1,))
-            # We are doing `new_indices = indices[1 : ] + indices[ : 1]`
+            # The samples are shifted to the left at every step, so that the samples of the
+            # first i steps are the last i columns after the i-th step. We are doing
+            # `new_indices = indices[-1 : ] + indices[ : -1]`
             new_indices = F.concat(
-                indices.slice_axis(axis=0, begin=1, end=None),
-                indices.slice_axis(axis=0, begin=0, end=1),
+                indices.slice_axis(axis=0, begin=-1, end=None),
+                indices.slice_axis(axis=0, begin=0, end=-1),
                 dim=0)
             return [], (step, new_samples, new_indices, new_step_input, new_valid_length, \
                    new_scores, new_beam_alive_mask) + tuple(new_new_states)
@@ -671,8 +799,8 @@ class HybridBeamSearchSampler(HybridBlock):
                 cond=_loop_cond, func=_loop_func, max_iterations=self._max_length,
                 loop_vars=(
                     F.zeros(shape=(1,), dtype=np.int32),                        # i
-                    F.zeros(shape=(batch_size, beam_size, self._max_length),
-                            dtype=np.int32),                                    # samples
+                    F.full(shape=(batch_size, beam_size, self._max_length), val=-1,
+                           dtype=np.int32),                                     # samples
                     F.arange(start=0, stop=self._max_length, dtype=np.int32),   # indices
                     step_input,                                                 # step_input
                     F.ones(shape=(batch_size, beam_size), dtype=np.int32),      # valid_length
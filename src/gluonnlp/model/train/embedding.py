@@ -393,26 +393,29 @@ class FasttextEmbeddingModel(EmbeddingModel, HybridBlock):
             tokens = [tokens]
             squeeze = True
 
-        data = []
-        row = []
-        col = []
-        subwords = self._subword_function(tokens)
-        offset = len(self._token_to_idx)
-        for i, (token, token_subwords) in enumerate(zip(tokens, subwords)):
-            if token not in self:
-                raise KeyError
-
-            if token in self._token_to_idx:
-                col.append(self._token_to_idx[token])
-                num = 1 + len(token_subwords)
-            else:
-                num = len(token_subwords)
-            data += [1.0 / num] * num
-            row += [i] * num
-            col += [s + offset for s in token_subwords]
+        # Average the word vector and subword vectors of every token with a
+        # single sparse-dense dot product. The rows of the CSR matrix are
+        # the packed subword indices with the word index prepended. The
+        # subwords are looked up by calling the subword function, which
+        # memoizes the subwords of repeated unknown tokens.
+        subword_lists = self._subword_function(tokens)
+        subwordsptr = np.zeros(len(tokens) + 1, dtype=np.int64)
+        np.cumsum([len(s) for s in subword_lists], out=subwordsptr[1:])
+        subwords = np.fromiter((i for s in subword_lists for i in s), dtype=np.int64,
+                               count=subwordsptr[-1])
+        word_idxs = np.array([self._token_to_idx.get(token, -1) for token in tokens],
+                             dtype=np.int64)
+        known = word_idxs >= 0
+        num_cols = np.diff(subwordsptr) + known
+        if not num_cols.all():
+            raise KeyError
+        col = np.insert(subwords + len(self._token_to_idx), subwordsptr[:-1][known],
+                        word_idxs[known])
+        indptr = np.concatenate(([0], np.cumsum(num_cols)))
+        data = np.repeat(1.0 / num_cols, num_cols)
 
         x = nd.sparse.csr_matrix(
-            (data, (row, col)), shape=(len(tokens), self.weight.shape[0]),
+            (data, col, indptr), shape=(len(tokens), self.weight.shape[0]),
             dtype=self.dtype, ctx=self.weight.list_ctx()[0])
         emb = self(x)
 
@@ -19,9 +19,10 @@
 # pylint: disable=too-many-lines
 """Encoder and decoder usded in sequence-to-sequence learning."""
 __all__ = ['TransformerEncoder', 'PositionwiseFFN', 'TransformerEncoderCell',
-           'transformer_en_de_512']
+           'BucketedTransformerEncoder', 'transformer_en_de_512']
 
 import os
+import warnings
 
 import math
 import numpy as np
@@ -32,6 +33,7 @@ from mxnet.gluon.block import HybridBlock
 from mxnet.gluon.model_zoo import model_store
 from gluonnlp.utils.parallel import Parallelizable
 from .seq2seq_encoder_decoder import Seq2SeqEncoder, Seq2SeqDecoder, _get_attention_cell
+from .attention_cell import MultiHeadAttentionCell
 from .block import GELU
 from .translation import NMTModel
 from .utils import _load_vocab, _load_pretrained_params
@@ -151,7 +153,8 @@ class BaseTransformerEncoderCell(HybridBlock):
     ----------
     attention_cell : AttentionCell or str, default 'multi_head'
         Arguments of the attention cell.
-        Can be 'multi_head', 'scaled_luong', 'scaled_dot', 'dot', 'cosine', 'normed_mlp', 'mlp'
+        Can be 'multi_head', 'fused_multi_head', 'scaled_luong', 'scaled_dot', 'dot', 'cosine',
+        'normed_mlp', 'mlp'
     units : int
         Number of units for the output
     hidden_size : int
@@ -267,7 +270,8 @@ class BaseTransformerEncoder(HybridBlock, Seq2SeqEncoder):
     ----------
     attention_cell : AttentionCell or str, default 'multi_head'
         Arguments of the attention cell.
-        Can be 'multi_head', 'scaled_luong', 'scaled_dot', 'dot', 'cosine', 'normed_mlp', 'mlp'
+        Can be 'multi_head', 'fused_multi_head', 'scaled_luong', 'scaled_dot', 'dot', 'cosine',
+        'normed_mlp', 'mlp'
     num_layers : int
         Number of attention layers.
     units : int
@@ -541,7 +545,8 @@ class TransformerEncoderCell(BaseTransformerEncoderCell):
     ----------
     attention_cell : AttentionCell or str, default 'multi_head'
         Arguments of the attention cell.
-        Can be 'multi_head', 'scaled_luong', 'scaled_dot', 'dot', 'cosine', 'normed_mlp', 'mlp'
+        Can be 'multi_head', 'fused_multi_head', 'scaled_luong', 'scaled_dot', 'dot', 'cosine',
+        'normed_mlp', 'mlp'
     units : int
         Number of units for the output
     hidden_size : int
@@ -600,7 +605,8 @@ class TransformerEncoder(BaseTransformerEncoder):
     ----------
     attention_cell : AttentionCell or str, default 'multi_head'
         Arguments of the attention cell.
-        Can be 'multi_head', 'scaled_luong', 'scaled_dot', 'dot', 'cosine', 'normed_mlp', 'mlp'
+        Can be 'multi_head', 'fused_multi_head', 'scaled_luong', 'scaled_dot', 'dot', 'cosine',
+        'normed_mlp', 'mlp'
     num_layers : int
         Number of attention layers.
     units : int
@@ -663,6 +669,196 @@ class TransformerEncoder(BaseTransformerEncoder):
                                                  use_layer_norm_before_dropout=False,
                                                  scale_embed=True)
 
+
+class BucketedTransformerEncoder(object):
+    """Run a Transformer or BERT encoder with one static graph per input shape bucket.
+
+    A hybridized encoder re-runs shape inference and re-allocates its memory whenever the
+    shape of the inputs changes. This wrapper instead keeps a fixed set of
+    (batch_size, seq_length) buckets, builds one statically allocated graph per bucket
+    sharing the parameters of the encoder, and pads every batch up to the smallest
+    bucket that fits it. Batches that do not fit in any bucket are passed to the encoder
+    unchanged. Since the padding is computed as well, the buckets should match the batch
+    shapes produced by the batching of the application.
+
+    Parameters
+    ----------
+    encoder : BaseTransformerEncoder
+        The encoder, for example a `TransformerEncoder` or a `BERTEncoder`.
+    buckets : list of tuple of int
+        The (batch_size, seq_length) shapes of the buckets. The sequence lengths must not
+        exceed the maximum length of the encoder.
+
+    Inputs:
+        - **inputs** : input sequence of shape (batch_size, length, C_in)
+        - **states** : list of tensors for initial states and masks. Batches with
+            states are passed to the encoder unchanged.
+        - **valid_length** : valid lengths of each sequence. Usually used when part of sequence
+            has been padded. Shape is (batch_size, )
+
+    Outputs:
+        - **outputs** : the output of the encoder. Shape is (batch_size, length, C_out)
+        - **additional_outputs** : list of tensors.
+            Either be an empty list or contains the attention weights in this step.
+            The attention weights will have shape (batch_size, length, length) or
+            (batch_size, num_heads, length, length)
+    """
+    def __init__(self, encoder, buckets):
+        if not buckets:
+            raise ValueError('At least one bucket is required.')
+        for batch_size, seq_length in buckets:
+            if batch_size <= 0 or seq_length <= 0:
+                raise ValueError('Bucket shapes must be positive. Received {}'
+                                 .format((batch_size, seq_length)))
+            if seq_length > encoder._max_length:
+                raise ValueError('The sequence length of bucket {} exceeds the maximum length '
+                                 '{} of the encoder.'.format((batch_size, seq_length),
+                                                             encoder._max_length))
+        self._encoder = encoder
+        # Smallest buckets first, so that the first fitting bucket wastes the least padding
+        self._buckets = sorted(set((int(batch_size), int(seq_length))
+                                   for batch_size, seq_length in buckets),
+                               key=lambda shape: (shape[0] * shape[1], shape[1]))
+        self._graphs = {}
+        self._num_layer_outputs = []
+        self._warm = set()
+        self._bucket_counts = {shape: 0 for shape in self._buckets}
+        self._num_hits = 0
+        self._num_cold = 0
+        self._num_misses = 0
+
+    @property
+    def buckets(self):
+        """The (batch_size, seq_length) shapes of the buckets, smallest first."""
+        return list(self._buckets)
+
+    def _find_bucket(self, batch_size, seq_length):
+        for shape in self._buckets:
+            if batch_size <= shape[0] and seq_length <= shape[1]:
+                return shape
+        return None
+
+    def _get_graph(self, shape):
+        """Build the statically allocated graph of a bucket."""
+        if shape not in self._graphs:
+            seq_length = shape[1]
+            inputs = mx.sym.var('data')
+            valid_length = mx.sym.var('valid_length')
+            steps = mx.sym.arange(seq_length)
+            mask = mx.sym.broadcast_lesser(steps.reshape((1, -1)),
+                                           valid_length.reshape((-1, 1)))
+            mask = mx.sym.broadcast_axes(mx.sym.expand_dims(mask, axis=1), axis=1,
+                                         size=seq_length)
+            embed = inputs
+            if self._encoder._scale_embed:
+                embed = embed * math.sqrt(self._encoder._units)
+            outputs, additional_outputs = HybridBlock.forward(self._encoder, embed,
+                                                              [mask, steps], valid_length)
+            # Each layer outputs a list of attention weights, flattened into the group
+            self._num_layer_outputs = [len(layer_outputs) for layer_outputs in additional_outputs]
+            outputs = [outputs] + [weights for layer_outputs in additional_outputs
+                                   for weights in layer_outputs]
+            with warnings.catch_warnings():
+                # The data type of the inputs is only known once the graph is run
+                warnings.filterwarnings('ignore', message='Cannot decide type')
+                graph = gluon.SymbolBlock(mx.sym.Group(outputs), [inputs, valid_length],
+                                          params=self._encoder.collect_params())
+            graph.hybridize(static_alloc=True, static_shape=True)
+            self._graphs[shape] = graph
+        return self._graphs[shape]
+
+    def warmup(self, ctx=mx.cpu(), dtype='float32'):
+        """Run every bucket once so that later batches do not pay for building the graphs.
+
+        Parameters
+        ----------
+        ctx : Context, default mx.cpu()
+            The context on which the encoder is run.
+        dtype : str or numpy.dtype, default 'float32'
+            The data type of the inputs.
+        """
+        for shape in self._buckets:
+            inputs = mx.nd.zeros(shape + (self._encoder._units, ), ctx=ctx, dtype=dtype)
+            valid_length = mx.nd.full(shape[:1], shape[1], ctx=ctx, dtype=dtype)
+            self._get_graph(shape)(inputs, valid_length)
+            self._warm.add(shape)
+        mx.nd.waitall()
+
+    def __call__(self, inputs, states=None, valid_length=None):
+        batch_size, seq_length = inputs.shape[:2]
+        shape = self._find_bucket(batch_size, seq_length)
+        if shape is None or states is not None:
+            self._num_misses += 1
+            return self._encoder(inputs, states, valid_length)
+        if shape in self._warm:
+            self._num_hits += 1
+        else:
+            self._num_cold += 1
+            self._warm.add(shape)
+        self._bucket_counts[shape] += 1
+        ctx = inputs.context
+        if shape == (batch_size, seq_length):
+            padded_inputs = inputs
+        else:
+            padded_inputs = mx.nd.zeros(shape + inputs.shape[2:], ctx=ctx, dtype=inputs.dtype)
+            padded_inputs[:batch_size, :seq_length] = inputs
+        # Padded samples have a valid length of zero and are dropped from the outputs
+        padded_valid_length = mx.nd.zeros(shape[:1], ctx=ctx, dtype=inputs.dtype)
+        if valid_length is None:
+            padded_valid_length[:batch_size] = seq_length
+        else:
+            padded_valid_length[:batch_size] = valid_length.astype(inputs.dtype)
+        outputs = self._get_graph(shape)(padded_inputs, padded_valid_length)
+        if not isinstance(outputs, (list, tuple)):
+            outputs = [outputs]
+        outputs = [_slice_padding(output, batch_size, seq_length, i > 0)
+                   for i, output in enumerate(outputs)]
+        additional_outputs = []
+        begin = 1
+        for num_outputs in self._num_layer_outputs:
+            additional_outputs.append(outputs[begin:begin + num_outputs])
+            begin += num_outputs
+        return outputs[0], additional_outputs
+
+    @property
+    def hit_rate(self):
+        """The fraction of batches run by a bucket whose graph had already been built."""
+        num_batches = self._num_hits + self._num_cold + self._num_misses
+        return self._num_hits / float(num_batches) if num_batches else 0.0
+
+    def stats(self):
+        """Return a string representing the statistics of the bucket cache.
+
+        Returns
+        -------
+        ret : str
+            String representing the number of batches run by each bucket, the number of
+            batches that did not fit in any bucket and the cache hit rate.
+        """
+        ret = '{name}:\n' \
+            '  key={bucket_keys}\n' \
+            '  cnt={bucket_counts}\n' \
+            '  hits={hits}, cold={cold}, misses={misses}, hit_rate={hit_rate:.3f}'\
+            .format(name=self.__class__.__name__,
+                    bucket_keys=self._buckets,
+                    bucket_counts=[self._bucket_counts[shape] for shape in self._buckets],
+                    hits=self._num_hits, cold=self._num_cold, misses=self._num_misses,
+                    hit_rate=self.hit_rate)
+        return ret
+
+
+def _slice_padding(output, batch_size, seq_length, is_attention):
+    """Remove the padding added by BucketedTransformerEncoder from an output."""
+    if is_attention:
+        ndim = len(output.shape)
+        begin = (0, ) + (None, ) * (ndim - 3) + (0, 0)
+        end = (batch_size, ) + (None, ) * (ndim - 3) + (seq_length, seq_length)
+    else:
+        begin = (0, 0, None)
+        end = (batch_size, seq_length, None)
+    return mx.nd.slice(output, begin=begin, end=end)
+
+
 ###############################################################################
 #                                DECODER                                      #
 ###############################################################################
@@ -674,7 +870,8 @@ class TransformerDecoderCell(HybridBlock):
     ----------
     attention_cell : AttentionCell or str, default 'multi_head'
         Arguments of the attention cell.
-        Can be 'multi_head', 'scaled_luong', 'scaled_dot', 'dot', 'cosine', 'normed_mlp', 'mlp'
+        Can be 'multi_head', 'fused_multi_head', 'scaled_luong', 'scaled_dot', 'dot', 'cosine',
+        'normed_mlp', 'mlp'
     units : int
         Number of units for the output
     hidden_size : int
@@ -789,6 +986,80 @@ class TransformerDecoderCell(HybridBlock):
             additional_outputs.append(attention_inter_outputs)
         return outputs, additional_outputs
 
+    def incremental_forward(self, inputs, mem_value, mem_mask, cache, cache_mask,
+                            cache_position):
+        """Run the decoder cell on the newest position only.
+
+        The self-attention keys and values of the previous positions are read from `cache`
+        instead of being recomputed. For the multi-head attention cell, the cache stores the
+        keys and values after the projection, otherwise it stores the inputs of the cell.
+        The cache has a fixed length, so the method works with both NDArray and Symbol.
+
+        Parameters
+        ----------
+        inputs : NDArray or Symbol
+            Input of the newest position. Shape (batch_size, 1, C_in)
+        mem_value : NDArray or Symbol
+            Memory value, i.e. output of the encoder. Shape (batch_size, mem_length, C_in)
+        mem_mask : NDArray or Symbol or None
+            Mask for mem_value. Shape (batch_size, 1, mem_length)
+        cache : list of NDArray or Symbol
+            Buffers of the keys and values of the previous positions,
+            each has shape (batch_size, max_length, C).
+        cache_mask : NDArray or Symbol
+            Mask of the previous positions and the newest position in the buffers.
+            Shape (batch_size, 1, max_length)
+        cache_position : NDArray or Symbol
+            One-hot encoding of the newest position in the buffers.
+            Shape (batch_size, max_length, 1)
+
+        Returns
+        -------
+        outputs : NDArray or Symbol
+            Shape (batch_size, 1, C_out)
+        new_cache : list of NDArray or Symbol
+            Buffers with the keys and values of the newest position written at cache_position.
+        additional_outputs : list
+            Either be an empty list or contains the attention weights of the self-attention
+            and the attention over the memory.
+        """
+        F = mx.sym if isinstance(inputs, mx.sym.Symbol) else mx.nd
+        attention_cell = self.attention_cell_in
+        use_projected = isinstance(attention_cell, MultiHeadAttentionCell)
+        if use_projected:
+            key = attention_cell.proj_key(inputs)
+            value = attention_cell.proj_value(inputs)
+        else:
+            key = value = inputs
+        key, value = [F.broadcast_add(F.broadcast_mul(buffer, 1 - cache_position),
+                                      F.broadcast_mul(data, cache_position))
+                      for buffer, data in zip(cache, [key, value])]
+        if use_projected:
+            attention_in_outputs = attention_cell._compute_weight_projected(
+                F, attention_cell.proj_query(inputs), key, cache_mask)
+            outputs = attention_cell._read_by_weight_projected(F, attention_in_outputs, value)
+        else:
+            outputs, attention_in_outputs = attention_cell(inputs, key, value, cache_mask)
+        outputs = self.proj_in(outputs)
+        outputs = self.dropout_layer(outputs)
+        if self._use_residual:
+            outputs = outputs + inputs
+        outputs = self.layer_norm_in(outputs)
+        inputs = outputs
+        outputs, attention_inter_outputs = \
+            self.attention_cell_inter(inputs, mem_value, mem_value, mem_mask)
+        outputs = self.proj_inter(outputs)
+        outputs = self.dropout_layer(outputs)
+        if self._use_residual:
+            outputs = outputs + inputs
+        outputs = self.layer_norm_inter(outputs)
+        outputs = self.ffn(outputs)
+        additional_outputs = []
+        if self._output_attention:
+            additional_outputs.append(attention_in_outputs)
+            additional_outputs.append(attention_inter_outputs)
+        return outputs, [key, value], additional_outputs
+
 
 class TransformerDecoder(HybridBlock, Seq2SeqDecoder):
     """Structure of the Transformer Decoder.
@@ -797,7 +1068,8 @@ class TransformerDecoder(HybridBlock, Seq2SeqDecoder):
     ----------
     attention_cell : AttentionCell or str, default 'multi_head'
         Arguments of the attention cell.
-        Can be 'multi_head', 'scaled_luong', 'scaled_dot', 'dot', 'cosine', 'normed_mlp', 'mlp'
+        Can be 'multi_head', 'fused_multi_head', 'scaled_luong', 'scaled_dot', 'dot', 'cosine',
+        'normed_mlp', 'mlp'
     num_layers : int
     units : int
     hidden_size : int
@@ -868,13 +1140,20 @@ class TransformerDecoder(HybridBlock, Seq2SeqDecoder):
                         output_attention=output_attention,
                         prefix='transformer%d_' % i))
 
-    def init_state_from_encoder(self, encoder_outputs, encoder_valid_length=None):
+    def init_state_from_encoder(self, encoder_outputs, encoder_valid_length=None,
+                                use_cache=False):
         """Initialize the state from the encoder outputs.
 
         Parameters
         ----------
         encoder_outputs : list
         encoder_valid_length : NDArray or None
+        use_cache : bool, default False
+            Whether to decode incrementally in the one-step-ahead decoding. If set to True, each
+            decoder cell stores the keys and values of the self-attention in the states and only
+            the newest position is computed at each step. Only used in inference, i.e.,
+            one-step-ahead decoding. The cache has a fixed length of `max_length`, so the
+            decoder can also be run inside :class:`gluonnlp.model.HybridBeamSearchSampler`.
 
         Returns
         -------
@@ -883,6 +1162,10 @@ class TransformerDecoder(HybridBlock, Seq2SeqDecoder):
 
             - mem_value : NDArray
             - mem_masks : NDArray, optional
+            - cache : list, optional
+                Only given if use_cache is True. It contains the position of the next step of
+                each sample, shape (batch_size,), followed by the buffers [key, value] of each
+                layer, each has shape (batch_size, max_length, C).
         """
         mem_value = encoder_outputs
         decoder_states = [mem_value]
@@ -892,6 +1175,14 @@ class TransformerDecoder(HybridBlock, Seq2SeqDecoder):
                 mx.nd.arange(mem_length, ctx=encoder_valid_length.context).reshape((1, -1)),
                 encoder_valid_length.reshape((-1, 1)))
             decoder_states.append(mem_masks)
+        if use_cache:
+            batch_size, ctx, dtype = mem_value.shape[0], mem_value.context, mem_value.dtype
+            buffer_shape = (batch_size, self._max_length, self._units)
+            cache = [mx.nd.zeros((batch_size,), ctx=ctx)]
+            cache.extend([mx.nd.zeros(buffer_shape, ctx=ctx, dtype=dtype),
+                          mx.nd.zeros(buffer_shape, ctx=ctx, dtype=dtype)]
+                         for _ in range(self._num_layers))
+            decoder_states.append(cache)
         self._encoder_valid_length = encoder_valid_length
         return decoder_states
 
@@ -961,9 +1252,12 @@ class TransformerDecoder(HybridBlock, Seq2SeqDecoder):
         new_states: list
             Includes
             - last_embeds : NDArray or None
-                It is only given during testing
+                It is only given during testing when the cache is not used
             - mem_value : NDArray
             - mem_masks : NDArray, optional
+            - cache : list, optional
+                The positions of the next step and the buffers of the keys and values of each
+                layer if the cache is used
 
         step_additional_outputs : list of list
             Either be an empty list or contains the attention weights in this step.
@@ -973,6 +1267,8 @@ class TransformerDecoder(HybridBlock, Seq2SeqDecoder):
         return super(TransformerDecoder, self).__call__(step_input, states)
 
     def forward(self, step_input, states, mask=None):  #pylint: disable=arguments-differ, missing-docstring
+        if isinstance(states[-1], list):
+            return self._incremental_forward(step_input, states)
         input_shape = step_input.shape
         mem_mask = None
         # If it is in testing, transform input tensor to a tensor with shape NTC
@@ -1021,6 +1317,58 @@ class TransformerDecoder(HybridBlock, Seq2SeqDecoder):
             step_output = step_output[:, -1, :]
         return step_output, new_states, step_additional_outputs
 
+    def _incremental_forward(self, step_input, states):
+        """One-step-ahead decoding which only computes the newest position.
+
+        Parameters
+        ----------
+        step_input : NDArray or Symbol, Shape (batch_size, C_in)
+        states : list
+            Includes mem_value, mem_masks (optional) and the cache.
+
+        Returns
+        -------
+        step_output : NDArray or Symbol, Shape (batch_size, C_out)
+        new_states : list
+            Same structure as states, with the keys and values of step_input written to the
+            cache and the positions advanced by one.
+        step_additional_outputs : list of list
+        """
+        F = mx.sym if isinstance(step_input, mx.sym.Symbol) else mx.nd
+        if len(states) == 3:
+            mem_value, mem_mask, cache = states
+            augmented_mem_mask = F.expand_dims(mem_mask, axis=1)
+        else:
+            mem_value, cache = states
+            mem_mask = augmented_mem_mask = None
+        position = cache[0]
+        if F is mx.sym:
+            position_weight = self.position_weight.var()
+        else:
+            position_weight = self.position_weight.data(step_input.context)
+        inputs = F.expand_dims(step_input, axis=1)
+        if self._scale_embed:
+            inputs = inputs * math.sqrt(self._units)
+        position_embed = F.Embedding(position, position_weight, self._max_length, self._units)
+        inputs = F.broadcast_add(inputs, F.expand_dims(position_embed, axis=1))
+        inputs = self.dropout_layer(inputs)
+        inputs = self.layer_norm(inputs)
+        # Shape (batch_size, 1, max_length) and (batch_size, max_length, 1)
+        cache_mask = F.broadcast_lesser_equal(F.arange(self._max_length).reshape((1, 1, -1)),
+                                              position.reshape((-1, 1, 1)))
+        cache_position = F.expand_dims(F.one_hot(position, depth=self._max_length), axis=2)
+        new_cache = [position + 1]
+        step_additional_outputs = []
+        for i, cell in enumerate(self.transformer_cells):
+            inputs, layer_cache, attention_weights = \
+                cell.incremental_forward(inputs, mem_value, augmented_mem_mask, cache[i + 1],
+                                         cache_mask, cache_position)
+            new_cache.append(layer_cache)
+            if self._output_attention:
+                step_additional_outputs.append(attention_weights)
+        new_states = [mem_value] + ([mem_mask] if mem_mask is not None else []) + [new_cache]
+        return inputs.reshape((-1, self._units)), new_states, step_additional_outputs
+
     def hybrid_forward(self, F, step_input, states, mask=None, position_weight=None):
         #pylint: disable=arguments-differ
         """
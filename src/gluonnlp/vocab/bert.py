@@ -120,6 +120,8 @@ class BERTVocab(Vocab):
 
     CLS_TOKEN = '[CLS]'
 
+    _binary_attributes = Vocab._binary_attributes + ['mask_token', 'sep_token', 'cls_token']
+
     def __init__(self, counter=None, max_size=None, min_freq=1, unknown_token=UNKNOWN_TOKEN,
                  padding_token=PADDING_TOKEN, bos_token=None, eos_token=None,
                  mask_token=MASK_TOKEN, sep_token=SEP_TOKEN, cls_token=CLS_TOKEN,
@@ -158,7 +160,7 @@ class BERTVocab(Vocab):
                           'You may serialize the embedding to a binary format '
                           'separately using bert_vocab.embedding.serialize')
         vocab_dict = {}
-        vocab_dict['idx_to_token'] = self._idx_to_token
+        vocab_dict['idx_to_token'] = list(self._idx_to_token)
         vocab_dict['token_to_idx'] = dict(self._token_to_idx)
         vocab_dict['reserved_tokens'] = self._reserved_tokens
         vocab_dict['unknown_token'] = self._unknown_token
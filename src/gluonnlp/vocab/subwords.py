@@ -20,6 +20,7 @@
 # pylint: disable=consider-iterating-dictionary
 """Subword functions."""
 from __future__ import absolute_import, print_function
+import collections
 import sys
 
 import numpy as np
@@ -73,6 +74,31 @@ class SubwordFunction(object):
         """Return the number of subwords modeled."""
         raise NotImplementedError
 
+    def packed_indices(self, words):
+        """Return the subword indices of a batch of words in packed CSR form.
+
+        Parameters
+        ----------
+        words : list of str
+            Words to look up.
+
+        Returns
+        -------
+        numpy.ndarray
+            Concatenated subword indices of all words, of dtype int64.
+        numpy.ndarray
+            Offsets of shape (len(words) + 1, ) into the subword indices, of
+            dtype int64. The subword indices of the i-th word are
+            ``indices[indptr[i]:indptr[i + 1]]``.
+
+        """
+        subwords = self(words)
+        indptr = np.zeros(len(subwords) + 1, dtype=np.int64)
+        np.cumsum([len(s) for s in subwords], out=indptr[1:])
+        indices = np.fromiter((i for s in subwords for i in s), dtype=np.int64,
+                              count=indptr[-1])
+        return indices, indptr
+
     def indices_to_subwords(self, indices):
         """Return list of subwords associated with subword indices.
 
@@ -106,6 +132,15 @@ class SubwordFunction(object):
         raise NotImplementedError
 
 
+def _pack_words(words, encoding='utf-8'):
+    """Concatenate the encoded words into a uint8 buffer with offsets of the words."""
+    encoded = [word.encode(encoding) for word in words]
+    indptr = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(word) for word in encoded], out=indptr[1:])
+    data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    return data, indptr
+
+
 @register_subword_function
 class ByteSubwords(SubwordFunction):
     """Map words to a list of bytes.
@@ -132,6 +167,10 @@ class ByteSubwords(SubwordFunction):
     def __len__(self):
         return 256
 
+    def packed_indices(self, words):
+        data, indptr = _pack_words(words, self.encoding)
+        return data.astype(np.int64), indptr
+
     def __repr__(self):
         return 'ByteSubwords(encoding={})'.format(self.encoding)
 
@@ -168,25 +207,26 @@ class ByteSubwords(SubwordFunction):
         return subwords
 
 
+try:
+    import numba
+    # JIT disabled is equivalent to numba not being present
+    _NUMBA_JIT = not numba.config.DISABLE_JIT
+except ImportError:
+    _NUMBA_JIT = False
+
+
 @numba_njit
 def _byte_to_int(b):
     return b
 
 
-if sys.version_info[0] == 2:
+if sys.version_info[0] == 2 and not _NUMBA_JIT:
     # Python 2 requires an extra `ord()` when operating on memoryview outside of numba
 
-    try:
-        import numba
-        if numba.config.DISABLE_JIT:
-            # JIT disabled is equivalent to numba not being present
-            raise ImportError
-    except ImportError:
-
-        # pylint: disable=function-redefined
-        @numba_njit
-        def _byte_to_int(b):
-            return ord(b)
+    # pylint: disable=function-redefined
+    @numba_njit
+    def _byte_to_int(b):
+        return ord(b)
 
 
 @numba_njit
@@ -224,6 +264,100 @@ def _fasttext_hash(ngram):
     return h
 
 
+@numba_njit
+def _fasttext_ngram_hashes_packed(data, offsets, ns, bucket_size):
+    """Hash the ngrams of the words packed in data.
+
+    Equivalent to _fasttext_ngram_hashes applied to every word. The hash of a
+    ngram is extended byte by byte from the hash of its prefix.
+    """
+    max_n = np.max(ns)
+    indptr = np.zeros(len(offsets), dtype=np.int64)
+    # A ngram of every length in ns may start at every byte
+    hashes = np.empty(len(data) * len(ns), dtype=np.int64)
+    k = 0
+    for w in range(len(offsets) - 1):
+        start, end = offsets[w], offsets[w + 1]
+        for i in range(start, end):
+            if (data[i] & 0xC0) == 0x80:
+                # Byte is continuation byte
+                continue
+            h = np.uint32(2166136261)
+            n = 0
+            for j in range(i, end):
+                h = np.uint32(h ^ np.uint32(np.int8(data[j])))
+                h = np.uint32(h * np.uint32(16777619))
+                if j + 1 < end and (data[j + 1] & 0xC0) == 0x80:
+                    # Next byte is continuation byte
+                    continue
+                n += 1
+                if np.sum(n == ns) and not (n == 1 and i == start):
+                    hashes[k] = np.int64(h) % bucket_size
+                    k += 1
+                if n >= max_n:
+                    break
+        indptr[w + 1] = k
+    return hashes[:k], indptr
+
+
+def _fasttext_ngram_hashes_packed_numpy(data, offsets, ns, bucket_size):
+    """NumPy implementation of _fasttext_ngram_hashes_packed.
+
+    The ngrams of all words are hashed together, one character position per
+    step: in step n the hashes of all ngrams of n - 1 characters are extended
+    by the bytes of their n-th character.
+    """
+    ns = np.unique(ns)
+    ns = ns[ns > 0]
+    lengths = np.diff(offsets)
+    if not len(ns) or not len(data):
+        return np.zeros(0, dtype=np.int64), np.zeros(len(offsets), dtype=np.int64)
+    max_n = ns[-1]
+    word_ids = np.repeat(np.arange(len(lengths)), lengths)
+
+    # Characters start at all bytes that are not continuation bytes
+    char_starts = np.flatnonzero((data & 0xC0) != 0x80)
+    char_ends = np.append(char_starts[1:], len(data))
+    char_words = word_ids[char_starts]
+    word_chars = np.bincount(char_words, minlength=len(lengths))
+    first_char = np.concatenate(([0], np.cumsum(word_chars)))
+    char_pos = np.arange(len(char_starts)) - first_char[char_words]
+    chars_left = word_chars[char_words] - char_pos
+
+    # Sign extended bytes as in the fastText hash function
+    data = data.view(np.int8).astype(np.uint32)
+    hashes = np.full(len(char_starts), 2166136261, dtype=np.uint32)
+    prime = np.uint32(16777619)
+    ngram_ids, ngram_hashes = [], []
+    active = np.arange(len(char_starts))
+    for n in range(1, max_n + 1):
+        active = active[chars_left[active] >= n]
+        if not len(active):
+            break
+        # Append the bytes of the n-th character of the ngrams
+        rows = active
+        pos, end = char_starts[active + n - 1], char_ends[active + n - 1]
+        while len(rows):
+            hashes[rows] = (hashes[rows] ^ data[pos]) * prime
+            pos += 1
+            more = pos < end
+            rows, pos, end = rows[more], pos[more], end[more]
+        if n in ns:
+            emit = active if n > 1 else active[char_pos[active] > 0]
+            ngram_ids.append(emit * (max_n + 1) + n)
+            ngram_hashes.append(hashes[emit])
+
+    if not ngram_ids:
+        return np.zeros(0, dtype=np.int64), np.zeros(len(offsets), dtype=np.int64)
+    # Order the ngrams by start character and length
+    ngram_ids = np.concatenate(ngram_ids)
+    order = np.argsort(ngram_ids, kind='mergesort')
+    ngram_hashes = np.concatenate(ngram_hashes)[order].astype(np.int64) % bucket_size
+    counts = np.bincount(char_words[ngram_ids[order] // (max_n + 1)], minlength=len(lengths))
+    indptr = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+    return ngram_hashes, indptr
+
+
 @register_subword_function
 class NGramHashes(SubwordFunction):
     """Map words to a list of hashes in a restricted domain.
@@ -239,13 +373,20 @@ class NGramHashes(SubwordFunction):
         n-s for which to hash the ngrams
     special_tokens : set of str, default None
         Set of words for which not to look up subwords.
+    cache_size : int, default 65536
+        Maximum number of words whose hashes are memoized in a least recently used cache. The
+        cached lists of hashes are returned to callers and must not be modified. Set it to 0 to
+        disable the cache.
 
     """
 
-    def __init__(self, num_subwords, ngrams=(3, 4, 5, 6), special_tokens=None):
+    def __init__(self, num_subwords, ngrams=(3, 4, 5, 6), special_tokens=None,
+                 cache_size=65536):
         self.num_subwords = num_subwords
         self.ngrams = ngrams
         self._ngrams = np.asarray(ngrams)
+        self._cache_size = cache_size
+        self._cache = collections.OrderedDict()
 
         assert not isinstance(special_tokens, str)
         if special_tokens is None:
@@ -261,22 +402,44 @@ class NGramHashes(SubwordFunction):
         ngram_enc = memoryview(ngram.encode(encoding))
         return _fasttext_hash(ngram_enc)
 
-    def _word_to_hashes(self, word):
-        if word not in self.special_tokens:
-            word_enc = bytearray((u'<' + word + u'>').encode('utf-8'))
-            hashes = _fasttext_ngram_hashes(
-                memoryview(word_enc), ns=self._ngrams,
-                bucket_size=self.num_subwords)
-        else:
-            hashes = []
-        return hashes
+    def packed_indices(self, words):
+        # Special tokens are packed as empty words without subwords
+        data, offsets = _pack_words([u'<' + word + u'>' if word not in self.special_tokens
+                                     else u'' for word in words])
+        if _NUMBA_JIT:
+            return _fasttext_ngram_hashes_packed(data, offsets, self._ngrams, self.num_subwords)
+        return _fasttext_ngram_hashes_packed_numpy(data, offsets, self._ngrams,
+                                                   self.num_subwords)
+
+    def _compute_hashes(self, words):
+        """Hashes of the ngrams of every word, as lists."""
+        indices, indptr = self.packed_indices(words)
+        return [indices[start:end].tolist() for start, end in zip(indptr[:-1], indptr[1:])]
 
     def __call__(self, words):
-        return [self._word_to_hashes(word) for word in words]
+        if self._cache_size <= 0:
+            return self._compute_hashes(words)
+        # Hash all words missing from the cache at once. Cached hashes are
+        # looked up first, as the batch may evict them.
+        cache = self._cache
+        unique = list(collections.OrderedDict.fromkeys(words))
+        lookup = {word: cache[word] for word in unique if word in cache}
+        missing = [word for word in unique if word not in lookup]
+        lookup.update(zip(missing, self._compute_hashes(missing)))
+        for word in words:
+            if cache.pop(word, None) is None and len(cache) >= self._cache_size:
+                cache.popitem(last=False)
+            cache[word] = lookup[word]
+        return [lookup[word] for word in words]
 
     def __len__(self):
         return self.num_subwords
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_cache'] = collections.OrderedDict()
+        return state
+
     def __repr__(self):
         return ('NGramHashes(num_subwords={}, ngrams={})'.format(self.num_subwords, self.ngrams))
 
@@ -25,16 +25,150 @@ from __future__ import print_function
 
 __all__ = ['Vocab']
 
+import heapq
+import io
+import itertools
 import json
+import os
+import struct
 import warnings
+import zlib
 
+try:
+    from collections.abc import Mapping, Sequence
+except ImportError:  # Python 2
+    from collections import Mapping, Sequence
+
+import numpy as np
 from mxnet import nd
 
+from ..base import _str_types
 from ..data.utils import DefaultLookupDict
 from .. import _constants as C
 from .. import embedding as emb
 
 
+_BINARY_VOCAB_MAGIC = b'GNLPVOCB'
+
+
+def _open_binary_vocab(filename):
+    """Memory-map a file written by Vocab.save_binary.
+
+    Returns the attributes of the vocabulary, the offsets of the tokens in the token bytes,
+    the hash table from token to index and the token bytes.
+    """
+    with io.open(filename, 'rb') as fin:
+        header = fin.read(len(_BINARY_VOCAB_MAGIC) + 8)
+        if len(header) != len(_BINARY_VOCAB_MAGIC) + 8 or \
+                not header.startswith(_BINARY_VOCAB_MAGIC):
+            raise ValueError('%s is not a binary vocabulary file.'%filename)
+        meta_len, = struct.unpack('<Q', header[len(_BINARY_VOCAB_MAGIC):])
+        meta = json.loads(fin.read(meta_len).decode('utf-8'))
+    buf = np.memmap(filename, dtype=np.uint8, mode='r')
+    offset = meta['data_offset']
+    num_tokens, table_size = meta['num_tokens'], meta['table_size']
+    offsets = np.frombuffer(buf, dtype='<i8', count=num_tokens + 1, offset=offset)
+    offset += offsets.nbytes
+    table = np.frombuffer(buf, dtype='<i4', count=table_size, offset=offset)
+    offset += table.nbytes
+    token_bytes = buf[offset:offset + int(offsets[-1])]
+    return meta, offsets, table, token_bytes
+
+
+class _BinaryIdxToToken(Sequence):
+    """Memory-mapped idx_to_token of a binary vocabulary. Tokens are decoded when accessed."""
+    def __init__(self, filename, offsets, token_bytes):
+        self._filename = filename
+        self._offsets = offsets
+        self._token_bytes = token_bytes
+
+    def token_bytes(self, idx):
+        return self._token_bytes[self._offsets[idx]:self._offsets[idx + 1]].tobytes()
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError('Token index %d is out of range.'%idx)
+        return self.token_bytes(idx).decode('utf-8')
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __eq__(self, other):
+        if not isinstance(other, (Sequence, _BinaryIdxToToken)) or len(other) != len(self):
+            return False
+        return all(a == b for a, b in zip(self, other))
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __reduce__(self):
+        _, offsets, _, token_bytes = _open_binary_vocab(self._filename)
+        return _BinaryIdxToToken, (self._filename, offsets, token_bytes)
+
+
+class _BinaryTokenToIdx(Mapping):
+    """Memory-mapped token_to_idx of a binary vocabulary.
+
+    The tokens are looked up in an open addressing hash table stored in the file, and the
+    resolved tokens are memoized. As DefaultLookupDict, unknown tokens are mapped to `default`
+    if it is not None.
+    """
+    def __init__(self, idx_to_token, table, default=None):
+        self._idx_to_token = idx_to_token
+        self._table = table
+        self._default = default
+        self._cache = {}
+
+    def _find(self, token):
+        idx = self._cache.get(token)
+        if idx is not None:
+            return idx
+        if not isinstance(token, _str_types):
+            return -1
+        token_bytes = token.encode('utf-8')
+        mask = len(self._table) - 1
+        bucket = zlib.crc32(token_bytes) & mask
+        while True:
+            idx = int(self._table[bucket])
+            if idx == -1:
+                return -1
+            if self._idx_to_token.token_bytes(idx) == token_bytes:
+                self._cache[token] = idx
+                return idx
+            bucket = (bucket + 1) & mask
+
+    def __getitem__(self, token):
+        idx = self._find(token)
+        if idx == -1:
+            if self._default is None:
+                raise KeyError(token)
+            return self._default
+        return idx
+
+    def get(self, token, default=None):
+        idx = self._find(token)
+        return default if idx == -1 else idx
+
+    def __contains__(self, token):
+        return self._find(token) != -1
+
+    def __iter__(self):
+        return iter(self._idx_to_token)
+
+    def __len__(self):
+        return len(self._idx_to_token)
+
+    def __reduce__(self):
+        return _BinaryTokenToIdx, (self._idx_to_token, _open_binary_vocab(
+            self._idx_to_token._filename)[2], self._default)  # pylint: disable=protected-access
+
+
 class Vocab(object):
     """Indexing and embedding attachment for text tokens.
 
@@ -126,6 +260,10 @@ class Vocab(object):
     <NDArray 2x5 @cpu(0)>
     """
 
+    # Attributes serialized by save_binary, besides the tokens
+    _binary_attributes = ['unknown_token', 'reserved_tokens', 'padding_token', 'bos_token',
+                          'eos_token']
+
     def __init__(self, counter=None, max_size=None, min_freq=1, unknown_token=C.UNK_TOKEN,
                  padding_token=C.PAD_TOKEN, bos_token=C.BOS_TOKEN, eos_token=C.EOS_TOKEN,
                  reserved_tokens=None):
@@ -159,6 +297,8 @@ class Vocab(object):
             self._index_counter_keys(counter, unknown_token, special_tokens, max_size, min_freq)
 
         self._embedding = None
+        # The source list and numpy array of idx_to_token used by to_token_array
+        self._idx_to_token_array = (None, None)
 
     def _index_special_tokens(self, unknown_token, special_tokens):
         """Indexes unknown and reserved tokens."""
@@ -190,8 +330,14 @@ class Vocab(object):
         if unknown_token:
             unknown_and_special_tokens.add(unknown_token)
 
-        token_freqs = sorted(counter.items(), key=lambda x: x[0])
-        token_freqs.sort(key=lambda x: x[1], reverse=True)
+        # Sort by decreasing frequency and then alphabetically. Only the tokens that can be
+        # indexed are sorted.
+        token_freqs = [(token, freq) for token, freq in counter.items() if freq >= min_freq]
+        if max_size and max_size + len(unknown_and_special_tokens) < len(token_freqs):
+            token_freqs = heapq.nsmallest(max_size + len(unknown_and_special_tokens),
+                                          token_freqs, key=lambda x: (-x[1], x[0]))
+        else:
+            token_freqs.sort(key=lambda x: (-x[1], x[0]))
 
         token_cap = len(unknown_and_special_tokens) + (
             len(counter) if not max_size else max_size)
@@ -359,6 +505,91 @@ class Vocab(object):
 
         return tokens[0] if to_reduce else tokens
 
+    def to_index_array(self, tokens, dtype='int32'):
+        """Looks up indices of a batch of text tokens as a numpy array.
+
+        If `unknown_token` of the vocabulary is None, looking up unknown tokens results in KeyError.
+
+        Parameters
+        ----------
+        tokens : list of strs or numpy.ndarray of strs
+            The tokens to be converted. A numpy array can have any shape, and each distinct token
+            in it is only looked up once.
+        dtype : str or numpy.dtype, default 'int32'
+            The data type of the indices.
+
+
+        Returns
+        -------
+        numpy.ndarray
+            The token indices, with the same shape as `tokens`.
+        """
+        if isinstance(tokens, np.ndarray):
+            if tokens.size == 0:
+                return np.empty(tokens.shape, dtype=dtype)
+            unique_tokens, inverse = np.unique(tokens, return_inverse=True)
+            indices = self.to_index_array(unique_tokens.tolist(), dtype=dtype)
+            return indices[inverse].reshape(tokens.shape)
+        # dict.get with an explicit default is much faster than the lookup of DefaultLookupDict
+        default = self._token_to_idx[self._unknown_token] if self._unknown_token else -1
+        indices = np.fromiter(map(self._token_to_idx.get, tokens, itertools.repeat(default)),
+                              dtype=np.int64, count=len(tokens))
+        if default == -1 and len(indices) and indices.min() == -1:
+            raise KeyError(tokens[int(np.argmin(indices))])
+        return indices.astype(dtype, copy=False)
+
+    def to_index_arrays(self, sentences, dtype='int32'):
+        """Looks up indices of a batch of sequences of text tokens as numpy arrays.
+
+        The tokens of all the sequences are looked up at once.
+
+        Parameters
+        ----------
+        sentences : list of list of strs
+            The sequences of tokens to be converted.
+        dtype : str or numpy.dtype, default 'int32'
+            The data type of the indices.
+
+
+        Returns
+        -------
+        list of numpy.ndarray
+            The token indices of each sequence. They are views of a single array.
+        """
+        if not sentences:
+            return []
+        lengths = [len(sentence) for sentence in sentences]
+        indices = self.to_index_array(list(itertools.chain.from_iterable(sentences)),
+                                      dtype=dtype)
+        return np.split(indices, np.cumsum(lengths)[:-1])
+
+    def to_token_array(self, indices):
+        """Converts a batch of token indices to tokens according to the vocabulary.
+
+
+        Parameters
+        ----------
+        indices : list of ints or numpy.ndarray of ints
+            The token indices to be converted. A numpy array can have any shape.
+
+
+        Returns
+        -------
+        numpy.ndarray
+            The tokens, as an array of objects with the same shape as `indices`.
+        """
+        indices = np.asarray(indices)
+        if indices.size == 0:
+            indices = indices.astype(np.int64)
+        elif indices.dtype.kind not in 'iu' or indices.min() < 0 or indices.max() >= len(self):
+            raise ValueError('Token indices in the provided `indices` are invalid.')
+        cached_idx_to_token, idx_to_token = getattr(self, '_idx_to_token_array', (None, None))
+        if cached_idx_to_token is not self._idx_to_token or len(idx_to_token) != len(self):
+            idx_to_token = np.empty(len(self), dtype=object)
+            idx_to_token[:] = list(self._idx_to_token)
+            self._idx_to_token_array = (self._idx_to_token, idx_to_token)
+        return idx_to_token[indices]
+
     def to_indices(self, tokens):
         """Looks up indices of text tokens according to the vocabulary.
 
@@ -410,7 +641,7 @@ class Vocab(object):
                           'You may serialize the embedding to a binary format '
                           'separately using vocab.embedding.serialize')
         vocab_dict = {}
-        vocab_dict['idx_to_token'] = self._idx_to_token
+        vocab_dict['idx_to_token'] = list(self._idx_to_token)
         vocab_dict['token_to_idx'] = dict(self._token_to_idx)
         vocab_dict['reserved_tokens'] = self._reserved_tokens
         vocab_dict['unknown_token'] = self._unknown_token
@@ -447,3 +678,88 @@ class Vocab(object):
         vocab._bos_token = vocab_dict.get('bos_token')
         vocab._eos_token = vocab_dict.get('eos_token')
         return vocab
+
+    def save_binary(self, filename):
+        """Save the Vocab object to a binary file which can be loaded lazily by `load_binary`.
+
+        The file contains the tokens and a hash table from token to index, so that loading it
+        does not read or index all the tokens. This method does not save the underlying embedding.
+        Only vocabularies of str tokens are supported.
+
+        Parameters
+        ----------
+        filename : str
+            Path to the output file.
+        """
+        if self._embedding:
+            warnings.warn('Serialization of attached embedding '
+                          'to binary is not supported. '
+                          'You may serialize the embedding to a binary format '
+                          'separately using vocab.embedding.serialize')
+        if not all(isinstance(token, _str_types) for token in self._idx_to_token):
+            raise ValueError('Only vocabularies of str tokens can be saved to binary.')
+        tokens = [token.encode('utf-8') for token in self._idx_to_token]
+        offsets = np.zeros(len(tokens) + 1, dtype='<i8')
+        np.cumsum([len(token) for token in tokens], out=offsets[1:])
+        # Open addressing with linear probing, at most half full
+        table_size = 1 << max(1, (2 * len(tokens) - 1).bit_length())
+        mask = table_size - 1
+        table = [-1] * table_size
+        for idx, token in enumerate(tokens):
+            bucket = zlib.crc32(token) & mask
+            while table[bucket] != -1:
+                bucket = (bucket + 1) & mask
+            table[bucket] = idx
+
+        meta = {'num_tokens': len(tokens), 'table_size': table_size}
+        meta.update((name, getattr(self, '_' + name)) for name in self._binary_attributes)
+        meta_len = 0
+        # The data is 8-byte aligned after the attributes
+        while True:
+            meta['data_offset'] = len(_BINARY_VOCAB_MAGIC) + 8 + meta_len
+            meta['data_offset'] += -meta['data_offset'] % 8
+            meta_bytes = json.dumps(meta).encode('utf-8')
+            if len(meta_bytes) <= meta_len:
+                break
+            meta_len = len(meta_bytes)
+        meta_bytes = meta_bytes.ljust(meta_len)
+        with io.open(os.path.expanduser(filename), 'wb') as fout:
+            fout.write(_BINARY_VOCAB_MAGIC)
+            fout.write(struct.pack('<Q', meta_len))
+            fout.write(meta_bytes)
+            fout.write(b'\0' * (meta['data_offset'] - fout.tell()))
+            fout.write(offsets.tobytes())
+            fout.write(np.array(table, dtype='<i4').tobytes())
+            fout.write(b''.join(tokens))
+
+    @classmethod
+    def load_binary(cls, filename):
+        """Load a Vocab object saved by `save_binary`.
+
+        The file is memory-mapped. Tokens are decoded and looked up in the hash table of the file
+        when they are accessed, so `idx_to_token` and `token_to_idx` are read-only sequence and
+        mapping views instead of a list and a dict.
+
+        Parameters
+        ----------
+        filename : str
+            Path to the file saved by `save_binary`.
+
+
+        Returns
+        -------
+        Vocab
+        """
+        filename = os.path.abspath(os.path.expanduser(filename))
+        meta, offsets, table, token_bytes = _open_binary_vocab(filename)
+        unknown_token = meta.get('unknown_token')
+        vocab = cls(unknown_token=unknown_token)
+        vocab._idx_to_token = _BinaryIdxToToken(filename, offsets, token_bytes)
+        vocab._token_to_idx = _BinaryTokenToIdx(vocab._idx_to_token, table)
+        if unknown_token:
+            vocab._token_to_idx = _BinaryTokenToIdx(vocab._idx_to_token, table,
+                                                    vocab._token_to_idx[unknown_token])
+        for name in cls._binary_attributes:
+            if name != 'unknown_token':
+                setattr(vocab, '_' + name, meta.get(name))
+        return vocab
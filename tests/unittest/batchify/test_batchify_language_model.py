@@ -20,7 +20,9 @@
 from __future__ import print_function
 
 import os
+import pickle
 
+import numpy as np
 import pytest
 
 import gluonnlp as nlp
@@ -124,3 +126,115 @@ def test_stream_bptt_batchify(
     num_batches = sum(1 for _ in bptt_stream)
     # the last token doesn't appear in data
     assert num_tokens < total_num_tokens
+
+
+@pytest.mark.parametrize('corpus_type', ['list', 'stream', 'prefetch'])
+@pytest.mark.parametrize('prefetch_batches', [False, True])
+@pytest.mark.parametrize('last_batch', ['keep', 'discard'])
+def test_stream_bptt_batchify_state_dict(tmpdir, corpus_type, prefetch_batches, last_batch):
+    rng = np.random.RandomState(0)
+    for file_idx in range(3):
+        with open(os.path.join(str(tmpdir), 'corpus{}.txt'.format(file_idx)), 'w') as f:
+            for _ in range(rng.randint(5, 30)):
+                f.write(' '.join('w{}'.format(rng.randint(20))
+                                 for _ in range(rng.randint(1, 12))) + '\n')
+    file_pattern = os.path.join(str(tmpdir), 'corpus*.txt')
+    vocab = nlp.Vocab(nlp.data.count_tokens('w{}'.format(i) for i in range(20)))
+
+    def get_stream():
+        if corpus_type == 'list':
+            corpus = [nlp.data.CorpusDataset(os.path.join(str(tmpdir), 'corpus{}.txt'.format(i)))
+                      for i in range(3)]
+        else:
+            corpus = nlp.data.SimpleDatasetStream(nlp.data.CorpusDataset, file_pattern)
+            if corpus_type == 'prefetch':
+                corpus = nlp.data.PrefetchingStream(corpus)
+        stream = nlp.data.batchify.StreamBPTTBatchify(vocab, 5, 3, last_batch=last_batch)(corpus)
+        if prefetch_batches:
+            stream = nlp.data.PrefetchingStream(stream, num_prefetch=3)
+        return stream
+
+    np.random.seed(0)
+    expected = [data.asnumpy().tolist() for data, _ in get_stream()]
+    for num_consumed in [1, len(expected) // 2, len(expected) - 1]:
+        np.random.seed(0)
+        stream = get_stream()
+        stream_iter = iter(stream)
+        consumed = [next(stream_iter)[0].asnumpy().tolist() for _ in range(num_consumed)]
+        state = pickle.loads(pickle.dumps(stream.state_dict()))
+        # Stop the prefetching threads, which share the numpy random state
+        for _ in range(len(expected)):
+            try:
+                next(stream_iter)
+            except StopIteration:
+                break
+        np.random.seed(1)
+        resumed = get_stream()
+        resumed.load_state_dict(state)
+        assert consumed + [data.asnumpy().tolist() for data, _ in resumed] == expected
+
+
+def test_stream_bptt_batchify_prefetched_stream_without_state():
+    rng = np.random.RandomState(0)
+    corpus = [[['w{}'.format(rng.randint(20)) for _ in range(rng.randint(1, 12))]
+               for _ in range(rng.randint(5, 30))] for _ in range(3)]
+    vocab = nlp.Vocab(nlp.data.count_tokens('w{}'.format(i) for i in range(20)))
+    bptt = nlp.data.batchify.StreamBPTTBatchify(vocab, 5, 3, sampler='sequential')
+    expected = [data.asnumpy().tolist() for data, _ in bptt(corpus)]
+    # The wrapped stream cannot save its position, so the batchified stream must not ask for it
+    stream = bptt(nlp.data.PrefetchingStream(nlp.data.SimpleDataStream(corpus)))
+    assert [data.asnumpy().tolist() for data, _ in stream] == expected
+
+
+@pytest.mark.parametrize('last_batch', ['keep', 'discard'])
+def test_bptt_batchify_compiled_corpus(tmpdir, last_batch):
+    rng = np.random.RandomState(0)
+    corpus_path = os.path.join(str(tmpdir), 'corpus.txt')
+    with open(corpus_path, 'w') as f:
+        for _ in range(50):
+            f.write(' '.join('w{}'.format(rng.randint(20))
+                             for _ in range(rng.randint(1, 12))) + '\n')
+    corpus = nlp.data.CorpusDataset(corpus_path, eos='<eos>')
+    vocab = nlp.Vocab(nlp.data.count_tokens(nlp.data.utils.concat_sequence(corpus)))
+    compiled_path = os.path.join(str(tmpdir), 'corpus.bin')
+    nlp.data.compile_corpus(corpus, vocab, compiled_path)
+
+    bptt = nlp.data.batchify.CorpusBPTTBatchify(vocab, 5, 3, last_batch=last_batch)
+    flat_corpus = nlp.data.CorpusDataset(corpus_path, eos='<eos>', flatten=True)
+    expected = [(x.asnumpy(), y.asnumpy()) for x, y in bptt(flat_corpus)]
+    compiled = nlp.data.CompiledCorpusDataset(compiled_path, flatten=True)
+    batches = [(x.asnumpy(), y.asnumpy()) for x, y in bptt(compiled)]
+    assert len(batches) == len(expected)
+    for (x, y), (expected_x, expected_y) in zip(batches, expected):
+        assert np.array_equal(x, expected_x) and np.array_equal(y, expected_y)
+
+    stream_bptt = nlp.data.batchify.StreamBPTTBatchify(vocab, 5, 3, sampler='sequential',
+                                                       last_batch=last_batch)
+    expected = [(x.asnumpy(), y.asnumpy()) for x, y in stream_bptt([corpus])]
+    compiled = nlp.data.SimpleDatasetStream(nlp.data.CompiledCorpusDataset, compiled_path)
+    batches = [(x.asnumpy(), y.asnumpy()) for x, y in stream_bptt(compiled)]
+    assert len(batches) == len(expected)
+    for (x, y), (expected_x, expected_y) in zip(batches, expected):
+        assert np.array_equal(x, expected_x) and np.array_equal(y, expected_y)
+
+
+@pytest.mark.parametrize('dtype', ['float32', 'int32'])
+def test_stream_bptt_batchify_example(dtype):
+    corpus = [[s.split() + ['<eos>'] for s in ['a b c d', 'e f g h i j', 'k l m n', 'o']]]
+    vocab = nlp.Vocab(nlp.data.count_tokens('abcdefghijklmno'))
+    bptt = nlp.data.batchify.StreamBPTTBatchify(vocab, 5, 2, sampler='sequential',
+                                                last_batch='discard', dtype=dtype)
+    batches = list(bptt(corpus))
+    # Each row reads the next sentence when it needs more tokens, including the target of its
+    # last token
+    expected = [('a b c d <eos>', 'k l m n <eos>', 'b c d <eos> e', 'l m n <eos> o'),
+                ('e f g h i', 'o <pad> <pad> <pad> <pad>',
+                 'f g h i j', '<eos> <pad> <pad> <pad> <pad>'),
+                ('j <pad> <pad> <pad> <pad>', '<pad> <pad> <pad> <pad> <pad>',
+                 '<eos> <pad> <pad> <pad> <pad>', '<pad> <pad> <pad> <pad> <pad>')]
+    assert len(batches) == len(expected)
+    for (data, target), rows in zip(batches, expected):
+        assert data.dtype == target.dtype == np.dtype(dtype)
+        data_rows = [vocab.to_tokens(row) for row in data.asnumpy().T.astype(int).tolist()]
+        target_rows = [vocab.to_tokens(row) for row in target.asnumpy().T.astype(int).tolist()]
+        assert tuple(' '.join(row) for row in data_rows + target_rows) == rows
@@ -1,4 +1,5 @@
 import numpy as np
+import pytest
 from numpy.testing import assert_allclose
 import mxnet as mx
 from gluonnlp.model import attention_cell as ac
@@ -99,3 +100,60 @@ def test_multihead_attention():
                                                use_mask=use_mask,
                                                multi_head=True,
                                                num_heads=num_heads)
+
+
+@pytest.mark.parametrize('use_bias', [True, False])
+@pytest.mark.parametrize('use_mask', [True, False])
+@pytest.mark.parametrize('hybridize', [True, False])
+def test_fused_multihead_attention(use_bias, use_mask, hybridize):
+    batch_size, length, in_units, units, num_heads = 3, 7, 6, 8, 2
+    cells = [ac.MultiHeadAttentionCell(
+        base_cell=ac.DotProductAttentionCell(scaled=True),
+        query_units=units, key_units=units, value_units=units, num_heads=num_heads,
+        use_bias=use_bias, fused=fused, prefix='multi_head_') for fused in [False, True]]
+    query_nd = mx.nd.random.normal(0, 1, (batch_size, length, in_units))
+    if use_mask:
+        # Every query has a valid memory slot
+        mask_nd = mx.nd.maximum(mx.random.uniform(0, 1, shape=(batch_size, length, length)) > 0.3,
+                                mx.nd.eye(length))
+    else:
+        mask_nd = None
+    cells[0].initialize(mx.init.Normal(1.0))
+    expected_value, expected_weights = cells[0](query_nd, query_nd, query_nd, mask_nd)
+    cells[1].initialize()
+    if hybridize:
+        cells[1].hybridize()
+    else:
+        # The first call infers the shapes of the parameters
+        cells[1](query_nd, query_nd, query_nd, mask_nd)
+    for name, param in cells[1].collect_params().items():
+        param.set_data(cells[0].collect_params()[name].data())
+    read_value, att_weights = cells[1](query_nd, query_nd, query_nd, mask_nd)
+    assert_allclose(read_value.asnumpy(), expected_value.asnumpy(), 1E-5, 1E-5)
+    assert_allclose(att_weights.asnumpy(), expected_weights.asnumpy(), 1E-5, 1E-5)
+
+
+def test_fused_multihead_attention_masked_query():
+    cell = ac.MultiHeadAttentionCell(base_cell=ac.DotProductAttentionCell(scaled=True),
+                                     query_units=4, key_units=4, value_units=4, num_heads=2,
+                                     fused=True)
+    cell.initialize()
+    cell.hybridize()
+    query_nd = mx.nd.random.normal(0, 1, (2, 3, 4))
+    mask_nd = mx.nd.ones((2, 3, 3))
+    mask_nd[1, 2] = 0
+    read_value, att_weights = cell(query_nd, query_nd, query_nd, mask_nd)
+    assert_allclose(read_value[1, 2].asnumpy(), np.zeros(4))
+    assert np.abs(read_value[1, 1].asnumpy()).sum() > 0
+    assert_allclose(att_weights.sum(axis=-1).asnumpy(), np.ones((2, 2, 3)), 1E-5, 1E-5)
+
+
+def test_fused_multihead_attention_invalid():
+    with pytest.raises(ValueError):
+        ac.MultiHeadAttentionCell(base_cell=ac.DotProductAttentionCell(scaled=False),
+                                  query_units=4, key_units=4, value_units=4, num_heads=2,
+                                  fused=True)
+    with pytest.raises(ValueError):
+        ac.MultiHeadAttentionCell(base_cell=ac.DotProductAttentionCell(scaled=True),
+                                  query_units=4, key_units=4, value_units=8, num_heads=2,
+                                  fused=True)
@@ -22,6 +22,7 @@ from __future__ import print_function
 import datetime
 import os
 import io
+import pickle
 import random
 
 from flaky import flaky
@@ -653,3 +654,28 @@ def test_numpy_dataset():
     assert np.all(dataset[1][0] == a[1])
     assert np.all(dataset[0][1] == b[0])
     assert np.all(dataset[1][1] == b[1])
+
+def test_compiled_corpus_dataset(tmpdir):
+    corpus_path = os.path.join(str(tmpdir), 'corpus.txt')
+    with io.open(corpus_path, 'w', encoding='utf8') as fout:
+        fout.write(u'a b c\n\nd e\nf\n')
+    corpus = nlp.data.CorpusDataset(corpus_path, eos='<eos>')
+    vocab = nlp.Vocab(nlp.data.count_tokens(nlp.data.utils.concat_sequence(corpus)))
+    compiled_path = os.path.join(str(tmpdir), 'corpus.bin')
+    assert nlp.data.compile_corpus(corpus, vocab, compiled_path) == 9
+    dataset = nlp.data.CompiledCorpusDataset(compiled_path)
+    assert len(dataset) == len(corpus)
+    for i in range(-len(corpus), len(corpus)):
+        assert vocab.to_tokens(dataset[i].tolist()) == corpus[i]
+    with pytest.raises(IndexError):
+        dataset[len(corpus)]
+    dataset = pickle.loads(pickle.dumps(dataset))
+    assert vocab.to_tokens(dataset[1].tolist()) == corpus[1]
+    flat_dataset = nlp.data.CompiledCorpusDataset(compiled_path, flatten=True)
+    assert vocab.to_tokens(flat_dataset[:].tolist()) == \
+        nlp.data.utils.concat_sequence(corpus)
+    # An empty corpus
+    nlp.data.compile_corpus([], vocab, compiled_path)
+    assert len(nlp.data.CompiledCorpusDataset(compiled_path)) == 0
+    with pytest.raises(ValueError):
+        nlp.data.CompiledCorpusDataset(corpus_path)
@@ -125,6 +125,40 @@ def test_pretrained_bert_models():
             del model
             mx.nd.waitall()
 
+@pytest.mark.parametrize('length_buckets', [None, [4, 8, 16]])
+@pytest.mark.parametrize('pad_outputs', [True, False])
+def test_bert_model_length_trimming(length_buckets, pad_outputs):
+    batch_size, seq_len, units, vocab_size, num_masks = 3, 12, 16, 20, 2
+    encoder = nlp.model.BERTEncoder(attention_cell='multi_head', num_layers=2, units=units,
+                                    hidden_size=32, max_length=seq_len, num_heads=2)
+    model = nlp.model.BERTModel(encoder, vocab_size=vocab_size, token_type_vocab_size=2,
+                                units=units, embed_size=units)
+    model.initialize(init=mx.init.Normal(0.1))
+    model.encoder.hybridize()
+    inputs = mx.nd.random.randint(0, vocab_size, shape=(batch_size, seq_len)).astype('float32')
+    token_types = mx.nd.random.randint(0, 2, shape=(batch_size, seq_len)).astype('float32')
+    valid_length = mx.nd.array([5, 2, 3])
+    positions = mx.nd.array([[1, 4], [0, 1], [2, 9]])
+    expected = model(inputs, token_types, valid_length, positions)
+
+    model.set_length_trimming(length_buckets=length_buckets, pad_outputs=pad_outputs)
+    outputs = model(inputs, token_types, valid_length, positions)
+    trimmed_len = seq_len if pad_outputs else 5 if length_buckets is None else 8
+    assert outputs[0].shape == (batch_size, trimmed_len, units)
+    mx.test_utils.assert_almost_equal(outputs[0].asnumpy(),
+                                      expected[0][:, :trimmed_len].asnumpy(), 1E-5, 1E-5)
+    for output, expected_output in zip(outputs[1:], expected[1:]):
+        mx.test_utils.assert_almost_equal(output.asnumpy(), expected_output.asnumpy(), 1E-5, 1E-5)
+
+    # Batches longer than all buckets are not trimmed
+    outputs = model(inputs, token_types, mx.nd.array([12, 2, 3]), positions)
+    assert outputs[0].shape == (batch_size, seq_len, units)
+
+    model.set_length_trimming(False)
+    outputs = model(inputs, token_types, valid_length, positions)
+    assert outputs[0].shape == (batch_size, seq_len, units)
+
+
 @pytest.mark.serial
 @pytest.mark.remote_required
 def test_bert_models():
@@ -427,3 +461,129 @@ def test_weight_drop():
         y.backward()
         for name, param in shared_net.collect_params().items():
             assert not mx.test_utils.almost_equal(grads[name].asnumpy(), param.grad().asnumpy())
+
+@pytest.mark.parametrize('hybridize', [False, True])
+@pytest.mark.parametrize('use_valid_length', [False, True])
+def test_transformer_decoder_cache(hybridize, use_valid_length):
+    ctx = mx.cpu()
+    batch_size = 3
+    beam_size = 4
+    vocab = nlp.Vocab(nlp.data.count_tokens(['a', 'b', 'c', 'd', 'e']))
+    encoder, decoder = nlp.model.transformer.get_transformer_encoder_decoder(
+        num_layers=2, num_heads=4, units=16, hidden_size=32, max_src_length=10,
+        max_tgt_length=20)
+    model = nlp.model.translation.NMTModel(src_vocab=vocab, tgt_vocab=vocab, encoder=encoder,
+                                           decoder=decoder, share_embed=True, embed_size=16,
+                                           tie_weights=True)
+    model.initialize(mx.init.Xavier(), ctx=ctx)
+    if hybridize:
+        model.hybridize()
+    src_seq = mx.nd.random.randint(0, len(vocab), shape=(batch_size, 6), ctx=ctx)
+    src_valid_length = mx.nd.array([6, 4, 2], ctx=ctx) if use_valid_length else None
+    encoder_outputs, _ = model.encode(src_seq, valid_length=src_valid_length)
+
+    # One-step-ahead decoding with and without the cache must give the same outputs
+    states = decoder.init_state_from_encoder(encoder_outputs, src_valid_length)
+    cached_states = decoder.init_state_from_encoder(encoder_outputs, src_valid_length,
+                                                    use_cache=True)
+    for _ in range(5):
+        step_input = mx.nd.random.randint(0, len(vocab), shape=(batch_size,), ctx=ctx)
+        step_output, states, _ = model.decode_step(step_input, states)
+        cached_step_output, cached_states, _ = model.decode_step(step_input, cached_states)
+        mx.test_utils.assert_almost_equal(step_output.asnumpy(), cached_step_output.asnumpy(),
+                                          rtol=1E-4, atol=1E-4)
+    assert len(cached_states[-1]) == 3
+    assert cached_states[-1][0].asnumpy().tolist() == [5] * batch_size
+    for key, value in cached_states[-1][1:]:
+        assert key.shape == (batch_size, 20, 16)
+        assert value.shape == (batch_size, 20, 16)
+
+    # Beam search reorders the cache together with the other states
+    def _decode_logprob(step_input, states):
+        out, states, _ = model.decode_step(step_input, states)
+        return mx.nd.log_softmax(out), states
+
+    def _get_sampler():
+        return nlp.model.BeamSearchSampler(beam_size=beam_size, decoder=_decode_logprob,
+                                           eos_id=vocab[vocab.eos_token], max_length=8)
+
+    inputs = mx.nd.full(shape=(batch_size,), val=vocab[vocab.bos_token], ctx=ctx)
+    results = _get_sampler()(inputs, decoder.init_state_from_encoder(encoder_outputs,
+                                                                     src_valid_length))
+    cached_results = _get_sampler()(inputs, decoder.init_state_from_encoder(encoder_outputs,
+                                                                            src_valid_length,
+                                                                            use_cache=True))
+    for result, cached_result in zip(results, cached_results):
+        mx.test_utils.assert_almost_equal(result.asnumpy(), cached_result.asnumpy(),
+                                          rtol=1E-4, atol=1E-4)
+
+    # The fixed-length cache can also be used by the symbolic HybridBeamSearchSampler
+    class _StepDecoder(mx.gluon.HybridBlock):
+        def __init__(self, prefix=None, params=None):
+            super(_StepDecoder, self).__init__(prefix=prefix, params=params)
+            with self.name_scope():
+                self.tgt_embed = model.tgt_embed
+                self.decoder = decoder
+                self.tgt_proj = model.tgt_proj
+
+        def hybrid_forward(self, F, step_input, states):  # pylint: disable=arguments-differ
+            out, states, _ = self.decoder(self.tgt_embed(step_input), states)
+            return F.log_softmax(self.tgt_proj(out)), states
+
+    step_decoder = _StepDecoder()
+    if hybridize:
+        # The decoding step is then run as a symbolic graph
+        step_decoder.hybridize()
+    hybrid_sampler = nlp.model.HybridBeamSearchSampler(
+        batch_size=batch_size, beam_size=beam_size, decoder=step_decoder,
+        eos_id=vocab[vocab.eos_token], max_length=8, vocab_size=len(vocab))
+    hybrid_results = hybrid_sampler(inputs, decoder.init_state_from_encoder(encoder_outputs,
+                                                                            src_valid_length,
+                                                                            use_cache=True))
+    samples, scores, valid_length = [ele.asnumpy() for ele in results]
+    hybrid_samples, hybrid_scores, hybrid_valid_length = [ele.asnumpy() for ele in hybrid_results]
+    mx.test_utils.assert_almost_equal(scores, hybrid_scores, rtol=1E-4, atol=1E-4)
+    assert (valid_length == hybrid_valid_length).all()
+    # The padding of the samples differs between the samplers
+    for i in range(batch_size):
+        for j in range(beam_size):
+            assert (samples[i, j, :valid_length[i, j]] ==
+                    hybrid_samples[i, j, :valid_length[i, j]]).all()
+
+
+@pytest.mark.parametrize('encoder_class', [nlp.model.TransformerEncoder, nlp.model.BERTEncoder])
+@pytest.mark.parametrize('output_attention', [True, False])
+def test_bucketed_transformer_encoder(encoder_class, output_attention):
+    ctx = mx.cpu()
+    units = 16
+    encoder = encoder_class(num_layers=2, units=units, hidden_size=32, num_heads=4,
+                            max_length=20, output_attention=output_attention)
+    encoder.initialize(ctx=ctx)
+    bucketed_encoder = nlp.model.BucketedTransformerEncoder(encoder, [(4, 16), (4, 8), (8, 16)])
+    assert bucketed_encoder.buckets == [(4, 8), (4, 16), (8, 16)]
+    bucketed_encoder.warmup(ctx=ctx)
+
+    # Padding the batches up to the buckets must not change the encodings
+    for batch_size, seq_length in [(3, 5), (4, 8), (6, 12), (9, 10)]:
+        inputs = mx.nd.random.normal(shape=(batch_size, seq_length, units), ctx=ctx)
+        valid_length = mx.nd.random.randint(1, seq_length + 1, shape=(batch_size, ),
+                                            ctx=ctx).astype('float32')
+        for length in [valid_length, None]:
+            outputs, additional_outputs = encoder(inputs, None, length)
+            bucketed_outputs, bucketed_additional_outputs = bucketed_encoder(inputs, None, length)
+            assert bucketed_outputs.shape == outputs.shape
+            mx.test_utils.assert_almost_equal(bucketed_outputs.asnumpy(), outputs.asnumpy(),
+                                              rtol=1E-4, atol=1E-4)
+            assert len(bucketed_additional_outputs) == len(additional_outputs)
+            for weights, bucketed_weights in zip(additional_outputs, bucketed_additional_outputs):
+                assert len(bucketed_weights) == len(weights)
+                for weight, bucketed_weight in zip(weights, bucketed_weights):
+                    assert bucketed_weight.shape == weight.shape
+                    mx.test_utils.assert_almost_equal(bucketed_weight.asnumpy(),
+                                                      weight.asnumpy(), rtol=1E-4, atol=1E-4)
+    # The batches of shape (9, 10) do not fit in any bucket
+    assert bucketed_encoder.hit_rate == 0.75
+    assert 'hits=6, cold=0, misses=2' in bucketed_encoder.stats()
+
+    with pytest.raises(ValueError):
+        nlp.model.BucketedTransformerEncoder(encoder, [(4, 32)])
@@ -1,3 +1,5 @@
+import pickle
+
 import pytest
 import numpy as np
 from mxnet.gluon import data
@@ -97,6 +99,134 @@ def test_sorted_bucket_sampler(seq_lengths, mult, batch_size, shuffle):
     assert len(set(total_sampled_ids)) == len(total_sampled_ids) == N
 
 
+@pytest.mark.parametrize('seq_lengths', [[np.random.randint(10, 100) for _ in range(N)],
+                                         [(np.random.randint(10, 100), np.random.randint(10, 100))
+                                          for _ in range(N)]])
+@pytest.mark.parametrize('max_tokens', [200, 1000])
+@pytest.mark.parametrize('separate', [False, True])
+@pytest.mark.parametrize('max_batch_size', [None, 8])
+@pytest.mark.parametrize('shuffle', [False, True])
+@pytest.mark.parametrize('num_shards', [0, 3])
+def test_token_budget_sampler(seq_lengths, max_tokens, separate, max_batch_size, shuffle,
+                              num_shards):
+    lengths = np.array(seq_lengths).reshape((N, -1))
+    if separate:
+        max_tokens = (max_tokens,) * lengths.shape[1]
+    sampler = s.TokenBudgetSampler(seq_lengths, max_tokens=max_tokens,
+                                   max_batch_size=max_batch_size, shuffle=shuffle,
+                                   num_shards=num_shards)
+    print(sampler.stats())
+    total_sampled_ids = []
+    num_batches = 0
+    for batches in sampler:
+        num_batches += 1
+        if num_shards > 0:
+            assert len(batches) == num_shards
+        else:
+            batches = [batches]
+        for batch_sample_ids in batches:
+            padded = len(batch_sample_ids) * lengths[batch_sample_ids].max(axis=0)
+            if separate:
+                assert (padded <= np.array(max_tokens)).all()
+            else:
+                assert padded.sum() <= max_tokens
+            if max_batch_size is not None:
+                assert len(batch_sample_ids) <= max_batch_size
+            total_sampled_ids.extend(batch_sample_ids)
+    assert num_batches == len(sampler)
+    if num_shards == 0:
+        assert len(set(total_sampled_ids)) == len(total_sampled_ids) == N
+    else:
+        assert len(set(total_sampled_ids)) == N
+
+
+def test_token_budget_sampler_packing():
+    sampler = s.TokenBudgetSampler([3, 1, 2, 2, 4, 1], max_tokens=6)
+    assert list(sampler) == [[1, 5, 2], [3, 0], [4]]
+    assert 'padding_ratio=[0.1875]' in sampler.stats()
+    with pytest.raises(ValueError):
+        s.TokenBudgetSampler([3, 7], max_tokens=6)
+    with pytest.raises(ValueError):
+        s.TokenBudgetSampler([(3, 2), (2, 5)], max_tokens=(4, 4))
+
+
+@pytest.mark.parametrize('seq_lengths', [[np.random.randint(10, 100) for _ in range(N)],
+                                         [(np.random.randint(10, 100), np.random.randint(10, 100))
+                                          for _ in range(N)]])
+@pytest.mark.parametrize('num_parts', [1, 3, 8])
+@pytest.mark.parametrize('shuffle', [False, True])
+@pytest.mark.parametrize('num_shards', [0, 2])
+def test_distributed_fixed_bucket_sampler(seq_lengths, num_parts, shuffle, num_shards):
+    def get_samplers(seed):
+        return [s.DistributedFixedBucketSampler(seq_lengths, batch_size=8, num_parts=num_parts,
+                                                part_index=part_index, seed=seed,
+                                                shuffle=shuffle, num_shards=num_shards)
+                for part_index in range(num_parts)]
+
+    def flatten(batches):
+        return [batch for shards in batches for batch in shards] if num_shards > 0 else batches
+
+    samplers = get_samplers(seed=1)
+    print(samplers[0].stats())
+    epoch_batches = [list(sampler) for sampler in samplers]
+    for batches, sampler in zip(epoch_batches, samplers):
+        assert len(batches) == len(sampler)
+        assert sampler.epoch == 1
+    # Every worker gets the same number of batches and every sample is used
+    part_batches = [flatten(batches) for batches in epoch_batches]
+    assert len(set(len(batches) for batches in part_batches)) == 1
+    all_sample_ids = [i for batches in part_batches for batch in batches for i in batch]
+    assert set(all_sample_ids) == set(range(N))
+    # The workers process batches of the same bucket at each step
+    sample_bucket_ids = {}
+    for bucket_id, sample_ids in enumerate(samplers[0]._bucket_sample_ids):
+        sample_bucket_ids.update((i, bucket_id) for i in sample_ids)
+    for step_batches in zip(*part_batches):
+        bucket_ids = set(sample_bucket_ids[i] for batch in step_batches for i in batch)
+        assert len(bucket_ids) == 1
+    # The order is reproducible, and changes with the epoch when shuffle is True
+    second_epoch = [list(sampler) for sampler in samplers]
+    assert [list(sampler) for sampler in get_samplers(seed=1)] == epoch_batches
+    if shuffle:
+        assert second_epoch != epoch_batches
+    else:
+        assert second_epoch == epoch_batches
+    # Resume in the middle of the second epoch
+    for sampler, batches in zip(get_samplers(seed=1), second_epoch):
+        sampler.set_epoch(1, start_batch=len(batches) // 2)
+        assert list(sampler) == batches[len(batches) // 2:]
+        assert sampler.epoch == 2
+
+
+@pytest.mark.parametrize('sampler_fn', [
+    lambda lengths: s.FixedBucketSampler(lengths, 8, shuffle=True),
+    lambda lengths: s.FixedBucketSampler(lengths, 8, shuffle=True, num_shards=3),
+    lambda lengths: s.SortedBucketSampler(lengths, 8, mult=10, shuffle=True),
+    lambda lengths: s.DistributedFixedBucketSampler(lengths, 8, num_parts=2, part_index=1)])
+def test_sampler_state_dict(sampler_fn):
+    lengths = np.random.RandomState(0).randint(10, 100, size=(N,)).tolist()
+    np.random.seed(0)
+    sampler = sampler_fn(lengths)
+    list(sampler)
+    expected = [list(sampler), list(sampler)]
+    np.random.seed(0)
+    sampler = sampler_fn(lengths)
+    list(sampler)
+    sampler_iter = iter(sampler)
+    consumed = [next(sampler_iter) for _ in range(len(sampler) // 2)]
+    state = pickle.loads(pickle.dumps(sampler.state_dict()))
+    # Resume with another random state and another sampler
+    np.random.seed(1)
+    resumed = sampler_fn(lengths)
+    resumed.load_state_dict(state)
+    assert consumed + list(resumed) == expected[0]
+    if not isinstance(sampler, s.FixedBucketSampler) or \
+            isinstance(sampler, s.DistributedFixedBucketSampler):
+        # The next epoch does not depend on the interruption either
+        resumed.load_state_dict(resumed.state_dict())
+        assert list(resumed) == expected[1]
+
+
 @pytest.mark.parametrize('num_samples', [30])
 @pytest.mark.parametrize('num_parts', [3, 7])
 def test_split_sampler(num_samples, num_parts):
@@ -284,3 +284,97 @@ def test_beam_search(hybridize, sampler_cls):
                                 assert(samples[i, j, valid_length[i, j] - 1] == 3.0)
                                 if valid_length[i, j] < samples.shape[2]:
                                     assert((samples[i, j, valid_length[i, j]:] == -1.0).all())
+
+class _ContextDecoder(gluon.HybridBlock):
+    def __init__(self, vocab_size, hidden_size, prefix=None, params=None):
+        super(_ContextDecoder, self).__init__(prefix=prefix, params=params)
+        with self.name_scope():
+            self._embed = nn.Embedding(input_dim=vocab_size, output_dim=hidden_size)
+            self._rnn = rnn.RNNCell(hidden_size=hidden_size)
+            self._map_to_vocab = nn.Dense(vocab_size)
+
+    def hybrid_forward(self, F, inputs, states):
+        out, states = self._rnn(self._embed(inputs), states)
+        return self._map_to_vocab(out).log_softmax(), states
+
+def _get_context_decoder(vocab_size, hidden_size=8):
+    """Randomly initialized decoder whose outputs depend on the previous words."""
+    decoder = _ContextDecoder(vocab_size=vocab_size, hidden_size=hidden_size)
+    decoder.initialize(mx.init.Normal(1.0))
+    decoder.hybridize()
+    return decoder
+
+@pytest.mark.parametrize('check_interval', [2, 5, 100])
+def test_beam_search_check_interval(check_interval):
+    vocab_size, batch_size, beam_size, eos_id = 5, 4, 3, 3
+    decoder = _get_context_decoder(vocab_size)
+    for max_length in [1, 7, 30]:
+        inputs = mx.nd.full(shape=(batch_size,), val=1)
+        states = [mx.nd.random.normal(shape=(batch_size, 8))]
+        expected = model.BeamSearchSampler(beam_size=beam_size, decoder=decoder, eos_id=eos_id,
+                                           max_length=max_length)(inputs, states)
+        results = model.BeamSearchSampler(beam_size=beam_size, decoder=decoder, eos_id=eos_id,
+                                          max_length=max_length,
+                                          check_interval=check_interval)(inputs, states)
+        for result, expected_result in zip(results, expected):
+            assert result.shape == expected_result.shape
+            assert_allclose(result.asnumpy(), expected_result.asnumpy())
+
+@pytest.mark.parametrize('check_interval', [1, 3])
+@pytest.mark.parametrize('early_finish', [False, True])
+def test_beam_search_shrink_batch(check_interval, early_finish):
+    vocab_size, batch_size, beam_size, eos_id = 6, 7, 3, 3
+    decoder = _get_context_decoder(vocab_size)
+    for max_length in [1, 5, 20]:
+        inputs = mx.nd.full(shape=(batch_size,), val=1)
+        states = [mx.nd.random.normal(shape=(batch_size, 8))]
+        expected = model.BeamSearchSampler(beam_size=beam_size, decoder=decoder, eos_id=eos_id,
+                                           max_length=max_length)(inputs, states)
+        samples, scores, valid_length = model.BeamSearchSampler(
+            beam_size=beam_size, decoder=decoder, eos_id=eos_id, max_length=max_length,
+            check_interval=check_interval, shrink_batch=True,
+            early_finish=early_finish)(inputs, states)
+        expected_samples, expected_scores, expected_valid_length = \
+            [ele.asnumpy() for ele in expected]
+        samples, scores, valid_length = samples.asnumpy(), scores.asnumpy(), valid_length.asnumpy()
+        if early_finish:
+            # Only the best sample is guaranteed to be the same
+            assert_allclose(scores[:, 0], expected_scores[:, 0], 1E-5, 1E-5)
+            assert_allclose(valid_length[:, 0], expected_valid_length[:, 0])
+            for i in range(batch_size):
+                assert_allclose(samples[i, 0, :valid_length[i, 0]],
+                                expected_samples[i, 0, :valid_length[i, 0]])
+        else:
+            assert samples.shape == expected_samples.shape
+            assert_allclose(samples, expected_samples)
+            assert_allclose(scores, expected_scores, 1E-5, 1E-5)
+            assert_allclose(valid_length, expected_valid_length)
+
+def test_hybrid_beam_search_early_finish():
+    vocab_size, batch_size, beam_size, eos_id, max_length = 5, 2, 3, 3, 5
+
+    class _EOSDecoder(gluon.HybridBlock):
+        def hybrid_forward(self, F, inputs, states):  # pylint: disable=arguments-differ
+            # EOS is much more likely than the other words, so all beams finish at step 2
+            logits = F.one_hot(F.ones_like(inputs) * eos_id, depth=vocab_size) * 10
+            return logits.log_softmax(), states
+
+    decoder = _EOSDecoder()
+    decoder.hybridize()
+    inputs = mx.nd.full(shape=(batch_size,), val=1)
+    states = [mx.nd.zeros(shape=(batch_size, 8))]
+    expected_samples, expected_scores, expected_valid_length = \
+        [ele.asnumpy() for ele in model.BeamSearchSampler(
+            beam_size=beam_size, decoder=decoder, eos_id=eos_id,
+            max_length=max_length)(inputs, states)]
+    samples, scores, valid_length = [ele.asnumpy() for ele in model.HybridBeamSearchSampler(
+        batch_size=batch_size, beam_size=beam_size, decoder=decoder, eos_id=eos_id,
+        max_length=max_length, vocab_size=vocab_size)(inputs, states)]
+    assert expected_valid_length.max() < max_length
+    assert_allclose(scores, expected_scores, 1E-5, 1E-5)
+    assert_allclose(valid_length, expected_valid_length)
+    for i in range(batch_size):
+        for j in range(beam_size):
+            assert_allclose(samples[i, j, :valid_length[i, j]],
+                            expected_samples[i, j, :valid_length[i, j]])
+            assert (samples[i, j, valid_length[i, j]:] == -1).all()
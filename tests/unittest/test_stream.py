@@ -21,6 +21,7 @@ from __future__ import print_function
 
 import itertools
 import os
+import numpy as np
 import pytest
 import gluonnlp as nlp
 
@@ -138,3 +139,39 @@ def test_dataset_stream_sampler():
             assert len(c) not in lengths
             lengths.append(len(c))
     assert len(lengths) == 3
+
+
+def _write_corpus_files(tmpdir, num_files=4, num_sentences=20):
+    rng = np.random.RandomState(0)
+    for file_idx in range(num_files):
+        with open(os.path.join(str(tmpdir), 'corpus{}.txt'.format(file_idx)), 'w') as f:
+            for sentence_idx in range(num_sentences):
+                words = ['w{}'.format(rng.randint(10)) for _ in range(rng.randint(1, 8))]
+                f.write(' '.join(['f{}s{}'.format(file_idx, sentence_idx)] + words) + '\n')
+    return os.path.join(str(tmpdir), 'corpus*.txt')
+
+
+@pytest.mark.parametrize('worker_type', [None, 'thread', 'process'])
+def test_dataset_stream_state_dict(tmpdir, worker_type):
+    file_pattern = _write_corpus_files(tmpdir)
+
+    def get_stream():
+        stream = nlp.data.SimpleDatasetStream(nlp.data.CorpusDataset, file_pattern)
+        if worker_type is not None:
+            stream = nlp.data.PrefetchingStream(stream, num_prefetch=2, worker_type=worker_type)
+        return stream
+
+    np.random.seed(0)
+    expected = [dataset[0][0] for dataset in get_stream()]
+    np.random.seed(0)
+    stream = get_stream()
+    stream_iter = iter(stream)
+    consumed = [next(stream_iter)[0][0] for _ in range(2)]
+    state = stream.state_dict()
+    np.random.seed(1)
+    resumed = get_stream()
+    resumed.load_state_dict(state)
+    assert consumed + [dataset[0][0] for dataset in resumed] == expected
+    # A completed iteration resumes at a new epoch
+    resumed.load_state_dict(resumed.state_dict())
+    assert sorted(dataset[0][0] for dataset in resumed) == sorted(expected)
@@ -20,6 +20,7 @@
 from __future__ import print_function
 
 import os
+import pickle
 import sys
 import warnings
 import numpy as np
@@ -134,6 +135,7 @@ def test_sentencepiece_tokenizer():
     assert all(t in tokenizer.tokens for t in ret)
     assert len(ret) > 0
     assert text == detext
+    assert tokenizer.batch([text] * 3, num_workers=2, chunk_size=2) == [ret] * 3
 
 
 @pytest.mark.remote_required
@@ -199,6 +201,25 @@ def test_bertbasictokenizer():
         "HeLLo", "!", "how", "Are", "yoU", "?"]
 
 
+@pytest.mark.skipif(not t._WIDE_UNICODE, reason='The table is only used with wide unicode.')
+@pytest.mark.parametrize('lower', [True, False])
+def test_bertbasictokenizer_table(lower):
+    rng = np.random.RandomState(0)
+    # Mix ASCII, whitespace, controls, combining marks, Greek, CJK, surrogates and
+    # code points from all the planes.
+    pools = [np.arange(0, 128), np.array([0x85, 0xa0, 0x2000, 0x2028, 0x2029, 0x3000, 0xfffd]),
+             np.arange(0x300, 0x370), np.arange(0x370, 0x400), np.arange(0x3400, 0x3410),
+             np.arange(0x4e00, 0x4e10), np.arange(0xd800, 0xe000), np.arange(0xf900, 0xf910),
+             np.arange(0, 0x110000)]
+    tokenizer = t.BERTBasicTokenizer(lower=lower)
+    for _ in range(2000):
+        pool_ids = rng.randint(0, len(pools), size=rng.randint(0, 50))
+        text = u''.join(chr(rng.choice(pools[i])) for i in pool_ids)
+        assert tokenizer._tokenize(text) == tokenizer._tokenize_by_char(text)
+    assert tokenizer._tokenize(u'\u0391\u03a3 \u0391\u03a3\u0391.') == \
+        tokenizer._tokenize_by_char(u'\u0391\u03a3 \u0391\u03a3\u0391.')
+
+
 def test_berttokenizer():
 
     # test WordpieceTokenizer
@@ -226,6 +247,63 @@ def test_berttokenizer():
     assert tokens == ["un", "##want", "##ed", ",", "runn", "##ing"]
 
 
+def test_berttokenizer_wordpiece_trie():
+    def _naive_wordpiece(vocab, token):
+        start, sub_tokens = 0, []
+        while start < len(token):
+            end = len(token)
+            while end > start:
+                substr = token[start:end] if start == 0 else '##' + token[start:end]
+                if substr in vocab:
+                    break
+                end -= 1
+            if end == start:
+                return [vocab.unknown_token]
+            sub_tokens.append(substr)
+            start = end
+        return sub_tokens
+
+    rng = np.random.RandomState(0)
+    chars = list(u'abcd\u00e9\u4e2d')
+    vocab_tokens = set()
+    for _ in range(100):
+        piece = u''.join(rng.choice(chars, size=rng.randint(1, 4)))
+        vocab_tokens.add(piece if rng.rand() < 0.5 else u'##' + piece)
+    vocab_tokens.add(u'##')
+    vocab = Vocab(count_tokens(sorted(vocab_tokens)), unknown_token='[UNK]', padding_token=None,
+                  bos_token=None, eos_token=None)
+    words = [u''.join(rng.choice(chars, size=rng.randint(1, 12))) for _ in range(500)]
+    for cache_size in [0, 10, 1000]:
+        tokenizer = t.BERTTokenizer(vocab=vocab, lower=False, max_input_chars_per_word=10,
+                                    cache_size=cache_size)
+        for word in words + words:
+            expected = _naive_wordpiece(vocab, word) if len(word) <= 10 else ['[UNK]']
+            assert tokenizer._tokenize_wordpiece(word) == expected
+        assert len(tokenizer._cache) <= cache_size
+    sentences = [u' '.join(words[i:i + 10]) for i in range(0, len(words), 10)]
+    assert tokenizer.batch(sentences) == [tokenizer(sentence) for sentence in sentences]
+    tokenizer = pickle.loads(pickle.dumps(tokenizer))
+    assert tokenizer.batch(sentences[:3]) == [tokenizer(sentence) for sentence in sentences[:3]]
+
+
+@pytest.mark.parametrize('num_workers', [0, 2])
+def test_tokenizer_batch(num_workers):
+    vocab_tokens = ["want", "##want", "##ed", "wa", "un", "runn", "##ing", ","]
+    vocab = Vocab(count_tokens(vocab_tokens), unknown_token="[UNK]", padding_token=None,
+                  bos_token=None, eos_token=None)
+    tokenizer = t.BERTTokenizer(vocab=vocab)
+    words = [u'unwanted', u'running', u'UNwant\u00E9d,', u'wa', u'foo']
+    samples = [u' '.join(words[i % 5:]) for i in range(23)]
+    expected = [tokenizer(sample) for sample in samples]
+    assert tokenizer.batch(samples, num_workers=num_workers, chunk_size=4) == expected
+    # Lazily tokenize a stream
+    ret = tokenizer.iter_batch((sample for sample in samples), num_workers=num_workers,
+                               chunk_size=3)
+    assert next(ret) == expected[0]
+    assert list(ret) == expected[1:]
+    assert tokenizer.batch([], num_workers=num_workers) == []
+
+
 def test_bert_sentences_transform():
     text_a = u'is this jacksonville ?'
     text_b = u'no it is not'
@@ -24,6 +24,7 @@ import re
 import os
 import sys
 import functools
+import pickle
 
 import pytest
 
@@ -80,6 +81,90 @@ def test_count_tokens():
     _test_count_tokens('IS', 'LIFE')
 
 
+@pytest.mark.parametrize('num_workers', [0, 3])
+@pytest.mark.parametrize('min_freq', [1, 3])
+@pytest.mark.parametrize('sketch_width', [0, 64])
+def test_count_tokens_parallel(tmpdir, num_workers, min_freq, sketch_width):
+    rng = np.random.RandomState(0)
+    files = []
+    for file_idx in range(5):
+        files.append(os.path.join(str(tmpdir), 'corpus{}.txt'.format(file_idx)))
+        with open(files[-1], 'w') as f:
+            for _ in range(20):
+                f.write(' '.join('W{}'.format(int(rng.zipf(1.5)) % 100)
+                                 for _ in range(rng.randint(1, 10))) + '\n')
+    datasets = [nlp.data.CorpusDataset(filename) for filename in files]
+    expected = nlp.data.count_tokens(
+        nlp.data.utils.concat_sequence(nlp.data.utils.concat_sequence(datasets)), to_lower=True)
+    expected = nlp.data.Counter({t: c for t, c in expected.items() if c >= min_freq})
+    counter = nlp.data.count_tokens_parallel(files, num_workers=num_workers,
+                                             dataset_fn=nlp.data.CorpusDataset, to_lower=True,
+                                             min_freq=min_freq, sketch_width=sketch_width)
+    assert counter == expected
+    assert nlp.data.count_tokens_parallel(datasets, num_workers=num_workers, to_lower=True,
+                                          min_freq=min_freq) == expected
+    flat_datasets = [nlp.data.CorpusDataset(filename, flatten=True) for filename in files]
+    assert nlp.data.count_tokens_parallel(flat_datasets, num_workers=num_workers, to_lower=True,
+                                          min_freq=min_freq) == expected
+    assert nlp.data.count_tokens_parallel([], num_workers=num_workers) == nlp.data.Counter()
+    # The counter keeps the tokens indexed by a Vocab with the same max_size
+    counter = nlp.data.count_tokens_parallel(files, num_workers=num_workers,
+                                             dataset_fn=nlp.data.CorpusDataset, to_lower=True,
+                                             min_freq=min_freq, max_size=5,
+                                             sketch_width=sketch_width)
+    vocab = nlp.Vocab(expected, max_size=5, min_freq=min_freq, unknown_token=None,
+                      padding_token=None, bos_token=None, eos_token=None)
+    assert len(counter) == min(5, len(expected))
+    assert sorted(counter) == sorted(vocab.idx_to_token)
+    assert all(counter[token] == expected[token] for token in counter)
+
+
+@pytest.mark.parametrize('max_size', [None, 1, 3, 100])
+@pytest.mark.parametrize('min_freq', [1, 2])
+def test_vocabulary_frequency_order(max_size, min_freq):
+    counter = nlp.data.utils.Counter(['c', 'a', 'b', 'b', '<unk>', '<unk>', 'd', 'd', 'd'])
+    vocab = nlp.Vocab(counter, max_size=max_size, min_freq=min_freq, unknown_token='<unk>',
+                      padding_token=None, bos_token=None, eos_token=None)
+    expected = [t for t in ['d', 'b', 'a', 'c'] if counter[t] >= min_freq][:max_size]
+    assert vocab.idx_to_token == ['<unk>'] + expected
+
+
+@pytest.mark.parametrize('unknown_token', ['<unk>', None])
+def test_vocabulary_array_lookup(unknown_token):
+    counter = nlp.data.utils.Counter(['a', 'b', 'b', 'c', 'c', 'c', 'some_word$'])
+    vocab = nlp.Vocab(counter, unknown_token=unknown_token)
+    tokens = ['c', 'a', 'some_word$', 'c', 'b']
+    indices = vocab.to_index_array(tokens)
+    assert indices.dtype == np.int32
+    assert indices.tolist() == vocab[tokens]
+    assert vocab.to_index_array(tokens, dtype='int64').dtype == np.int64
+    assert vocab.to_index_array([]).shape == (0,)
+    token_array = np.array([tokens, tokens[::-1]])
+    assert vocab.to_index_array(token_array).tolist() == [vocab[tokens], vocab[tokens[::-1]]]
+    assert vocab.to_token_array(indices).tolist() == tokens
+    assert vocab.to_token_array(vocab.to_index_array(token_array)).tolist() == \
+        token_array.tolist()
+    assert vocab.to_token_array([]).shape == (0,)
+    with pytest.raises(ValueError):
+        vocab.to_token_array([len(vocab)])
+    with pytest.raises(ValueError):
+        vocab.to_token_array([-1])
+    sentences = [['a', 'b'], [], ['c', 'c', 'some_word$']]
+    assert [a.tolist() for a in vocab.to_index_arrays(sentences)] == \
+        [vocab[sentence] for sentence in sentences]
+    assert vocab.to_index_arrays([]) == []
+    if unknown_token:
+        assert vocab.to_index_array(['a', 'non-exist']).tolist() == [vocab['a'], 0]
+        assert vocab.to_index_array(np.array(['a', 'non-exist'])).tolist() == [vocab['a'], 0]
+    else:
+        with pytest.raises(KeyError):
+            vocab.to_index_array(['a', 'non-exist'])
+    bert_vocab = nlp.vocab.BERTVocab(counter)
+    assert bert_vocab.to_index_array(tokens).tolist() == bert_vocab[tokens]
+    json_vocab = nlp.Vocab.from_json(vocab.to_json())
+    assert json_vocab.to_token_array(indices).tolist() == tokens
+
+
 def test_vocabulary_getitem():
     counter = nlp.data.utils.Counter(['a', 'b', 'b', 'c', 'c', 'c', 'some_word$'])
 
@@ -461,6 +546,80 @@ def test_token_embedding_from_file(tmpdir, allow_extend):
         from_file(pretrain_file_path, elem_delim)
 
 
+def test_token_embedding_batched_unknown_lookup():
+    class CountingLookup(object):
+        def __init__(self):
+            self.num_calls = 0
+
+        def __contains__(self, token):
+            return token.startswith('known')
+
+        def __getitem__(self, tokens):
+            self.num_calls += 1
+            return nd.array([[float(len(token))] * 3 for token in tokens])
+
+    lookup = CountingLookup()
+    emb = nlp.embedding.TokenEmbedding(unknown_lookup=lookup, allow_extend=True)
+    emb[['<unk>', 'a', 'b']] = nd.array([[0, 0, 0], [1, 1, 1], [2, 2, 2]])
+    lookup.num_calls = 0
+
+    vecs = emb[['b', 'known1', 'missing', 'a', 'known_22']]
+    assert lookup.num_calls == 1
+    assert_almost_equal(vecs.asnumpy(), np.array([[2] * 3, [6] * 3, [0] * 3, [1] * 3, [8] * 3]))
+    assert_almost_equal(emb['known1'].asnumpy(), np.array([6] * 3))
+    assert_almost_equal(emb['a'].asnumpy(), np.array([1] * 3))
+
+
+def test_token_embedding_from_file_chunked_and_cached(tmpdir):
+    lines = ['3 5'] + ['{} {}'.format(token, ' '.join(str(i + j * 0.1) for j in range(5)))
+                       for i, token in enumerate(['a', 'b', '<unk>', 'a', 'c'])]
+    file_path = os.path.join(str(tmpdir), 'my_pretrain_file.vec')
+    with open(file_path, 'w') as fout:
+        fout.write('\n'.join(lines) + '\n')
+
+    expected_vecs = np.array([[2 + j * 0.1 for j in range(5)], [j * 0.1 for j in range(5)],
+                              [1 + j * 0.1 for j in range(5)], [4 + j * 0.1 for j in range(5)]])
+    min_chunk_size = nlp.embedding.token_embedding._MIN_TXT_CHUNK_SIZE
+    nlp.embedding.token_embedding._MIN_TXT_CHUNK_SIZE = 8
+    try:
+        for num_workers in [1, 2]:
+            with pytest.warns(UserWarning):
+                my_embed = nlp.embedding.TokenEmbedding.from_file(file_path,
+                                                                  num_workers=num_workers)
+            assert my_embed.idx_to_token == ['<unk>', 'a', 'b', 'c']
+            assert_almost_equal(my_embed.idx_to_vec.asnumpy(), expected_vecs)
+    finally:
+        nlp.embedding.token_embedding._MIN_TXT_CHUNK_SIZE = min_chunk_size
+
+    # Malformed vector elements are reported with their line
+    bad_file_path = os.path.join(str(tmpdir), 'my_bad_pretrain_file.vec')
+    with open(bad_file_path, 'w') as fout:
+        fout.write('\n'.join(lines[:4] + ['d 0 0 x 0 0'] + lines[4:]) + '\n')
+    nlp.embedding.token_embedding._MIN_TXT_CHUNK_SIZE = 8
+    try:
+        for num_workers in [1, 2]:
+            with pytest.raises(ValueError, match='line 4 in .*my_bad_pretrain_file.vec'):
+                nlp.embedding.TokenEmbedding.from_file(bad_file_path, num_workers=num_workers)
+    finally:
+        nlp.embedding.token_embedding._MIN_TXT_CHUNK_SIZE = min_chunk_size
+    with pytest.raises(ValueError, match='line 4 in'):
+        nlp.embedding.TokenEmbedding.from_file(bad_file_path)
+
+    my_embed = nlp.embedding.TokenEmbedding.from_file(file_path, cache=True)
+    assert os.path.isfile(file_path + '.cache.npz')
+    cached_embed = nlp.embedding.TokenEmbedding.from_file(file_path, cache=True)
+    assert cached_embed == my_embed
+    cached_embed = nlp.embedding.TokenEmbedding.from_file(file_path, cache=True,
+                                                          unknown_token=None)
+    assert cached_embed.idx_to_token == ['a', 'b', '<unk>', 'c']
+
+    # The cache is invalidated when the file changes
+    with open(file_path, 'a') as fout:
+        fout.write('d 0 0 0 0 0\n')
+    my_embed = nlp.embedding.TokenEmbedding.from_file(file_path, cache=True)
+    assert my_embed.idx_to_token == ['<unk>', 'a', 'b', 'c', 'd']
+
+
 def test_embedding_get_and_pretrain_file_names():
     assert len(nlp.embedding.list_sources(embedding_name='fasttext')) == 486
     assert len(nlp.embedding.list_sources(embedding_name='glove')) == 10
@@ -1076,6 +1235,131 @@ def test_token_embedding_serialization():
     assert loaded_emb == emb
 
 
+def test_token_embedding_mmap_deserialization(tmpdir):
+    idx_to_token = ['<unk>', 'hello', 'world', 'bye']
+    idx_to_vec = nd.array(np.random.uniform(size=(4, 5)))
+    emb = nlp.embedding.TokenEmbedding(unknown_token='<unk>', allow_extend=True)
+    emb[idx_to_token] = idx_to_vec
+
+    file_path = os.path.join(str(tmpdir), 'embeddings.npz')
+    emb.serialize(file_path, compress=False)
+    loaded_emb = nlp.embedding.TokenEmbedding.deserialize(file_path, mmap=True)
+    assert loaded_emb.idx_to_token == idx_to_token
+    assert_almost_equal(loaded_emb[['world', 'hello', 'unseen']].asnumpy(),
+                        idx_to_vec[[2, 1, 0]].asnumpy())
+    assert_almost_equal(loaded_emb['bye'].asnumpy(), idx_to_vec[3].asnumpy())
+    # Lookups only read the requested rows
+    assert loaded_emb._idx_to_vec is None
+
+    serialized_path = os.path.join(str(tmpdir), 'reserialized.npz')
+    loaded_emb.serialize(serialized_path)
+    assert nlp.embedding.TokenEmbedding.deserialize(serialized_path) == emb
+
+    assert_almost_equal(loaded_emb.idx_to_vec.asnumpy(), idx_to_vec.asnumpy())
+    assert loaded_emb == emb
+    loaded_emb['hello'] = nd.zeros((5, ))
+    assert_almost_equal(loaded_emb['hello'].asnumpy(), np.zeros((5, )))
+
+    compressed_path = os.path.join(str(tmpdir), 'embeddings_compressed.npz')
+    emb.serialize(compressed_path, compress=True)
+    with pytest.raises(ValueError):
+        nlp.embedding.TokenEmbedding.deserialize(compressed_path, mmap=True)
+
+
+@pytest.mark.parametrize('num_lists', [None, 8])
+def test_embedding_index(num_lists):
+    vecs = np.random.normal(size=(500, 10)).astype(np.float32)
+    queries = np.random.normal(size=(20, 10)).astype(np.float32)
+    normalized = vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+    similarities = queries.dot(normalized.T) / np.linalg.norm(queries, axis=1, keepdims=True)
+    expected = np.argsort(-similarities, axis=1)
+
+    # Search all lists of the approximate index to make it exact
+    index = nlp.embedding.EmbeddingIndex(nd.array(vecs), num_lists=num_lists, num_probes=8,
+                                         block_size=1000)
+    assert index.approximate == bool(num_lists)
+    scores, indices = index.search(queries, k=5, exclude=[[i] for i in expected[:, 0]])
+    assert (indices == expected[:, 1:6]).all()
+    assert_almost_equal(scores, np.take_along_axis(similarities, expected[:, 1:6], axis=1),
+                        rtol=1e-4, atol=1e-5)
+
+    scores, indices = index.search(queries[:1], k=501)
+    assert indices[0, -1] == -1 and scores[0, -1] == -np.inf
+    assert sorted(indices[0, :-1].tolist()) == list(range(500))
+
+
+def test_token_embedding_most_similar_and_analogy():
+    idx_to_token = ['<unk>', 'a', 'b', 'c', 'd', 'e']
+    idx_to_vec = nd.array([[0, 0, 0], [1, 0, 0], [0.9, 0.1, 0], [0, 1, 0], [0.1, 0.9, 0.4],
+                           [-1, -0.1, 0.1]])
+    emb = nlp.embedding.TokenEmbedding(unknown_token='<unk>', allow_extend=True)
+    emb[idx_to_token] = idx_to_vec
+
+    neighbors = emb.most_similar('a', k=2)
+    assert [token for token, _ in neighbors] == ['b', 'd']
+    assert_almost_equal(neighbors[0][1], 0.9 / np.sqrt(0.82), rtol=1e-5)
+    neighbors = emb.most_similar(['a', 'c'], k=10)
+    assert [token for token, _ in neighbors[0]] == ['b', 'd', 'c', 'e']
+    assert [token for token, _ in neighbors[1]] == ['d', 'b', 'a', 'e']
+
+    normalized = idx_to_vec.asnumpy()
+    normalized[1:] /= np.linalg.norm(normalized[1:], axis=1, keepdims=True)
+    questions = [('a', 'b', 'c'), ('c', 'd', 'a'), ('b', 'a', 'e')]
+    answers = emb.analogy(*[list(q) for q in zip(*questions)], k=2)
+    for question, answer in zip(questions, answers):
+        a, b, c = [emb.token_to_idx[token] for token in question]
+        scores = normalized.dot(normalized[b] - normalized[a] + normalized[c])
+        scores[[0, a, b, c]] = -np.inf
+        assert [token for token, _ in answer] == [idx_to_token[i] for i in np.argsort(-scores)[:2]]
+    assert emb.analogy('a', 'b', 'c', k=1) == answers[0][:1]
+
+    # Updating vectors discards the index
+    emb.build_index(num_lists=2, num_probes=2)
+    emb['e'] = nd.array([1, 0.05, 0])
+    assert emb.most_similar('a', k=1)[0][0] == 'e'
+
+    with pytest.raises(ValueError):
+        emb.analogy(['a'], ['b', 'c'], ['d'])
+
+
+@pytest.mark.parametrize('method,kwargs,max_error,min_compression', [
+    ('int8', {}, 0.05, 3.5), ('pq', {'num_centroids': 16}, 0.7, 10)])
+def test_token_embedding_quantization(tmpdir, method, kwargs, max_error, min_compression):
+    idx_to_token = ['<unk>'] + ['token{}'.format(i) for i in range(1, 1000)]
+    idx_to_vec = np.random.normal(size=(1000, 32)).astype(np.float32)
+    idx_to_vec[0] = 0
+    emb = nlp.embedding.TokenEmbedding(unknown_token='<unk>', allow_extend=True)
+    emb[idx_to_token] = nd.array(idx_to_vec)
+
+    dataset = [(idx_to_token[i], idx_to_token[i + 1], float(np.random.uniform()))
+               for i in range(1, 50)] + [('token1', 'unseen', 1.0)]
+    report = emb.quantize(method, similarity_datasets={'test': dataset}, **kwargs)
+    assert report['method'] == method
+    assert report['compression_ratio'] > min_compression
+    assert report['mse'] < max_error ** 2
+    assert 0.8 < report['mean_cosine_similarity'] <= 1 + 1e-5
+    similarity = report['similarity']['test']
+    assert similarity['num_pairs'] == 49
+    assert_almost_equal(similarity['delta'], similarity['quantized'] - similarity['dense'])
+
+    # Lookups dequantize rows
+    assert emb._idx_to_vec is None
+    vecs = emb[['token3', 'unseen']].asnumpy()
+    assert np.abs(vecs - idx_to_vec[[3, 0]]).max() < 3 * max_error
+
+    file_path = os.path.join(str(tmpdir), 'embeddings.npz')
+    emb.serialize(file_path, compress=False)
+    for mmap in [False, True]:
+        loaded_emb = nlp.embedding.TokenEmbedding.deserialize(file_path, mmap=mmap)
+        assert_almost_equal(loaded_emb[['token3', 'unseen']].asnumpy(), vecs)
+        assert loaded_emb._idx_to_vec is None
+    assert loaded_emb == emb
+    assert_almost_equal(emb.idx_to_vec.asnumpy()[3], vecs[0])
+
+    with pytest.raises(ValueError):
+        emb.quantize('invalid')
+
+
 def test_word_embedding_evaluation_registry():
     with pytest.raises(RuntimeError):
 
@@ -1199,3 +1483,105 @@ def test_subword_function_ngramhashes():
     assert 1669484008 % num_subwords == next(iter(sf.subwords_to_indices(['<te'])))
     assert 1669484008 % num_subwords == next(iter(sf.subwords_to_indices([u'<te'])))
     assert 2688791429 % num_subwords == next(iter(sf.subwords_to_indices([u'<τε'])))
+
+
+@pytest.mark.parametrize('name,kwargs', [
+    ('ByteSubwords', {}),
+    ('NGramHashes', dict(num_subwords=1000, special_tokens=set([u'<special>']))),
+    ('NGramHashes', dict(num_subwords=7, ngrams=[1, 2, 6])),
+])
+def test_subword_function_packed_indices(name, kwargs):
+    words = [u'test', u'', u'τεστ', u'<special>', u'a', u'世界😀', u'test']
+    sf = nlp.vocab.create_subword_function(name, **kwargs)
+    indices, indptr = sf.packed_indices(words)
+    assert indices.dtype == np.int64 and indptr.dtype == np.int64
+    assert len(indptr) == len(words) + 1
+    expected = nlp.vocab.SubwordFunction.packed_indices(sf, words)
+    assert indices.tolist() == expected[0].tolist()
+    assert indptr.tolist() == expected[1].tolist()
+    assert [indices[start:end].tolist() for start, end in zip(indptr[:-1], indptr[1:])] == \
+        [list(subwords) for subwords in sf(words)]
+
+    empty_indices, empty_indptr = sf.packed_indices([])
+    assert not len(empty_indices)
+    assert empty_indptr.tolist() == [0]
+
+
+@pytest.mark.parametrize('ngrams', [[3, 4, 5, 6], [1, 3], [6, 2, 2]])
+def test_subword_function_ngramhashes_packed_kernels(ngrams):
+    from gluonnlp.vocab.subwords import (_fasttext_ngram_hashes, _fasttext_ngram_hashes_packed,
+                                         _fasttext_ngram_hashes_packed_numpy, _pack_words)
+    words = [u'<{}>'.format(word) for word in
+             [u'hello', u'', u'τεστ', u'x', u'abcdefghij', u'世界😀', u'é']]
+    ns = np.asarray(ngrams)
+    data, offsets = _pack_words(words)
+    expected = [list(_fasttext_ngram_hashes(memoryview(bytearray(word.encode('utf-8'))),
+                                            ns=ns, bucket_size=2000000))
+                for word in words]
+    for kernel in [_fasttext_ngram_hashes_packed, _fasttext_ngram_hashes_packed_numpy]:
+        indices, indptr = kernel(data, offsets, ns, 2000000)
+        assert [indices[start:end].tolist()
+                for start, end in zip(indptr[:-1], indptr[1:])] == expected
+
+
+def test_subword_function_ngramhashes_cache():
+    words = [u'test', u'τεστ', u'hello', u'test']
+    uncached = nlp.vocab.create_subword_function('NGramHashes', num_subwords=1000,
+                                                 cache_size=0)
+    cached = nlp.vocab.create_subword_function('NGramHashes', num_subwords=1000,
+                                               cache_size=2)
+    expected = uncached(words)
+    assert cached(words) == expected
+    assert cached(words[::-1]) == expected[::-1]
+    assert list(cached._cache.keys()) == [u'τεστ', u'test']
+    assert not uncached._cache
+    assert not pickle.loads(pickle.dumps(cached))._cache
+
+
+@pytest.mark.parametrize('unknown_token', ['<unk>', None])
+@pytest.mark.parametrize('vocab_cls', [nlp.Vocab, nlp.vocab.BERTVocab])
+def test_vocab_binary_serialization(tmpdir, unknown_token, vocab_cls):
+    counter = nlp.data.utils.Counter(['a', 'b', 'b', 'c', 'c', 'c', 'some_word$', u'été'])
+    vocab = vocab_cls(counter, unknown_token=unknown_token)
+    filename = os.path.join(str(tmpdir), 'vocab.bin')
+    vocab.save_binary(filename)
+    loaded = vocab_cls.load_binary(filename)
+    assert isinstance(loaded, vocab_cls)
+    assert len(loaded) == len(vocab)
+    assert loaded.idx_to_token == vocab.idx_to_token
+    assert loaded.idx_to_token[-1] == vocab.idx_to_token[-1]
+    assert dict(loaded.token_to_idx) == dict(vocab.token_to_idx)
+    assert loaded.to_json() == vocab.to_json()
+    tokens = list(counter.keys())
+    assert loaded[tokens] == vocab[tokens]
+    assert loaded.to_index_array(tokens).tolist() == vocab[tokens]
+    assert loaded.to_tokens(vocab[tokens]) == tokens
+    assert 'a' in loaded and 'non-exist' not in loaded
+    if unknown_token:
+        assert loaded['non-exist'] == vocab['non-exist']
+    else:
+        with pytest.raises(KeyError):
+            loaded['non-exist']
+    loaded = pickle.loads(pickle.dumps(loaded))
+    assert loaded[tokens] == vocab[tokens]
+    assert loaded.to_json() == vocab.to_json()
+
+    with pytest.raises(ValueError):
+        vocab_cls.load_binary(os.path.join(os.path.dirname(__file__), 'test_vocab_embed.py'))
+    with pytest.raises(ValueError):
+        nlp.Vocab(nlp.data.utils.Counter([1, 2])).save_binary(filename)
+
+
+def test_load_vocab_file_cache(tmpdir):
+    vocab = nlp.Vocab(nlp.data.utils.Counter(['a', 'b', 'b']))
+    filename = os.path.join(str(tmpdir), 'test.vocab')
+    with open(filename, 'w') as f:
+        f.write(vocab.to_json())
+    loaded = nlp.data.utils._load_vocab_file(filename, None)
+    assert loaded.to_json() == vocab.to_json()
+    assert os.path.exists(filename + '.bin')
+    assert nlp.data.utils._load_vocab_file(filename, None) is loaded
+    nlp.data.utils._vocab_cache.clear()
+    loaded = nlp.data.utils._load_vocab_file(filename, None)
+    assert loaded.to_json() == vocab.to_json()
+    assert nlp.data.utils._load_vocab_file(filename, nlp.vocab.BERTVocab) is not loaded
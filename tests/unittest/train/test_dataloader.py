@@ -40,6 +40,39 @@ def test_sharded_data_loader():
                                                           Y[(i*num_shards+j)*2-num_shards:
                                                             (i*num_shards+j+1)*2-num_shards])
 
+def _numpy_batchify(data):
+    return [np.stack([ele[0] for ele in data]), np.array([ele[1] for ele in data]), 'tag']
+
+
+def test_sharded_data_loader_shared_memory():
+    X = np.random.uniform(size=(100, 20)).astype(np.float32)
+    Y = np.random.randint(0, 10, size=(100,)).astype(np.int32)
+    dataset = gluon.data.ArrayDataset(X, Y)
+
+    num_shards = 2
+    batch_sampler = FixedBucketSampler(lengths=[X.shape[1]] * X.shape[0], batch_size=4,
+                                       num_buckets=1, shuffle=False, num_shards=num_shards)
+    for batchify_fn in [None, _numpy_batchify]:
+        # The second slab size is too small for the batches, which are then pickled.
+        for slab_size in [1 << 16, 64]:
+            loader = ShardedDataLoader(dataset, batch_sampler=batch_sampler, num_workers=2,
+                                       batchify_fn=batchify_fn, shared_mem_slab_size=slab_size)
+            batches = list(loader)
+            assert len(batches) == len(batch_sampler)
+            for i, (seqs, sample_ids) in enumerate(zip(batches, batch_sampler)):
+                for j in range(num_shards):
+                    x, y = seqs[j][0], seqs[j][1]
+                    if batchify_fn is None:
+                        x, y = x.asnumpy(), y.asnumpy()
+                    else:
+                        assert isinstance(x, np.ndarray) and seqs[j][2] == 'tag'
+                    assert mx.test_utils.almost_equal(x, X[sample_ids[j]])
+                    assert mx.test_utils.almost_equal(y, Y[sample_ids[j]])
+            # All the slabs are free again once the batches are released
+            del batches, seqs, x, y
+            assert len(loader._slabs._free) == len(loader._slabs._slabs)
+
+
 @pytest.mark.remote_required
 def test_sharded_data_loader_record_file():
     if not hasattr(mx.recordio.MXRecordIO, '_check_pid'):
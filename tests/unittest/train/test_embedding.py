@@ -76,6 +76,41 @@ def test_fasttext_embedding(sparse_grad, hybridize):
     assert_allclose(emb.asnumpy(), emb2.asnumpy())
 
 
+def test_fasttext_embedding_getitem():
+    token_to_idx = dict(hello=0, world=1)
+    # Few subwords to ensure hash collisions within words
+    subword_function = nlp.vocab.create_subword_function(
+        'NGramHashes', ngrams=[3, 4, 5, 6], num_subwords=7)
+    embedding = nlp.model.train.FasttextEmbeddingModel(
+        token_to_idx, subword_function, 10)
+    embedding.initialize()
+    weight = embedding.weight.data().asnumpy()
+
+    tokens = ['hello', 'unknown', 'world', 'x']
+    expected = []
+    for token, subwords in zip(tokens, subword_function(tokens)):
+        rows = [token_to_idx[token]] if token in token_to_idx else []
+        rows += [len(token_to_idx) + s for s in subwords]
+        expected.append(weight[rows].mean(axis=0))
+    assert_allclose(embedding[tokens].asnumpy(), np.stack(expected), rtol=1e-5)
+    assert_allclose(embedding['unknown'].asnumpy(), expected[1], rtol=1e-5)
+
+    # The subwords of repeated tokens are looked up in the cache of the subword function
+    assert 'unknown' in subword_function._cache
+    packed_indices = subword_function.packed_indices
+    hashed = []
+    subword_function.packed_indices = lambda words: hashed.extend(words) or packed_indices(words)
+    assert_allclose(embedding[['unknown', 'hello', 'unknown', 'new']].asnumpy(),
+                    np.stack(expected[1:2] + expected[:2] + [embedding['new'].asnumpy()]),
+                    rtol=1e-5)
+    assert hashed == ['new']
+
+    embedding._subword_function.special_tokens.add('<special>')
+    assert '<special>' not in embedding
+    with pytest.raises(KeyError):
+        embedding[['hello', '<special>']]
+
+
 def test_fasttext_embedding_load_binary_compare_vec():
     test_dir = os.path.dirname(os.path.realpath(__file__))
     token_embedding_vec = nlp.embedding.TokenEmbedding.from_file(